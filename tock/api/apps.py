@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def seed_versions(sender, **kwargs):
+    from .models import seed_versions
+    seed_versions()
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa
+        # Models added after the initial seeding get their rows here.
+        post_migrate.connect(seed_versions, sender=self)
@@ -0,0 +1,92 @@
+"""
+Answers conditional GETs (If-None-Match / If-Modified-Since) from the
+per-model version counters in api.models.ModelVersion, so that an unchanged
+response costs one small query instead of the full query and serialization.
+"""
+import calendar
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import ModelVersion
+from .planner import lookup_models
+
+
+def queryset_lookups(queryset):
+    """ Return the select_related() and prefetch_related() lookups of
+    `queryset` as flat `a__b` strings. """
+    lookups = []
+
+    def walk(related, prefix):
+        for name, nested in related.items():
+            lookups.append(prefix + name)
+            walk(nested, prefix + name + '__')
+
+    if isinstance(queryset.query.select_related, dict):
+        walk(queryset.query.select_related, '')
+    for lookup in queryset._prefetch_related_lookups:
+        lookups.append(getattr(lookup, 'prefetch_through', lookup))
+    return lookups
+
+
+def validators(models, key):
+    """
+    Return the `(etag, last_modified)` validators for a response built
+    from `models` and varying by `key`; last_modified is None until one of
+    the models has changed.
+    """
+    labels = sorted(model._meta.label_lower for model in models)
+    versions, modified = {}, None
+    for label, version, changed in ModelVersion.objects.filter(
+            label__in=labels).values_list('label', 'version', 'modified'):
+        versions[label] = version
+        modified = changed if modified is None else max(modified, changed)
+
+    state = json.dumps(
+        [key, [(label, versions.get(label, 0)) for label in labels]]
+    )
+    etag = hashlib.sha1(state.encode('utf-8')).hexdigest()
+    last_modified = None
+    if modified is not None:
+        last_modified = calendar.timegm(modified.utctimetuple())
+    return etag, last_modified
+
+
+class ConditionalResponseMixin(object):
+    """
+    Add ETag and Last-Modified headers to a read-only API view and return
+    304 Not Modified when the client's copy is current. The validators
+    change whenever a row of the view's model, or of a model it loads with
+    select_related()/prefetch_related(), is saved or deleted; list further
+    models the response depends on in `version_models`.
+    """
+    version_models = ()
+
+    def get_version_models(self):
+        queryset = self.get_queryset()
+        return lookup_models(queryset.model, queryset_lookups(queryset)) | \
+            set(self.version_models)
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = validators(
+            self.get_version_models(),
+            [
+                request.path,
+                sorted(request.query_params.lists()),
+                request.accepted_renderer.media_type,
+            ]
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super(ConditionalResponseMixin, self).get(
+                request, *args, **kwargs
+            )
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response['ETag'] = quote_etag(etag)
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
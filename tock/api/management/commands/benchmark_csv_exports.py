@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.renderers import stream_csv, stream_compiled_csv
+from api.views import get_timecards, TimecardList
+from hours.views import (
+    BulkTimecardSerializer,
+    SlimBulkTimecardSerializer,
+    AdminBulkTimecardSerializer,
+    GeneralSnippetsTimecardSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare rows per second of the serializer and compiled bulk ' \
+        'CSV exports against the current database.'
+
+    serializer_classes = (
+        BulkTimecardSerializer,
+        SlimBulkTimecardSerializer,
+        AdminBulkTimecardSerializer,
+        GeneralSnippetsTimecardSerializer,
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of runs per export; the fastest one is reported.'
+        )
+
+    def handle(self, *args, **options):
+        queryset = get_timecards(TimecardList.queryset)
+        rows = queryset.count()
+        self.stdout.write('Exporting {} rows.'.format(rows))
+
+        for serializer_class in self.serializer_classes:
+            exports = (
+                ('serializer', lambda: stream_csv(queryset, serializer_class())),
+                ('compiled', lambda: stream_compiled_csv(queryset, serializer_class)),
+            )
+            for label, export in exports:
+                elapsed = min(
+                    self.time_export(export) for _ in range(options['repeat'])
+                )
+                self.stdout.write('{:<36} {:<10} {:>12,.0f} rows/s'.format(
+                    serializer_class.__name__,
+                    label,
+                    rows / elapsed if elapsed else 0,
+                ))
+
+    def time_export(self, export):
+        start = time.perf_counter()
+        for _ in export().streaming_content:
+            pass
+        return time.perf_counter() - start
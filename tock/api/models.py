@@ -1,3 +1,64 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 
-# Create your models here.
+# Apps whose models the API serves; saving or deleting any of their rows
+# changes the validators of the responses that read them.
+VERSIONED_APP_LABELS = ('auth', 'employees', 'hours', 'projects')
+
+
+class ModelVersion(models.Model):
+    """A counter bumped whenever a row of the model named by `label` (e.g.
+    `hours.timecardobject`) is saved or deleted. The API uses it to answer
+    conditional requests without running the underlying query; see
+    api.conditional.validators()."""
+    label = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return '{} v{}'.format(self.label, self.version)
+
+    @classmethod
+    def bump(cls, label):
+        """Bump the version of `label` once the current transaction
+        commits, so that the shared row is only locked for the update
+        itself rather than until the commit of, say, a timecard submit.
+        The labels bumped in a transaction are collected, and bumped once
+        each, in one UPDATE, however many rows were saved. The rows are
+        created by seed_versions()."""
+        connection = transaction.get_connection()
+        # The pending labels are kept on the connection's commit callback
+        # itself: Django drops the callbacks of a savepoint that is rolled
+        # back, and the labels go with them.
+        for _, callback in connection.run_on_commit:
+            labels = getattr(callback, 'model_version_labels', None)
+            if labels is not None:
+                labels.add(label)
+                return
+
+        labels = {label}
+
+        def bump():
+            cls.objects.filter(label__in=labels).update(
+                version=F('version') + 1, modified=timezone.now()
+            )
+        bump.model_version_labels = labels
+        transaction.on_commit(bump)
+
+
+def seed_versions(model_version_model=ModelVersion):
+    """Create the missing ModelVersion rows of the models of
+    VERSIONED_APP_LABELS. The model can be swapped for its historical
+    version in migrations."""
+    labels = set(
+        model._meta.label_lower for model in apps.get_models()
+        if model._meta.app_label in VERSIONED_APP_LABELS
+    )
+    labels -= set(
+        model_version_model.objects.values_list('label', flat=True)
+    )
+    model_version_model.objects.bulk_create(
+        model_version_model(label=label) for label in sorted(labels)
+    )
@@ -0,0 +1,106 @@
+import base64
+import binascii
+import collections
+import datetime
+
+from django.db.models import F, Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TimecardCursorPagination(BasePagination):
+    """
+    Opt-in keyset pagination for TimecardObject querysets, ordered by
+    (reporting period start date, id).
+
+    Pagination only kicks in when the `cursor` query parameter is present;
+    pass an empty `cursor=` to fetch the first page. Each page is a single
+    indexed range scan, so the cost of fetching a page does not grow with
+    how deep into the results the client is.
+
+    The next page is linked both from the body and from a `Link` header,
+    for formats such as CSV and NDJSON that only write the rows.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 1000
+    max_page_size = 10000
+    ordering = ('timecard__reporting_period__start_date', 'id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        # Annotate the start date so the next cursor can be built without
+        # loading the reporting period, which may not be selected.
+        queryset = queryset.annotate(
+            cursor_start_date=F('timecard__reporting_period__start_date')
+        ).order_by(*self.ordering)
+        if position is not None:
+            start_date, pk = position
+            queryset = queryset.filter(
+                Q(timecard__reporting_period__start_date__gt=start_date) |
+                Q(timecard__reporting_period__start_date=start_date, id__gt=pk)
+            )
+
+        # Fetch one extra row to find out whether there is a next page.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def get_paginated_response(self, data):
+        next_link = self.get_next_link()
+        headers = {}
+        if next_link is not None:
+            headers['Link'] = '<{}>; rel="next"'.format(next_link)
+        return Response(collections.OrderedDict([
+            ('next', next_link),
+            ('results', data),
+        ]), headers=headers)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(last.cursor_start_date, last.id)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_cursor(self, start_date, pk):
+        position = '{}|{}'.format(start_date.isoformat(), pk)
+        return base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii')
+            start_date, pk = position.split('|')
+            start_date = datetime.datetime.strptime(
+                start_date, '%Y-%m-%d'
+            ).date()
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return start_date, pk
@@ -0,0 +1,84 @@
+"""
+Derives select_related()/prefetch_related() lookups from the `source` paths
+a serializer reads, so that every relation a serializer walks is loaded up
+front instead of once per row.
+"""
+import functools
+
+from django.core.exceptions import FieldDoesNotExist
+
+
+@functools.lru_cache(maxsize=None)
+def related_lookups(serializer_class, model):
+    """
+    Return `(select_related, prefetch_related)` lookup tuples for
+    serializing `model` instances with `serializer_class`.
+
+    Paths are taken from each field's `source`, from the lookups in the
+    serializer's `compiled_fields` (see api.compiled), and from an optional
+    `related_sources` tuple of dotted paths for relations reached through
+    methods or __str__.
+    """
+    overrides = getattr(serializer_class, 'compiled_fields', {})
+    paths = []
+    for name, field in serializer_class().fields.items():
+        if name in overrides:
+            paths.append(overrides[name][0].split('__'))
+        elif field.source != '*':
+            paths.append(field.source_attrs)
+    for source in getattr(serializer_class, 'related_sources', ()):
+        paths.append(source.split('.'))
+
+    select_related, prefetch_related = set(), set()
+    for attrs in paths:
+        current, lookup, single_valued = model, [], True
+        for attr in attrs:
+            try:
+                field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                break
+            if not field.is_relation:
+                break
+            lookup.append(attr)
+            if field.many_to_many or field.one_to_many:
+                single_valued = False
+            current = field.related_model
+        if lookup:
+            if single_valued:
+                select_related.add('__'.join(lookup))
+            else:
+                prefetch_related.add('__'.join(lookup))
+
+    return tuple(sorted(select_related)), tuple(sorted(prefetch_related))
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Apply the related lookups for `serializer` (a class or an instance) to
+    `queryset`. Note that prefetch_related() has no effect on querysets
+    consumed with .iterator().
+    """
+    if not isinstance(serializer, type):
+        serializer = type(serializer)
+    select_related, prefetch_related = related_lookups(
+        serializer, queryset.model
+    )
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+def lookup_models(model, lookups):
+    """
+    Return the set of models read when following each of `lookups` (in
+    select_related() syntax) from `model`, including `model` itself.
+    """
+    models = {model}
+    for lookup in lookups:
+        current = model
+        for attr in lookup.split('__'):
+            current = current._meta.get_field(attr).related_model
+            models.add(current)
+    return models
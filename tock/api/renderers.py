@@ -1,7 +1,15 @@
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
 from rest_framework_csv.renderers import CSVRenderer
 from django.http import StreamingHttpResponse
 
 import csv
+import itertools
+import json
+
+from .compiled import compile_serializer
+from .planner import plan_queryset
 
 class PaginatedCSVRenderer(CSVRenderer):
     """
@@ -22,16 +30,110 @@ class PaginatedCSVRenderer(CSVRenderer):
             self.header = data[0].keys()
         return super(PaginatedCSVRenderer, self).render(data, media_type, renderer_context)
 
+class StreamingJSONRenderer(BaseRenderer):
+    """
+    Renders a list of rows as a JSON array. Views that support streaming
+    (see TimecardList) check for this renderer and hand the queryset to
+    stream_json() instead, so the body is written one row at a time.
+    Select it with `?format=json-stream`.
+    """
+    media_type = 'application/json'
+    format = 'json-stream'
+    charset = None
+    ndjson = False
+    results_field = 'results'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return ''.join(generate_json(data, ndjson=self.ndjson)).encode('utf-8')
+
+class NDJSONRenderer(StreamingJSONRenderer):
+    """
+    Renders a list of rows as newline-delimited JSON, one object per line.
+    Select it with `Accept: application/x-ndjson` or `?format=ndjson`.
+    When paginated data is rendered, only the "results" list is written;
+    the next page is linked from the `Link` header.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    ndjson = True
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            data = data.get(self.results_field, [])
+        return super(NDJSONRenderer, self).render(
+            data, media_type, renderer_context
+        )
+
+def stream_json(queryset, serializer, ndjson=False):
+    """
+    Stream data as a JSON array (or newline-delimited JSON if `ndjson` is
+    True), given an iterable queryset and a DRF Serializer instance with a
+    .to_representation() method. Relations the serializer reads are joined
+    in up front.
+    """
+    queryset = plan_queryset(queryset, serializer)
+    rows = map(serializer.to_representation, queryset.iterator())
+    if ndjson:
+        content_type = NDJSONRenderer.media_type
+    else:
+        content_type = StreamingJSONRenderer.media_type
+    return StreamingHttpResponse(
+        generate_json(rows, ndjson=ndjson), content_type=content_type
+    )
+
+def generate_json(rows, ndjson=False):
+    """
+    This generator yields text for each encoded row. Rows are either
+    wrapped in a JSON array or, if `ndjson` is True, written one per line.
+    A dict (e.g. a paginated response) is encoded as a single document.
+    """
+    def dumps(value):
+        return json.dumps(
+            value,
+            cls=encoders.JSONEncoder,
+            ensure_ascii=not api_settings.UNICODE_JSON,
+            separators=(',', ':'),
+        )
+
+    if isinstance(rows, dict):
+        yield dumps(rows)
+        return
+
+    if ndjson:
+        for row in rows:
+            yield dumps(row) + '\n'
+        return
+
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + dumps(row)
+        separator = ','
+    yield ']'
+
 def stream_csv(queryset, serializer):
     """
     Stream data as CSV, given an interable queryset and a DRF
     Serializer instance with a .fields dict and .to_representation()
-    method.
+    method. Relations the serializer reads are joined in up front.
     """
+    queryset = plan_queryset(queryset, serializer)
     rows = map(serializer.to_representation, queryset.iterator())
     fields = list(serializer.fields.keys())
     return StreamingHttpResponse(generate_csv(rows, fields), content_type='text/csv')
 
+def stream_compiled_csv(queryset, serializer_class):
+    """
+    Stream data as CSV like stream_csv(), but through the compiled form of
+    `serializer_class` (see api.compiled): rows are fetched with
+    values_list() and converted without building model instances or
+    calling the serializer.
+    """
+    compiled = compile_serializer(serializer_class, queryset.model)
+    rows = map(compiled.to_row, compiled.values(queryset).iterator())
+    rows = itertools.chain([compiled.fields], rows)
+    return StreamingHttpResponse(generate_csv(rows), content_type='text/csv')
+
 class Echo(object):
     """
     A pseudo-buffer, see:
@@ -0,0 +1,29 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from hours.models import timecard_objects_saved
+
+from .models import VERSIONED_APP_LABELS, ModelVersion
+
+
+def bump_model_version(model):
+    if model._meta.app_label in VERSIONED_APP_LABELS:
+        ModelVersion.bump(model._meta.label_lower)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def model_changed(sender, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver(timecard_objects_saved)
+def timecard_objects_changed(sender, **kwargs):
+    bump_model_version(sender)
+
+
+@receiver(m2m_changed)
+def relation_changed(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        bump_model_version(type(instance))
+        bump_model_version(model)
@@ -0,0 +1,52 @@
+"""
+Sparse fieldsets: lets clients pick serializer fields with a `fields=`
+query parameter. The restricted serializer is an ordinary subclass, so
+api.planner and api.compiled only join and fetch what the remaining fields
+read.
+"""
+import collections
+import functools
+
+from rest_framework.exceptions import ParseError
+
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(params, serializer_class):
+    """
+    Return the field names listed in the comma-separated `fields` parameter,
+    in `serializer_class` order, or None when the parameter is absent or
+    empty. Raises ParseError for names the serializer does not have.
+    """
+    value = params.get(FIELDS_PARAM) if params else None
+    if not value:
+        return None
+    names = set(name.strip() for name in value.split(',') if name.strip())
+    available = serializer_class._declared_fields
+    unknown = names.difference(available)
+    if unknown:
+        raise ParseError('Unknown fields: {}. Available fields: {}.'.format(
+            ', '.join(sorted(unknown)), ', '.join(available)
+        ))
+    return tuple(name for name in available if name in names)
+
+
+@functools.lru_cache(maxsize=None)
+def sparse_serializer(serializer_class, fields):
+    """ Return a subclass of `serializer_class` with only `fields`. """
+    declared = serializer_class._declared_fields
+    sparse = type(serializer_class.__name__, (serializer_class,), {
+        '__module__': serializer_class.__module__,
+    })
+    sparse._declared_fields = collections.OrderedDict(
+        (name, declared[name]) for name in fields
+    )
+    return sparse
+
+
+def get_serializer_class(params, serializer_class):
+    """ Return `serializer_class`, restricted to the requested fields. """
+    fields = requested_fields(params, serializer_class)
+    if fields is None:
+        return serializer_class
+    return sparse_serializer(serializer_class, fields)
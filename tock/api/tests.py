@@ -2,15 +2,27 @@
 
 import csv
 import datetime
+import io
 import json
 
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.core.urlresolvers import reverse
 
 from django_webtest import WebTest
 
+from api.models import ModelVersion
+from api.planner import related_lookups
+from api.renderers import stream_csv
 from api.views import get_timecards, TimecardList, ProjectList, TimecardSerializer
+from hours.models import QuarterlyHours, Timecard, TimecardObject
+from hours.rollups import fiscal_quarter, quarter_dates
+from hours.views import GeneralSnippetsTimecardSerializer
 from projects.factories import AccountingCodeFactory, ProjectFactory
+from projects.models import ProfitLossAccount, Project
 from hours.factories import (
     UserFactory, ReportingPeriodFactory, TimecardFactory, TimecardObjectFactory,
 )
@@ -72,6 +84,207 @@ class TimecardsAPITests(WebTest):
         clean_res = json.loads(res.decode())
         self.assertEqual(len(clean_res), 2)
 
+    def test_timecards_ndjson(self):
+        """ Check that timecards stream as newline-delimited json """
+        expected = json.loads(
+            client(self).get(reverse('TimecardList')).content.decode()
+        )
+        responses = [
+            client(self).get(reverse('TimecardList'), {'format': 'ndjson'}),
+            client(self).get(
+                reverse('TimecardList'), HTTP_ACCEPT='application/x-ndjson'
+            ),
+        ]
+        for res in responses:
+            self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+            content = b''.join(res.streaming_content).decode()
+            rows = [json.loads(line) for line in content.splitlines()]
+            self.assertEqual(rows, expected)
+
+    def test_timecards_json_stream(self):
+        """ Check that the streamed json array matches the regular one """
+        expected = json.loads(
+            client(self).get(reverse('TimecardList')).content.decode()
+        )
+        res = client(self).get(
+            reverse('TimecardList'), {'format': 'json-stream'}
+        )
+        content = b''.join(res.streaming_content).decode()
+        self.assertEqual(json.loads(content), expected)
+
+    def test_timecards_json_cursor_pagination(self):
+        """ Check that passing a cursor pages through the timecards """
+        res = client(self).get(
+            reverse('TimecardList'), {'cursor': '', 'page_size': 1}
+        ).data
+        self.assertEqual(len(res['results']), 1)
+        self.assertIsNotNone(res['next'])
+
+        next_page = client(self).get(res['next']).data
+        self.assertEqual(len(next_page['results']), 1)
+        self.assertIsNone(next_page['next'])
+        self.assertNotEqual(res['results'][0], next_page['results'][0])
+
+    def test_timecards_ndjson_cursor_pagination(self):
+        """ Check that NDJSON pages through the timecards by following the
+        Link header """
+        expected = json.loads(
+            client(self).get(reverse('TimecardList')).content.decode()
+        )
+        rows = []
+        res = client(self).get(
+            reverse('TimecardList'),
+            {'format': 'ndjson', 'cursor': '', 'page_size': 1}
+        )
+        while True:
+            self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+            page = [
+                json.loads(line) for line in res.content.decode().splitlines()
+            ]
+            self.assertEqual(len(page), 1)
+            rows.extend(page)
+            if not res.has_header('Link'):
+                break
+            link, rel = res['Link'].split('; ')
+            self.assertEqual(rel, 'rel="next"')
+            res = client(self).get(link.strip('<>'))
+        self.assertEqual(
+            sorted(row['id'] for row in rows),
+            sorted(row['id'] for row in expected)
+        )
+
+    def test_timecards_json_invalid_cursor(self):
+        """ Check that a malformed cursor is rejected """
+        res = client(self).get(reverse('TimecardList'), {'cursor': 'nope'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_timecards_json_fields(self):
+        """ Check that only the requested fields are returned and joined """
+        api_client = client(self)
+        with CaptureQueriesContext(connection) as queries:
+            res = api_client.get(
+                reverse('TimecardList'),
+                {'fields': 'user,project_id,hours_spent,start_date'}
+            )
+        clean_res = json.loads(res.content.decode())
+        self.assertEqual(len(clean_res), 2)
+        self.assertEqual(
+            list(clean_res[0]),
+            ['user', 'project_id', 'hours_spent', 'start_date']
+        )
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('hours_timecardobject', sql)
+        self.assertNotIn('projects_agency', sql)
+        self.assertNotIn('projects_profitlossaccount', sql)
+
+        res = api_client.get(reverse('TimecardList'), {'fields': 'salary'})
+        self.assertEqual(res.status_code, 400)
+
+    def test_timecards_json_fields_cursor_pagination(self):
+        """ Check that sparse fields page like the full rows """
+        res = client(self).get(
+            reverse('TimecardList'),
+            {'cursor': '', 'page_size': 1, 'fields': 'hours_spent'}
+        ).data
+        self.assertEqual(list(res['results'][0]), ['hours_spent'])
+        next_page = client(self).get(res['next']).data
+        self.assertEqual(len(next_page['results']), 1)
+
+    def test_timecards_json_modified_since(self):
+        """ Check that modified_since only returns rows changed since then """
+        modified_since = timezone.now()
+        TimecardObject.objects.update(
+            modified=modified_since - datetime.timedelta(days=1)
+        )
+        timecard_object = TimecardObject.objects.filter(
+            timecard__submitted=True
+        ).first()
+        TimecardObject.objects.filter(pk=timecard_object.pk).update(
+            modified=modified_since
+        )
+        res = client(self).get(
+            reverse('TimecardList'),
+            {'modified_since': modified_since.isoformat()}
+        )
+        clean_res = json.loads(res.content.decode())
+        self.assertEqual([row['id'] for row in clean_res], [timecard_object.pk])
+
+        res = client(self).get(
+            reverse('TimecardList'), {'modified_since': 'yesterday'}
+        )
+        self.assertEqual(res.status_code, 400)
+
+    def test_timecard_save_touches_timecard_objects(self):
+        """ Check that saving a timecard marks its rows as modified and
+        carries over its submitted status """
+        timecard = Timecard.objects.filter(submitted=False).first()
+        before = timezone.now()
+        timecard.submitted = True
+        timecard.save()
+        for timecard_object in timecard.timecardobjects.all():
+            self.assertTrue(timecard_object.submitted)
+            self.assertGreaterEqual(timecard_object.modified, before)
+
+    def test_deleted_timecards_json(self):
+        """ Check that deleted rows are listed in the deleted feed """
+        before = timezone.now()
+        timecard_object = TimecardObject.objects.first()
+        timecard_object_id = timecard_object.pk
+        timecard_object.delete()
+
+        res = client(self).get(
+            reverse('TimecardTombstoneList'),
+            {'modified_since': before.isoformat()}
+        )
+        clean_res = json.loads(res.content.decode())
+        self.assertEqual(len(clean_res), 1)
+        self.assertEqual(
+            clean_res[0]['timecard_object_id'], timecard_object_id
+        )
+        self.assertEqual(
+            clean_res[0]['timecard_id'], timecard_object.timecard_id
+        )
+
+        res = client(self).get(
+            reverse('TimecardTombstoneList'),
+            {'modified_since': (
+                timezone.now() + datetime.timedelta(days=1)
+            ).date().isoformat()}
+        )
+        self.assertEqual(json.loads(res.content.decode()), [])
+
+    def test_reopened_timecards_json(self):
+        """ Check that rows of a reopened timecard are listed in the deleted
+        feed, and come back in the changes once it is submitted again """
+        before = timezone.now()
+        timecard = Timecard.objects.filter(submitted=True).first()
+        timecard_object_ids = sorted(
+            timecard.timecardobjects.values_list('id', flat=True))
+        self.assertTrue(timecard_object_ids)
+        timecard.submitted = False
+        timecard.save()
+
+        res = client(self).get(
+            reverse('TimecardTombstoneList'),
+            {'modified_since': before.isoformat()}
+        )
+        clean_res = json.loads(res.content.decode())
+        self.assertEqual(
+            sorted(row['timecard_object_id'] for row in clean_res),
+            timecard_object_ids
+        )
+        self.assertTrue(all(row['withdrawn'] for row in clean_res))
+
+        timecard.submitted = True
+        timecard.save()
+        res = client(self).get(
+            reverse('TimecardList'),
+            {'modified_since': before.isoformat()}
+        )
+        clean_res = json.loads(res.content.decode())
+        self.assertEqual(
+            sorted(row['id'] for row in clean_res), timecard_object_ids)
+
     # TODO: test with more diverse data
     def test_get_timecards(self):
         """ Check that get time cards returns the correct queryset """
@@ -131,6 +344,196 @@ class TimecardsAPITests(WebTest):
         )
         self.assertEqual(len(queryset), 2)
 
+class QueryPlanTests(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory()
+        UserData.objects.create(user=self.user, unit=1)
+        profit_loss_account = ProfitLossAccount.objects.create(
+            name='PL',
+            accounting_string='PL-1',
+            as_start_date=datetime.date(2000, 1, 1),
+            as_end_date=datetime.date(2030, 1, 1),
+        )
+        self.project = ProjectFactory(profit_loss_account=profit_loss_account)
+        self.timecard = TimecardFactory(user=self.user)
+        self.api_client = client(self)
+
+    def add_rows(self, count):
+        TimecardObject.objects.bulk_create([
+            TimecardObject(
+                timecard=self.timecard,
+                project=self.project,
+                hours_spent=1,
+                revenue_profit_loss_account=self.project.profit_loss_account,
+                expense_profit_loss_account=self.project.profit_loss_account,
+            )
+            for _ in range(count)
+        ])
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def test_related_lookups(self):
+        select_related, prefetch_related = related_lookups(
+            GeneralSnippetsTimecardSerializer, TimecardObject
+        )
+        self.assertIn('timecard__user__user_data', select_related)
+        self.assertEqual(prefetch_related, ())
+
+    def test_constant_queries_for_timecard_list(self):
+        def fetch():
+            res = self.api_client.get(reverse('TimecardList'))
+            self.assertEqual(res.status_code, 200)
+
+        self.add_rows(1)
+        one_row = self.count_queries(fetch)
+        self.add_rows(999)
+        self.assertEqual(self.count_queries(fetch), one_row)
+
+    def test_constant_queries_for_stream_csv(self):
+        def fetch():
+            queryset = TimecardObject.objects.all()
+            response = stream_csv(queryset, GeneralSnippetsTimecardSerializer())
+            b''.join(response.streaming_content)
+
+        self.add_rows(1)
+        one_row = self.count_queries(fetch)
+        self.add_rows(999)
+        self.assertEqual(self.count_queries(fetch), one_row)
+
+class ConditionalResponseTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.api_client = client(self)
+
+    def test_not_modified(self):
+        """ Check that a current ETag gets a 304 without querying the
+        projects """
+        res = self.api_client.get(reverse('ProjectList'))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('ETag', res)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.api_client.get(
+                reverse('ProjectList'), HTTP_IF_NONE_MATCH=res['ETag']
+            )
+        self.assertEqual(res.status_code, 304)
+        self.assertFalse(any(
+            'projects_project' in query['sql'] for query in queries
+        ))
+
+    def test_etag_varies_by_filters(self):
+        """ Check that filtered responses have their own ETag """
+        first = self.api_client.get(reverse('TimecardList'))
+        second = self.api_client.get(
+            reverse('TimecardList'), {'user': 'aaron.snow'}
+        )
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_if_modified_since(self):
+        """ Check that Last-Modified is honored """
+        res = self.api_client.get(reverse('ReportingPeriodList'))
+        res = self.api_client.get(
+            reverse('ReportingPeriodList'),
+            HTTP_IF_MODIFIED_SINCE=res['Last-Modified']
+        )
+        self.assertEqual(res.status_code, 304)
+
+class ConditionalResponseChangeTests(TransactionTestCase):
+    """ Versions are bumped when a transaction commits, which TestCase
+    never does. """
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.api_client = client(self)
+
+    def test_etag_changes_on_save_and_delete(self):
+        """ Check that changes to the model or its relations change the
+        ETag """
+        etag = self.api_client.get(reverse('ProjectList'))['ETag']
+        project = Project.objects.first()
+        project.save()
+        res = self.api_client.get(
+            reverse('ProjectList'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res['ETag'], etag)
+
+        etag = res['ETag']
+        AccountingCodeFactory()
+        res = self.api_client.get(
+            reverse('ProjectList'), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(res.status_code, 200)
+
+        etag = res['ETag']
+        TimecardObject.objects.first().delete()
+        self.assertEqual(self.api_client.get(
+            reverse('ProjectList'), HTTP_IF_NONE_MATCH=etag
+        ).status_code, 304)
+        self.assertEqual(self.api_client.get(
+            reverse('TimecardList'), HTTP_IF_NONE_MATCH=etag
+        ).status_code, 200)
+
+    def test_etag_unchanged_on_rollback(self):
+        """ Check that changes rolled back leave the ETag as it was """
+        etag = self.api_client.get(reverse('ProjectList'))['ETag']
+        try:
+            with transaction.atomic():
+                Project.objects.first().save()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.api_client.get(
+            reverse('ProjectList'), HTTP_IF_NONE_MATCH=etag
+        ).status_code, 304)
+
+    def test_versions_bumped_once_per_transaction(self):
+        """ Check that a transaction saving many rows bumps each of their
+        models once, in one query """
+        versions = dict(ModelVersion.objects.values_list('label', 'version'))
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for project in Project.objects.all()[:3]:
+                    project.save()
+                AccountingCodeFactory()
+        self.assertEqual(len([
+            query for query in queries
+            if query['sql'].startswith('UPDATE "api_modelversion"')
+        ]), 1)
+        bumped = dict(ModelVersion.objects.values_list('label', 'version'))
+        for label in ('projects.project', 'projects.accountingcode'):
+            self.assertEqual(bumped[label], versions[label] + 1)
+
+        # A later transaction bumps them again.
+        with transaction.atomic():
+            Project.objects.first().save()
+        self.assertEqual(
+            ModelVersion.objects.get(label='projects.project').version,
+            versions['projects.project'] + 2
+        )
+
+    def test_versions_bumped_after_savepoint_rollback(self):
+        """ Check that rolling back a savepoint keeps the bumps of the rest
+        of the transaction """
+        version = ModelVersion.objects.get(label='projects.project').version
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    AccountingCodeFactory()
+                    raise ValueError
+            except ValueError:
+                pass
+            Project.objects.first().save()
+        self.assertEqual(
+            ModelVersion.objects.get(label='projects.project').version,
+            version + 1
+        )
+
 class TestAggregates(WebTest):
 
     def setUp(self):
@@ -240,6 +643,48 @@ class TestAggregates(WebTest):
         self.assertEqual(len(self.timecard_objects), 4)
         self.assertEqual(row['total'], 60)
 
+    def test_hours_by_quarter_reopened_timecard(self):
+        """ Check that re-opened and edited timecards are counted as they
+        are once resubmitted """
+        self.timecard.submitted = False
+        self.timecard.save()
+        response = client(self).get(reverse('HoursByQuarter')).data
+        self.assertEqual(response, [])
+
+        timecard_object = self.timecard_objects[0]
+        timecard_object.hours_spent = 25
+        timecard_object.save()
+        self.timecard_objects[1].delete()
+        self.timecard.submitted = True
+        self.timecard.save()
+
+        response = client(self).get(reverse('HoursByQuarterByUser')).data
+        self.assertEqual(len(response), 1)
+        self.assertEqual(response[0]['billable'], 25)
+        self.assertEqual(response[0]['nonbillable'], 0)
+        self.assertEqual(response[0]['total'], 25)
+
+    def test_rebuild_hours_rollups(self):
+        """ Check that the rollup can be rebuilt from scratch """
+        expected = client(self).get(reverse('HoursByQuarterByUser')).data
+        QuarterlyHours.objects.all().delete()
+        call_command('rebuild_hours_rollups', stdout=io.StringIO())
+        response = client(self).get(reverse('HoursByQuarterByUser')).data
+        self.assertEqual(response, expected)
+
+    def test_fiscal_quarter(self):
+        self.assertEqual(fiscal_quarter(datetime.date(2015, 10, 1)), (2016, 1))
+        self.assertEqual(fiscal_quarter(datetime.date(2016, 1, 1)), (2016, 2))
+        self.assertEqual(fiscal_quarter(datetime.date(2016, 9, 30)), (2016, 4))
+        self.assertEqual(
+            quarter_dates(2016, 1),
+            (datetime.date(2015, 10, 1), datetime.date(2016, 1, 1))
+        )
+        self.assertEqual(
+            quarter_dates(2016, 4),
+            (datetime.date(2016, 7, 1), datetime.date(2016, 10, 1))
+        )
+
 class ReportingPeriodList(WebTest):
     fixtures = FIXTURES
 
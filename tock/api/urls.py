@@ -16,6 +16,7 @@ urlpatterns = [
         view=views.ReportingPeriodAudit.as_view(), name='ReportingPeriodAudit'
     ),
     url(r'^timecards.json$', views.TimecardList.as_view(), name='TimecardList'),
+    url(r'^timecards/deleted.json$', views.TimecardTombstoneList.as_view(), name='TimecardTombstoneList'),
     url(r'^hours/by_quarter.json$', views.hours_by_quarter, name='HoursByQuarter'),
     url(r'^hours/by_quarter_by_user.json$', views.hours_by_quarter_by_user, name='HoursByQuarterByUser'),
     url(r'^user_data.json$', views.UserDataView.as_view(), name='UserDataView'),
@@ -2,20 +2,32 @@ import collections
 import datetime
 
 from django.http import HttpResponse
-from django.db import connection
-from django.db.models import Sum
+from django.db.models import Case, DecimalField, Sum, Value, When
 
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from projects.models import Project
-from hours.models import TimecardObject, Timecard, ReportingPeriod
+from projects.models import AccountingCode, Project
+from hours.models import (
+    QuarterlyHours, TimecardObject, TimecardObjectTombstone, Timecard,
+    ReportingPeriod,
+)
 from employees.models import UserData
 
 from rest_framework import serializers, generics
+from rest_framework.exceptions import ParseError
+from rest_framework.settings import api_settings
 
 import csv
-from .renderers import stream_csv
+from .conditional import ConditionalResponseMixin
+from .pagination import TimecardCursorPagination
+from .planner import plan_queryset
+from .renderers import (
+    stream_csv, stream_json, StreamingJSONRenderer, NDJSONRenderer,
+)
+from .sparse import get_serializer_class
 
 # Serializers for different models
 
@@ -37,6 +49,9 @@ class ProjectSerializer(serializers.ModelSerializer):
     profit_loss_account = serializers.CharField(source='profit_loss_account.name')
     client = serializers.StringRelatedField(source='accounting_code')
 
+    # AccountingCode.__str__ reads the agency.
+    related_sources = ('accounting_code.agency',)
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -93,28 +108,53 @@ class TimecardSerializer(serializers.Serializer):
     expense_profit_loss_account_name = serializers.CharField(
         source='expense_profit_loss_account.name'
     )
+    id = serializers.IntegerField()
+    modified = serializers.DateTimeField()
+
+class TimecardTombstoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TimecardObjectTombstone
+        fields = (
+            'timecard_object_id',
+            'timecard_id',
+            'deleted',
+            'withdrawn',
+        )
 
 # API Views
 
-class UserDataView(generics.ListAPIView):
+class RelatedQuerysetMixin(object):
+    """ Eagerly load the relations the view's serializer reads, as planned
+    by api.planner.plan_queryset, to avoid n+1 selects """
+
+    def get_queryset(self):
+        queryset = super(RelatedQuerysetMixin, self).get_queryset()
+        return plan_queryset(queryset, self.get_serializer_class())
+
+class UserDataView(ConditionalResponseMixin, RelatedQuerysetMixin,
+                   generics.ListAPIView):
     queryset = UserData.objects.all()
     serializer_class = UserDataSerializer
 
-class ProjectList(generics.ListAPIView):
+class ProjectList(ConditionalResponseMixin, RelatedQuerysetMixin,
+                  generics.ListAPIView):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
 
-class ProjectInstanceView(generics.RetrieveAPIView):
+class ProjectInstanceView(ConditionalResponseMixin, RelatedQuerysetMixin,
+                          generics.RetrieveAPIView):
     """ Return the details of a specific project """
     queryset =  Project.objects.all()
     model = Project
     serializer_class = ProjectSerializer
 
-class UserList(generics.ListAPIView):
+class UserList(ConditionalResponseMixin, RelatedQuerysetMixin,
+               generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
-class ReportingPeriodList(generics.ListAPIView):
+class ReportingPeriodList(ConditionalResponseMixin, RelatedQuerysetMixin,
+                          generics.ListAPIView):
     queryset = ReportingPeriod.objects.all()
     serializer_class = ReportingPeriodSerializer
 
@@ -143,22 +183,87 @@ class ReportingPeriodAudit(generics.ListAPIView):
             .filter(user_data__current_employee=True) \
             .order_by('last_name', 'first_name')
 
-class TimecardList(generics.ListAPIView):
+class TimecardList(ConditionalResponseMixin, RelatedQuerysetMixin,
+                   generics.ListAPIView):
     """ Endpoint for timecard data in csv or json """
 
-    # Eagerly load related rows to avoid n+1 selects
-    queryset = TimecardObject.objects.select_related(
-        'timecard__user',
-        'project__accounting_code__agency',
-        'timecard__reporting_period',
-    ).order_by(
+    # Related rows are joined by RelatedQuerysetMixin, and only for the
+    # fields the client asked for.
+    queryset = TimecardObject.objects.order_by(
         'timecard__reporting_period__start_date'
     )
 
     serializer_class = TimecardSerializer
+    # Models get_timecards() filters on, whichever fields are requested.
+    version_models = (Timecard, ReportingPeriod, User, Project, AccountingCode)
+    pagination_class = TimecardCursorPagination
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (
+        StreamingJSONRenderer,
+        NDJSONRenderer,
+    )
 
     def get_queryset(self):
-        return get_timecards(self.queryset, self.request.query_params)
+        queryset = super(TimecardList, self).get_queryset()
+        return get_timecards(queryset, self.request.query_params)
+
+    def get_serializer_class(self):
+        return get_serializer_class(
+            self.request.query_params,
+            super(TimecardList, self).get_serializer_class()
+        )
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamingJSONRenderer):
+            return super(TimecardList, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return stream_json(queryset, self.get_serializer(), renderer.ndjson)
+
+class TimecardTombstoneList(ConditionalResponseMixin, generics.ListAPIView):
+    """ Endpoint listing deleted timecard line items, and those of reopened
+    timecards, so incremental consumers of TimecardList can apply deletes """
+
+    queryset = TimecardObjectTombstone.objects.order_by('deleted', 'id')
+    serializer_class = TimecardTombstoneSerializer
+
+    def get_queryset(self):
+        queryset = super(TimecardTombstoneList, self).get_queryset()
+        params = self.request.query_params
+        if 'modified_since' in params:
+            queryset = queryset.filter(
+                deleted__gte=parse_modified_since(params['modified_since'])
+            )
+        return queryset
+
+def parse_modified_since(value):
+    """
+    Parse a `modified_since` parameter, given either as an ISO 8601
+    datetime or as a YYYY-MM-DD date (meaning midnight), into an aware
+    datetime. Raises ParseError for anything else.
+    """
+    try:
+        modified_since = parse_datetime(value)
+        if modified_since is None:
+            date = parse_date(value)
+            if date is not None:
+                modified_since = datetime.datetime.combine(
+                    date, datetime.time()
+                )
+    except ValueError:
+        modified_since = None
+    if modified_since is None:
+        raise ParseError(
+            'modified_since must be an ISO 8601 date or datetime.'
+        )
+    if timezone.is_naive(modified_since):
+        modified_since = timezone.make_aware(modified_since)
+    return modified_since
 
 def get_timecards(queryset, params=None):
     """
@@ -173,6 +278,11 @@ def get_timecards(queryset, params=None):
 
     * if `project` is provided as a numeric id or name, get rows for
       that project.
+
+    * if `modified_since` (an ISO 8601 datetime, or a YYYY-MM-DD date) is
+      provided, get rows created or changed at or after that time.
+      Deleted rows, and rows of timecards reopened since, are listed by
+      TimecardTombstoneList.
     """
 
     # include only submitted timecards unless submitted=no in params
@@ -222,43 +332,17 @@ def get_timecards(queryset, params=None):
             project__accounting_code__billable=billable
         )
 
+    if 'modified_since' in params:
+        queryset = queryset.filter(
+            modified__gte=parse_modified_since(params['modified_since'])
+        )
+
     return queryset
 
 
 from rest_framework.response import Response
 from rest_framework.decorators import api_view
 
-hours_by_quarter_query = '''
-with agg as (
-    select
-        extract(year from rp.start_date) +
-            (extract(month from rp.start_date) / 10) as year,
-        (extract(month from rp.start_date) + 3 - 1)::int % 12 / 3 + 1 as quarter,
-        billable,
-        sum(hours_spent) as hours
-    from hours_timecardobject tco
-    join hours_timecard tc on tco.timecard_id = tc.id
-    join hours_reportingperiod rp on tc.reporting_period_id = rp.id
-    join projects_project pr on tco.project_id = pr.id
-    join projects_accountingcode ac on pr.accounting_code_id = ac.id
-    where tc.submitted = True
-    group by
-        year,
-        quarter,
-        billable
-)
-select
-    year,
-    quarter,
-    coalesce(max(case when billable then hours else null end), 0) as billable,
-    coalesce(max(case when not billable then hours else null end), 0) as nonbillable,
-    sum(hours) as total
-from agg
-group by
-    year,
-    quarter
-'''
-
 HoursByQuarter = collections.namedtuple(
     'HoursByQuarter',
     ['year', 'quarter', 'billable', 'nonbillable', 'total'],
@@ -271,52 +355,36 @@ class HoursByQuarterSerializer(serializers.Serializer):
     nonbillable = serializers.FloatField()
     total = serializers.FloatField()
 
+def hours_by_quarter_rows(*fields):
+    """
+    Sum the QuarterlyHours rollup by fiscal year, quarter and `fields`,
+    splitting billable from non-billable hours.
+    """
+    fields = ('fiscal_year', 'quarter') + fields
+    # Separate annotate() calls keep the columns in this order.
+    return QuarterlyHours.objects.values_list(*fields).annotate(
+        billable_hours=Sum(Case(
+            When(billable=True, then='hours'),
+            default=Value(0),
+            output_field=DecimalField(),
+        )),
+    ).annotate(
+        nonbillable_hours=Sum(Case(
+            When(billable=False, then='hours'),
+            default=Value(0),
+            output_field=DecimalField(),
+        )),
+    ).annotate(
+        total=Sum('hours'),
+    ).order_by(*fields)
+
 @api_view()
 def hours_by_quarter(request, *args, **kwargs):
-    cursor = connection.cursor()
-    cursor.execute(hours_by_quarter_query)
-    rows = cursor.fetchall()
     return Response([
         HoursByQuarterSerializer(HoursByQuarter(*each)).data
-        for each in rows
+        for each in hours_by_quarter_rows()
     ])
 
-hours_by_quarter_by_user_query = '''
-with agg as (
-    select
-        extract(year from rp.start_date) +
-            (extract(month from rp.start_date) / 10) as year,
-        (extract(month from rp.start_date) + 3 - 1)::int % 12 / 3 + 1 as quarter,
-        username,
-        billable,
-        sum(hours_spent) as hours
-    from hours_timecardobject tco
-    join hours_timecard tc on tco.timecard_id = tc.id
-    join hours_reportingperiod rp on tc.reporting_period_id = rp.id
-    join auth_user usr on tc.user_id = usr.id
-    join projects_project pr on tco.project_id = pr.id
-    join projects_accountingcode ac on pr.accounting_code_id = ac.id
-    where tc.submitted = True
-    group by
-        year,
-        quarter,
-        username,
-        billable
-)
-select
-    year,
-    quarter,
-    username,
-    coalesce(max(case when billable then hours else null end), 0) as billable,
-    coalesce(max(case when not billable then hours else null end), 0) as nonbillable,
-    sum(hours) as total
-from agg
-group by
-    year,
-    quarter,
-    username
-'''
-
 HoursByQuarterByUser = collections.namedtuple(
     'HoursByQuarter',
     ['year', 'quarter', 'username', 'billable', 'nonbillable', 'total'],
@@ -332,9 +400,7 @@ class HoursByQuarterByUserSerializer(serializers.Serializer):
 
 @api_view()
 def hours_by_quarter_by_user(request, *args, **kwargs):
-    cursor = connection.cursor()
-    cursor.execute(hours_by_quarter_by_user_query)
-    rows = cursor.fetchall()
+    rows = hours_by_quarter_rows('user__username')
     return Response([
         HoursByQuarterByUserSerializer(HoursByQuarterByUser(*each)).data
         for each in rows
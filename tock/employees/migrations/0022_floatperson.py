@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0021_merge_20170710_1654'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FloatPerson',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('people_id', models.IntegerField()),
+                ('synced', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Float person',
+                'verbose_name_plural': 'Float people',
+            },
+        ),
+    ]
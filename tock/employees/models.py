@@ -131,3 +131,19 @@ class UserData(models.Model):
             user.save()
 
         super(UserData, self).save(*args, **kwargs)
+
+
+class FloatPerson(models.Model):
+    """Float's people, indexed by Tock username (Float's 'im' attribute), so
+    that looking up a user's Float "people_id" does not download all of
+    them. Synced by hours.float.sync_float_people()."""
+    username = models.CharField(max_length=150, unique=True)
+    people_id = models.IntegerField()
+    synced = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Float person'
+        verbose_name_plural = 'Float people'
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.username, self.people_id)
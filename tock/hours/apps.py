@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class HoursConfig(AppConfig):
+    name = 'hours'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -1,8 +1,15 @@
 import datetime as dt
+from decimal import Decimal
 
-from .models import ReportingPeriod
+import requests
 
-from employees.models import UserData
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import FloatHoliday, FloatTask, FloatTimeoff, ReportingPeriod
+
+from employees.models import FloatPerson, UserData
+from tock.float_client import fetch_concurrently
 from tock.utils import get_float_data, flatten
 
 # Variables.
@@ -10,27 +17,30 @@ BASE_HOURS_PER_WEEK = 32.5
 BASE_HOURS_PER_DAY = 6.5
 BASE_DAYS_PER_WEEK = 5
 
-def float_tasks_for_view(user, rp):
-    userdata = UserData.objects.get(user=user)
+def float_tasks_for_view(user, rp, userdata=None):
+    if userdata is None:
+        userdata = UserData.objects.get(user=user)
     float_people_id = get_float_people_id(userdata)
 
     if not float_people_id:
         return None
 
-    float_tasks = get_float_tasks(
-        start_date=rp.start_date,
-        float_people_id=float_people_id,
-        weeks=1
-    )
-    float_holidays = get_float_holidays(
-        start_date=rp.start_date,
-        weeks=2
-    )
-    float_timeoffs = get_float_timeoffs(
-        end_date=rp.end_date,
-        float_people_id=float_people_id,
-        weeks=26
-    )
+    # Read from the schedule imported by import_float_schedule().
+    float_tasks = list(FloatTask.objects.filter(
+        people_id=float_people_id,
+        start_date__lte=rp.end_date,
+        end_date__gte=rp.start_date,
+    ).values('project_name', 'task_name', 'hours_pd', 'start_date',
+             'end_date'))
+    float_holidays = list(FloatHoliday.objects.filter(
+        date__range=(rp.start_date, rp.end_date)
+    ).values('date'))
+    float_timeoffs = list(FloatTimeoff.objects.filter(
+        people_id=float_people_id,
+        start_date__lte=rp.end_date,
+        end_date__gte=rp.start_date,
+    ).values('hours', 'start_date', 'end_date'))
+
     work_days = get_work_days(
         holidays=float_holidays,
         start_date=rp.start_date,
@@ -51,11 +61,16 @@ def float_tasks_for_view(user, rp):
         work_hours=work_hours
     )
 
+def as_date(value):
+    """ Float dates are strings; imported ones are already dates. """
+    if isinstance(value, str):
+        return dt.datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
 def get_tasks(start_date, end_date, tasks, work_days, work_hours):
     for i in tasks:
         t_start_date, t_end_date = \
-            [ dt.datetime.strptime(i[k], '%Y-%m-%d').date() for \
-            k in ['start_date', 'end_date'] ]
+            [ as_date(i[k]) for k in ['start_date', 'end_date'] ]
         task_days = len(find_common_weekdays(
             (start_date, end_date),
             (t_start_date, t_end_date)
@@ -75,8 +90,7 @@ def get_work_hours(start_date, end_date, timeoffs, work_days):
     hours_off = 0
     for i in timeoffs:
         to_start_date, to_end_date = \
-            [ dt.datetime.strptime(i[k], '%Y-%m-%d').date() for \
-            k in ['start_date', 'end_date'] ]
+            [ as_date(i[k]) for k in ['start_date', 'end_date'] ]
         days_off = len(find_common_weekdays(
             (start_date, end_date),
             (to_start_date, to_end_date)
@@ -90,59 +104,153 @@ def get_work_days(holidays, start_date, end_date):
     # and check for holidays in period.
     return BASE_DAYS_PER_WEEK - len([ i for i in holidays \
         if start_date <= \
-        dt.datetime.strptime(i['date'], '%Y-%m-%d').date() <= \
+        as_date(i['date']) <= \
         end_date ])
 
-def get_float_timeoffs(end_date, float_people_id, weeks=26):
-    # Get Float timeoff for the user data.
-    # Defaults to 26 weeks to guard against a really, really long
-    # absence.
-    return [ i for i in get_float_data(
-        endpoint='timeoffs',
-        params={
-            'weeks': weeks,
-            'start_day': end_date - dt.timedelta(weeks=weeks)
-        }
-    ).json()['timeoffs'] if int(i['people_id']) == float_people_id ]
-
-def get_float_holidays(start_date, weeks=2):
-    return get_float_data(
-        endpoint='holidays',
-        params={'start_day': (start_date - dt.timedelta(
-            weeks=weeks))
-        }
-    ).json()['holidays']
-
 def get_float_people_id(userdata):
     if userdata.float_people_id:
         return userdata.float_people_id
 
-    float_people_id = [ i['people_id'] for i in \
-        get_float_data(endpoint='people').json()['people'] if \
-        i['im'] == userdata.user.username ]
+    username = userdata.user.username
+    # The index is synced by the import_float_schedule and
+    # sync_float_people commands, never from a request.
+    float_person = FloatPerson.objects.filter(username=username).first()
 
-    if float_people_id:
-        # Use most recent Float people_id in the rare case a
-        # person has multiple people_ids.
-        userdata.float_people_id = int(float_people_id[-1])
+    if float_person:
+        userdata.float_people_id = float_person.people_id
+        UserData.objects.filter(pk=userdata.pk).update(
+            float_people_id=float_person.people_id)
         return userdata.float_people_id
 
     return None
 
-def get_float_tasks(start_date, float_people_id, weeks=1):
-    # Get all of the tasks associated with a Float user if the
-    # user's Float people_id matches their Tock float_people_id.
-    # See https://github.com/floatschedule/api/blob/805663be98c9f48a275c9a13e824b0d6701df398/Sections/tasks.md.
-    # Assumes a reporting period is 1 week.
-    all_tasks = get_float_data(
-        endpoint='tasks',
-        params={'weeks': weeks, 'start_day': start_date}
-    ).json()['people']
-
-    return flatten(
-        [ ii for ii in [i['tasks'] for i in all_tasks \
-            if int(i['people_id']) == float_people_id ] ]
-    )
+def sync_float_people():
+    """Replace the local index of Float people with Float's current list,
+    and store the "people_id" of every user who has none yet. Returns the
+    number of people, or None if Float could not be reached."""
+    try:
+        r = get_float_data(endpoint='people')
+        people = r.json()['people'] if r is not None else None
+    except (requests.RequestException, ValueError) as e:
+        print('Failed call to Float people: {}'.format(e))
+        people = None
+    if people is None:
+        return None
+
+    # Use most recent Float people_id in the rare case a person has
+    # multiple people_ids.
+    people_ids = {}
+    for i in people:
+        if i['im']:
+            people_ids[i['im']] = int(i['people_id'])
+
+    with transaction.atomic():
+        FloatPerson.objects.all().delete()
+        FloatPerson.objects.bulk_create(
+            FloatPerson(username=username, people_id=people_id)
+            for username, people_id in people_ids.items()
+        )
+
+        users = dict(UserData.objects.filter(
+            float_people_id__isnull=True,
+            user__username__in=list(people_ids),
+        ).values_list('user_id', 'user__username'))
+        if users:
+            UserData.objects.filter(user_id__in=list(users)).update(
+                float_people_id=Case(
+                    *[When(user_id=user_id, then=Value(people_ids[username]))
+                      for user_id, username in users.items()],
+                    output_field=IntegerField()
+                )
+            )
+
+    return len(people_ids)
+
+def import_float_schedule(start_date, weeks):
+    """Import the Float tasks, time off and holidays of the `weeks` weeks
+    from `start_date` into FloatTask, FloatTimeoff and FloatHoliday,
+    replacing what was imported for that window before, so importing
+    again only applies what changed in Float. Returns the number of rows
+    imported per model, or None if Float could not be reached."""
+    end_date = start_date + dt.timedelta(weeks=weeks)
+    try:
+        responses = fetch_concurrently(
+            lambda: get_float_data(
+                endpoint='tasks',
+                params={'weeks': weeks, 'start_day': start_date}
+            ),
+            lambda: get_float_data(
+                endpoint='timeoffs',
+                params={'weeks': weeks, 'start_day': start_date}
+            ),
+            lambda: get_float_data(
+                endpoint='holidays',
+                params={'start_day': start_date}
+            ),
+        )
+        if None in responses:
+            return None
+        tasks, timeoffs, holidays = [r.json() for r in responses]
+    except (requests.RequestException, ValueError) as e:
+        print('Failed call to Float schedule: {}'.format(e))
+        return None
+
+    # Repeating and split tasks are listed once per repetition or part,
+    # and tasks of several people once per person, under the same ID.
+    tasks = {
+        (int(i['task_id']), int(i['people_id']), i['start_date'],
+         i['end_date']): FloatTask(
+            task_id=int(i['task_id']),
+            people_id=int(i['people_id']),
+            project_id=int(i['project_id']) if i['project_id'] else None,
+            project_name=i['project_name'] or '',
+            task_name=i['task_name'] or '',
+            hours_pd=Decimal(i['hours_pd']),
+            start_date=as_date(i['start_date']),
+            end_date=as_date(i['end_date']),
+        )
+        for i in flatten([ i['tasks'] for i in tasks['people'] ])
+    }
+    timeoffs = {
+        int(i['timeoff_id']): FloatTimeoff(
+            timeoff_id=int(i['timeoff_id']),
+            people_id=int(i['people_id']),
+            hours=Decimal(i['hours']),
+            start_date=as_date(i['start_date']),
+            end_date=as_date(i['end_date']),
+        )
+        for i in timeoffs['timeoffs']
+    }
+    holidays = {
+        int(i['holiday_id']): FloatHoliday(
+            holiday_id=int(i['holiday_id']),
+            name=i['holiday_name'] or '',
+            date=as_date(i['date']),
+        )
+        for i in holidays['holidays']
+    }
+
+    overlapping = Q(start_date__lt=end_date, end_date__gte=start_date)
+    with transaction.atomic():
+        FloatTask.objects.filter(
+            overlapping |
+            Q(task_id__in={task.task_id for task in tasks.values()})
+        ).delete()
+        FloatTask.objects.bulk_create(tasks.values())
+        FloatTimeoff.objects.filter(
+            overlapping | Q(timeoff_id__in=list(timeoffs))).delete()
+        FloatTimeoff.objects.bulk_create(timeoffs.values())
+        FloatHoliday.objects.filter(
+            Q(date__gte=start_date, date__lt=end_date) |
+            Q(holiday_id__in=list(holidays))
+        ).delete()
+        FloatHoliday.objects.bulk_create(holidays.values())
+
+    return {
+        'tasks': len(tasks),
+        'timeoffs': len(timeoffs),
+        'holidays': len(holidays),
+    }
 
 def find_common_weekdays(range_one, range_two):
     # Takes start and end dates of two date ranges and returns list of
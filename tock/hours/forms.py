@@ -3,14 +3,19 @@ import json
 import bleach
 
 from django import forms
+from django.core.cache import cache
+from django.db import transaction
 from django.forms.models import BaseInlineFormSet
 from django.forms.models import inlineformset_factory
 from django.utils.encoding import force_text
 from django.utils.html import escape, conditional_escape, escapejs
+from django.utils.safestring import mark_safe
 from django.db.models import Prefetch
 
+from . import rollups
 from .models import Timecard, TimecardObject, ReportingPeriod
-from projects.models import AccountingCode, Project
+from api.conditional import validators
+from projects.models import AccountingCode, Agency, Project, ProjectAlert
 from django.db.models import Q
 from datetime import datetime, timedelta, time
 
@@ -46,7 +51,29 @@ class SelectWithData(forms.widgets.Select):
     Subclass of Django's select widget that allows disabling options.
     To disable an option, pass a dict instead of a string for its label,
     of the form: {'label': 'option label', 'disabled': True}
+
+    Set `options_html` to the output of render_options() with nothing
+    selected to have every widget sharing the same choices reuse it, with
+    only the selection applied per widget.
     """
+    options_html = None
+
+    def __deepcopy__(self, memo):
+        obj = super(SelectWithData, self).__deepcopy__(memo)
+        obj.options_html = self.options_html
+        return obj
+
+    def render_options(self, selected_choices):
+        if self.options_html is None:
+            return super(SelectWithData, self).render_options(selected_choices)
+
+        options_html = self.options_html
+        for value in set(force_text(v) for v in selected_choices):
+            option = '<option value="%s"' % escape(value)
+            options_html = options_html.replace(
+                option, option + ' selected="selected"', 1
+            )
+        return mark_safe(options_html)
 
     def render_option(self, selected_choices, option_value, option_label):
         option_value = force_text(option_value)
@@ -145,6 +172,47 @@ def projects_as_choices(queryset=None):
     return accounting_codes
 
 
+# Models projects_as_choices() reads; changing any of them changes the
+# choices of every reporting period.
+PROJECT_CATALOG_MODELS = (AccountingCode, Agency, Project, ProjectAlert)
+PROJECT_CHOICES_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def reporting_period_project_options(reporting_period):
+    """
+    Return projects_as_choices() for the projects of `reporting_period`
+    along with their `<option>` markup as rendered by SelectWithData, both
+    cached until the project catalog changes. Which projects a period
+    offers also depends on today's date, see ReportingPeriod.get_projects().
+    """
+    key = 'projects_as_choices:{}:{}:{}:{}'.format(
+        reporting_period.pk,
+        reporting_period.start_date,
+        datetime.now().date(),
+        validators(PROJECT_CATALOG_MODELS, 'projects_as_choices')[0],
+    )
+    cached = cache.get(key)
+    if cached is None:
+        choices = projects_as_choices(reporting_period.get_projects())
+        options_html = SelectWithData(choices=choices).render_options([])
+        cached = (choices, str(options_html))
+        cache.set(key, cached, PROJECT_CHOICES_CACHE_TIMEOUT)
+    return cached
+
+
+def reporting_period_choices(reporting_period):
+    return reporting_period_project_options(reporting_period)[0]
+
+
+def project_id(value):
+    """ Return the project ID submitted as `value`, or None if it is not
+    one. """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class TimecardObjectForm(forms.ModelForm):
     notes = forms.CharField(
         help_text='Please provide a snippet about how you spent your time.',
@@ -169,16 +237,33 @@ class TimecardObjectForm(forms.ModelForm):
         model = TimecardObject
         fields = ['project', 'hours_spent', 'notes']
 
+    # Set by TimecardInlineFormSet to the projects submitted across all of
+    # its forms, as returned by Project.objects.in_bulk().
+    projects = None
+
     def clean_project(self):
         data = self.cleaned_data.get('project')
 
-        try:
-            data = Project.objects.get(id=data)
-        except Project.DoesNotExist:
-            raise forms.ValidationError('Invalid Project Selected')
+        if self.projects is None:
+            try:
+                data = Project.objects.get(id=data)
+            except Project.DoesNotExist:
+                raise forms.ValidationError('Invalid Project Selected')
+        else:
+            data = self.projects.get(project_id(data))
+            if data is None:
+                raise forms.ValidationError('Invalid Project Selected')
 
         return data
 
+    def _get_validation_exclusions(self):
+        # clean_project() has already fetched the project, so there is no
+        # need for the model validation to check again that it exists.
+        exclude = super(TimecardObjectForm, self)._get_validation_exclusions()
+        if isinstance(self.cleaned_data.get('project'), Project):
+            exclude.append('project')
+        return exclude
+
     def clean_hours_spent(self):
         return self.cleaned_data.get('hours_spent') or 0
 
@@ -245,6 +330,20 @@ class TimecardInlineFormSet(BaseInlineFormSet):
     def set_is_aws_eligible(self, aws_eligible):
         self.aws_eligible = aws_eligible
 
+    def full_clean(self):
+        """ Fetch the projects of every form in a single query before the
+        forms are cleaned. """
+        if self.is_bound:
+            ids = set()
+            for form in self.forms:
+                value = project_id(form['project'].data)
+                if value is not None:
+                    ids.add(value)
+            projects = Project.objects.in_bulk(ids)
+            for form in self.forms:
+                form.projects = projects
+        super(TimecardInlineFormSet, self).full_clean()
+
     def clean(self):
         super(TimecardInlineFormSet, self).clean()
         total_hrs = 0
@@ -282,6 +381,18 @@ class TimecardInlineFormSet(BaseInlineFormSet):
 
         return getattr(self, 'cleaned_data', None)
 
+    def save(self, commit=True):
+        """ Save the line items of the timecard together, see
+        TimecardObject.bulk_save(). """
+        if not commit:
+            return super(TimecardInlineFormSet, self).save(commit=False)
+
+        with transaction.atomic(), rollups.batch():
+            objects = super(TimecardInlineFormSet, self).save(commit=False)
+            for obj in self.deleted_objects:
+                obj.delete()
+            return TimecardObject.bulk_save(self.instance, objects)
+
 
 def timecard_formset_factory(extra=1):
     return inlineformset_factory(
@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hours.float import import_float_schedule, sync_float_people
+
+
+class Command(BaseCommand):
+    help = 'Sync the local index of Float people, and import Float ' \
+        'tasks, time off and holidays of a rolling window of weeks ' \
+        'around today, which timecards show next to the hours ' \
+        'scheduled in Float. Run it nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks-back', type=int, default=4,
+            help='Weeks before the current one to import (default 4).'
+        )
+        parser.add_argument(
+            '--weeks-ahead', type=int, default=4,
+            help='Weeks after the current one to import (default 4).'
+        )
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        week_start = today - datetime.timedelta(days=today.weekday())
+        start_date = week_start - datetime.timedelta(
+            weeks=options['weeks_back'])
+        weeks = options['weeks_back'] + 1 + options['weeks_ahead']
+
+        # Timecards only look people up in the index, so new Float users
+        # are matched here.
+        if sync_float_people() is None:
+            raise CommandError('Could not fetch people from Float.')
+        counts = import_float_schedule(start_date, weeks)
+        if counts is None:
+            raise CommandError('Could not fetch the schedule from Float.')
+        self.stdout.write(
+            'Imported {tasks} tasks, {timeoffs} time offs and {holidays} '
+            'holidays from Float.'.format(**counts)
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from hours import rollups
+from hours.models import (
+    FiscalYearHours, QuarterlyHours, ReportingPeriodHours,
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the quarterly hours rollup behind the hours_by_quarter ' \
+        'API endpoints, the reporting period hours rollup behind the ' \
+        'utilization views and the fiscal year series behind the ' \
+        'dashboard, from the submitted timecards.'
+
+    def handle(self, *args, **options):
+        rollups.rebuild()
+        rollups.rebuild_periods()
+        rollups.rebuild_fiscal_years()
+        self.stdout.write(
+            'Rebuilt {} quarterly hours, {} reporting period hours and {} '
+            'fiscal year hours rows.'.format(
+                QuarterlyHours.objects.count(),
+                ReportingPeriodHours.objects.count(),
+                FiscalYearHours.objects.count()
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from hours.float import sync_float_people
+
+
+class Command(BaseCommand):
+    help = 'Sync the local index of Float people, and store the Float ' \
+        '"people_id" of users who have none yet.'
+
+    def handle(self, *args, **options):
+        count = sync_float_people()
+        if count is None:
+            raise CommandError('Could not fetch people from Float.')
+        self.stdout.write('Synced {} Float people.'.format(count))
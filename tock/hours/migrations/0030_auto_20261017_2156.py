@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 01:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0029_merge_20170227_1725'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimecardObjectTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timecard_object_id', models.PositiveIntegerField()),
+                ('timecard_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Deleted Timecard Object',
+                'verbose_name_plural': 'Deleted Timecard Objects',
+                'ordering': ['deleted'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='timecardobject',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0030_auto_20261017_2156'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportingPeriodSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.UUIDField(default=uuid.uuid4, unique=True)),
+                ('reporting_period', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='hours.ReportingPeriod')),
+            ],
+        ),
+    ]
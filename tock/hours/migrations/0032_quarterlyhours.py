@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:09
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    from hours.rollups import rebuild
+    rebuild(
+        apps.get_model('hours', 'TimecardObject'),
+        apps.get_model('hours', 'QuarterlyHours'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hours', '0031_reportingperiodsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuarterlyHours',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fiscal_year', models.PositiveSmallIntegerField()),
+                ('quarter', models.PositiveSmallIntegerField()),
+                ('billable', models.BooleanField()),
+                ('hours', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Quarterly Hours',
+                'verbose_name_plural': 'Quarterly Hours',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='quarterlyhours',
+            unique_together=set([('fiscal_year', 'quarter', 'user', 'billable')]),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
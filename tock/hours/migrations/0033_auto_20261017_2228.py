@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0032_quarterlyhours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FloatHoliday',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holiday_id', models.PositiveIntegerField(unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('date', models.DateField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FloatTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.PositiveIntegerField(unique=True)),
+                ('people_id', models.IntegerField()),
+                ('project_name', models.CharField(blank=True, max_length=255)),
+                ('task_name', models.CharField(blank=True, max_length=255)),
+                ('hours_pd', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FloatTimeoff',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timeoff_id', models.PositiveIntegerField(unique=True)),
+                ('people_id', models.IntegerField()),
+                ('hours', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='floattimeoff',
+            index_together=set([('people_id', 'start_date', 'end_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='floattask',
+            index_together=set([('people_id', 'start_date', 'end_date')]),
+        ),
+    ]
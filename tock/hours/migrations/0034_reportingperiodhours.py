@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:35
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    from hours.rollups import rebuild_periods
+    rebuild_periods(
+        apps.get_model('hours', 'TimecardObject'),
+        apps.get_model('hours', 'ReportingPeriodHours'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('hours', '0033_auto_20261017_2228'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportingPeriodHours',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.IntegerField(blank=True, choices=[(0, 'Operations-Team Operations'), (1, 'Operations-Talent'), (2, 'Operations-Infrastructure'), (3, 'Operations-Front Office'), (4, 'Chapters-Acquisition Managers'), (5, 'Chapters-Engineering'), (6, 'Chapters-Experience Design'), (7, 'Chapters-Product'), (8, 'Chapters-Strategists'), (9, 'Business-Acquisition Services'), (10, 'Business-Custom Partner Solutions'), (11, 'Business-Learn'), (12, 'Business-Products & Platforms'), (13, 'Business-Transformation Services'), (14, 'PIF-Fellows'), (15, 'PIF-Operations'), (16, 'Unknown / N/A')], null=True)),
+                ('grade', models.IntegerField(blank=True, choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8'), (9, '9'), (10, '10'), (11, '11'), (12, '12'), (13, '13'), (14, '14'), (15, '15'), (16, 'SES')], null=True)),
+                ('total_hours', models.DecimalField(blank=True, decimal_places=2, max_digits=9, null=True)),
+                ('billable_hours', models.DecimalField(blank=True, decimal_places=2, max_digits=9, null=True)),
+                ('revenue_hours', models.DecimalField(blank=True, decimal_places=2, max_digits=9, null=True)),
+                ('reporting_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hours.ReportingPeriod')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Reporting Period Hours',
+                'verbose_name_plural': 'Reporting Period Hours',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='reportingperiodhours',
+            unique_together=set([('user', 'reporting_period')]),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 02:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    from hours.rollups import rebuild_fiscal_years
+    rebuild_fiscal_years(
+        apps.get_model('hours', 'ReportingPeriodHours'),
+        apps.get_model('hours', 'FiscalYearHours'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0022_floatperson'),
+        ('hours', '0034_reportingperiodhours'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FiscalYearHours',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fiscal_year', models.PositiveSmallIntegerField()),
+                ('unit', models.IntegerField(blank=True, choices=[(0, 'Operations-Team Operations'), (1, 'Operations-Talent'), (2, 'Operations-Infrastructure'), (3, 'Operations-Front Office'), (4, 'Chapters-Acquisition Managers'), (5, 'Chapters-Engineering'), (6, 'Chapters-Experience Design'), (7, 'Chapters-Product'), (8, 'Chapters-Strategists'), (9, 'Business-Acquisition Services'), (10, 'Business-Custom Partner Solutions'), (11, 'Business-Learn'), (12, 'Business-Products & Platforms'), (13, 'Business-Transformation Services'), (14, 'PIF-Fellows'), (15, 'PIF-Operations'), (16, 'Unknown / N/A')], null=True)),
+                ('hours', models.DecimalField(decimal_places=2, max_digits=9)),
+                ('fytd_hours', models.DecimalField(decimal_places=2, max_digits=11)),
+                ('reporting_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hours.ReportingPeriod')),
+            ],
+            options={
+                'verbose_name': 'Fiscal Year Hours',
+                'verbose_name_plural': 'Fiscal Year Hours',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='fiscalyearhours',
+            unique_together=set([('reporting_period', 'unit')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='fiscalyearhours',
+            index_together=set([('fiscal_year', 'unit')]),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
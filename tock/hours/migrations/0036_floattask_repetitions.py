@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 03:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0035_fiscalyearhours'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='floattask',
+            name='task_id',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='floattask',
+            unique_together=set([('task_id', 'people_id', 'start_date', 'end_date')]),
+        ),
+    ]
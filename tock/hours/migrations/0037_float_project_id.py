@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 03:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0036_floattask_repetitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='floattask',
+            name='project_id',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
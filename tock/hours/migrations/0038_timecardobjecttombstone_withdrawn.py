@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 03:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hours', '0037_float_project_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timecardobjecttombstone',
+            name='withdrawn',
+            field=models.BooleanField(default=False),
+        ),
+    ]
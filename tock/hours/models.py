@@ -1,14 +1,18 @@
 import datetime
+import uuid
 
 from .utils import ValidateOnSaveMixin
 from projects.models import Project, ProfitLossAccount
 
 from django.contrib.auth.models import User
-from employees.models import EmployeeGrade
+from employees.models import EmployeeGrade, UserData
 from django.core.validators import MaxValueValidator
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, Max
+from django.db import connection, models, transaction
+from django.db.models import Case, Max, Q, Value, When
+from django.db.models.functions import Cast
+from django.dispatch import Signal
+from django.utils import timezone
 
 
 class HolidayPrefills(models.Model):
@@ -154,7 +158,7 @@ class TimecardObject(models.Model):
                                       blank=True,
                                       null=True)
     created = models.DateTimeField(auto_now_add=True)
-    modified = models.DateTimeField(auto_now=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
     grade = models.ForeignKey(EmployeeGrade, blank=True, null=True)
 
     # The notes field is where the user records notes about time spent on
@@ -188,20 +192,18 @@ class TimecardObject(models.Model):
     def notes_list(self):
         return self.notes.split('\n')
 
-    def save(self, *args, **kwargs):
-        """Custom save() method to append employee grade info and the submitted
-        status of the related timecard."""
+    def set_timecard_fields(self, timecard, grade, user_profit_loss_account):
+        """Append employee grade info, the submitted status of the related
+        timecard and the profit/loss accounts in effect at the end of its
+        reporting period."""
 
-        self.grade = EmployeeGrade.get_grade(
-            self.timecard.reporting_period.end_date,
-            self.timecard.user
-        )
+        self.grade = grade
 
-        self.submitted = self.timecard.submitted
+        self.submitted = timecard.submitted
 
         p_pl = self.project.profit_loss_account # Project PL info.
-        u_pl = self.timecard.user.user_data.profit_loss_account # User PL info.
-        rp = self.timecard.reporting_period # TimecardObject reporting period.
+        u_pl = user_profit_loss_account # User PL info.
+        rp = timecard.reporting_period # TimecardObject reporting period.
 
         if p_pl and \
         p_pl.account_type == 'Revenue' and \
@@ -220,5 +222,266 @@ class TimecardObject(models.Model):
         else:
             self.expense_profit_loss_account = None
 
+    def save(self, *args, **kwargs):
+        """Custom save() method to append employee grade info and the submitted
+        status of the related timecard."""
+
+        self.set_timecard_fields(
+            self.timecard,
+            EmployeeGrade.get_grade(
+                self.timecard.reporting_period.end_date,
+                self.timecard.user
+            ),
+            self.timecard.user.user_data.profit_loss_account
+        )
 
         super(TimecardObject, self).save(*args, **kwargs)
+
+    @classmethod
+    def bulk_save(cls, timecard, objects):
+        """Save `objects`, line items of `timecard`, as save() would, but
+        looking up the grade, the user's profit/loss account and the
+        reporting period once, the projects' profit/loss accounts together,
+        and writing new and existing rows in one query each.
+
+        No post_save signals are sent; timecard_objects_saved is sent once
+        instead."""
+        objects = list(objects)
+        rp = timecard.reporting_period
+        grade = EmployeeGrade.get_grade(rp.end_date, timecard.user)
+        user_profit_loss_account = \
+            timecard.user.user_data.profit_loss_account
+        models.prefetch_related_objects(
+            objects, 'project__profit_loss_account'
+        )
+
+        now = timezone.now()
+        for obj in objects:
+            obj.timecard = timecard
+            obj.set_timecard_fields(timecard, grade, user_profit_loss_account)
+            obj.modified = now
+
+        with transaction.atomic():
+            cls.objects.bulk_create(obj for obj in objects if obj.pk is None)
+            cls._bulk_update([obj for obj in objects if obj.pk is not None])
+
+        timecard_objects_saved.send(sender=cls, timecard=timecard)
+        return objects
+
+    # Columns bulk_save() writes to rows that already exist.
+    BULK_UPDATE_FIELDS = (
+        'project', 'hours_spent', 'notes', 'grade', 'submitted',
+        'revenue_profit_loss_account', 'expense_profit_loss_account',
+        'modified',
+    )
+
+    @classmethod
+    def _bulk_update(cls, objects):
+        if not objects:
+            return
+        updates = {}
+        for name in cls.BULK_UPDATE_FIELDS:
+            field = cls._meta.get_field(name)
+            value = Case(*[
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname)))
+                for obj in objects
+            ], output_field=field)
+            if connection.vendor == 'postgresql':
+                # Otherwise a column of NULLs is typed as text.
+                value = Cast(value, output_field=field)
+            updates[name] = value
+        cls.objects.filter(pk__in=[obj.pk for obj in objects]).update(**updates)
+
+
+# Sent by TimecardObject.bulk_save() in place of post_save.
+timecard_objects_saved = Signal(providing_args=['timecard'])
+
+
+class TimecardObjectTombstone(models.Model):
+    """Records the deletion of a TimecardObject, or its withdrawal when its
+    timecard is reopened, so that consumers of the timecards API can apply
+    deletes when syncing incrementally. A withdrawn row is listed again
+    once its timecard is submitted again."""
+    timecard_object_id = models.PositiveIntegerField()
+    timecard_id = models.PositiveIntegerField(blank=True, null=True)
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+    withdrawn = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Deleted Timecard Object'
+        verbose_name_plural = 'Deleted Timecard Objects'
+        ordering = ['deleted']
+
+    def __str__(self):
+        return '{} (deleted {})'.format(self.timecard_object_id, self.deleted)
+
+
+class ReportingPeriodSnapshot(models.Model):
+    """Names the current export snapshots of a closed reporting period (see
+    hours.snapshots). Deleting the row invalidates the snapshots on disk."""
+    reporting_period = models.OneToOneField(
+        ReportingPeriod,
+        related_name='snapshot',
+        on_delete=models.CASCADE
+    )
+    key = models.UUIDField(default=uuid.uuid4, unique=True)
+
+    def __str__(self):
+        return '{} ({})'.format(self.reporting_period, self.key)
+
+
+class QuarterlyHours(models.Model):
+    """Submitted hours rolled up by fiscal quarter, user and billability;
+    kept up to date by hours.rollups and rebuilt with the
+    `rebuild_hours_rollups` management command."""
+    fiscal_year = models.PositiveSmallIntegerField()
+    quarter = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    billable = models.BooleanField()
+    hours = models.DecimalField(max_digits=9, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'Quarterly Hours'
+        verbose_name_plural = 'Quarterly Hours'
+        unique_together = ('fiscal_year', 'quarter', 'user', 'billable')
+
+    def __str__(self):
+        return 'FY{} Q{} {} ({})'.format(
+            self.fiscal_year,
+            self.quarter,
+            self.user,
+            'billable' if self.billable else 'non-billable'
+        )
+
+
+class ReportingPeriodHours(models.Model):
+    """Submitted hours rolled up by user and reporting period, with the
+    user's unit and grade as they stood on submission; kept up to date by
+    hours.rollups and rebuilt with the `rebuild_hours_rollups` management
+    command. Hours are None when there are none to sum, as with SUM()."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    reporting_period = models.ForeignKey(
+        ReportingPeriod,
+        on_delete=models.CASCADE
+    )
+    unit = models.IntegerField(
+        choices=UserData.UNIT_CHOICES,
+        blank=True,
+        null=True
+    )
+    grade = models.IntegerField(
+        choices=EmployeeGrade.GRADE_CHOICES,
+        blank=True,
+        null=True
+    )
+    total_hours = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        blank=True,
+        null=True
+    )
+    billable_hours = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        blank=True,
+        null=True
+    )
+    # Billable hours counted towards revenue on the dashboard, which leaves
+    # out hours billed through hours.rollups.NON_REVENUE_PROFIT_LOSS_ACCOUNTS.
+    revenue_hours = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        blank=True,
+        null=True
+    )
+
+    class Meta:
+        verbose_name = 'Reporting Period Hours'
+        verbose_name_plural = 'Reporting Period Hours'
+        unique_together = ('user', 'reporting_period')
+
+    def __str__(self):
+        return '{} - {}'.format(self.user, self.reporting_period.start_date)
+
+
+class FiscalYearHours(models.Model):
+    """Revenue hours of the employees the dashboard counts, by reporting
+    period and unit, with running totals for the fiscal year to date. Every
+    reporting period of a fiscal year has a row for each unit with hours in
+    it. Kept up to date by hours.rollups from ReportingPeriodHours."""
+    reporting_period = models.ForeignKey(
+        ReportingPeriod,
+        on_delete=models.CASCADE
+    )
+    fiscal_year = models.PositiveSmallIntegerField()
+    unit = models.IntegerField(
+        choices=UserData.UNIT_CHOICES,
+        blank=True,
+        null=True
+    )
+    hours = models.DecimalField(max_digits=9, decimal_places=2)
+    fytd_hours = models.DecimalField(max_digits=11, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'Fiscal Year Hours'
+        verbose_name_plural = 'Fiscal Year Hours'
+        unique_together = ('reporting_period', 'unit')
+        index_together = ('fiscal_year', 'unit')
+
+    def __str__(self):
+        return 'FY{} {} ({})'.format(
+            self.fiscal_year,
+            self.reporting_period.start_date,
+            self.get_unit_display()
+        )
+
+
+class FloatTask(models.Model):
+    """A task scheduled in Float, imported by the `import_float_schedule`
+    management command. Float lists repeating and split tasks once per
+    repetition or part, and tasks of several people once per person, all
+    under the same "task_id"."""
+    task_id = models.PositiveIntegerField()
+    people_id = models.IntegerField()
+    project_id = models.PositiveIntegerField(null=True)
+    project_name = models.CharField(max_length=255, blank=True)
+    task_name = models.CharField(max_length=255, blank=True)
+    hours_pd = models.DecimalField(max_digits=5, decimal_places=2)
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        unique_together = ('task_id', 'people_id', 'start_date', 'end_date')
+        index_together = ('people_id', 'start_date', 'end_date')
+
+    def __str__(self):
+        return '{} ({} - {})'.format(
+            self.project_name, self.start_date, self.end_date)
+
+
+class FloatTimeoff(models.Model):
+    """Time off scheduled in Float, imported by the `import_float_schedule`
+    management command."""
+    timeoff_id = models.PositiveIntegerField(unique=True)
+    people_id = models.IntegerField()
+    hours = models.DecimalField(max_digits=5, decimal_places=2)
+    start_date = models.DateField()
+    end_date = models.DateField()
+
+    class Meta:
+        index_together = ('people_id', 'start_date', 'end_date')
+
+    def __str__(self):
+        return '{} ({} - {})'.format(
+            self.people_id, self.start_date, self.end_date)
+
+
+class FloatHoliday(models.Model):
+    """A holiday in Float, imported by the `import_float_schedule`
+    management command."""
+    holiday_id = models.PositiveIntegerField(unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    date = models.DateField(db_index=True)
+
+    def __str__(self):
+        return '{} ({})'.format(self.name, self.date)
@@ -0,0 +1,150 @@
+"""
+Planned-vs-actual hours of a whole reporting period, by unit and project:
+the hours people were scheduled for in Float (read from the schedule that
+`import_float_schedule` imports) against the hours they submitted in Tock.
+
+Planned hours follow the timecard's Float sidebar (see hours.float): a task
+counts its hours per day on each weekday it shares with the period, and a
+person's tasks are scaled down to fit the hours they can work once holidays
+and time off are taken out. Everything is read with one query per table and
+the date overlaps are counted arithmetically rather than day by day, so the
+whole staff takes a handful of queries.
+
+Float projects are matched to Tock projects by the Float "project_id" stored
+on the Tock project, never by name. Float projects that are not matched to
+a Tock project are listed under their Float name, apart from Tock's.
+"""
+import collections
+
+from django.db.models import Sum
+
+from employees.models import UserData
+from projects.models import Project
+
+from .float import BASE_DAYS_PER_WEEK, BASE_HOURS_PER_DAY
+from .models import FloatHoliday, FloatTask, FloatTimeoff, TimecardObject
+
+HEADER = ['Unit', 'Project', 'Planned Hours', 'Actual Hours', 'Difference']
+UNIT_LABELS = dict(UserData.UNIT_CHOICES)
+
+
+def weekdays_between(start_date, end_date):
+    """ Return the number of weekdays from `start_date` to `end_date`,
+    inclusive. """
+    if end_date < start_date:
+        return 0
+    weeks, days = divmod((end_date - start_date).days + 1, 7)
+    first = start_date.weekday()
+    return weeks * 5 + sum(1 for i in range(days) if (first + i) % 7 < 5)
+
+
+def overlapping_weekdays(start_date, end_date, reporting_period):
+    """ Return the weekdays `start_date` to `end_date` shares with
+    `reporting_period`. """
+    return weekdays_between(
+        max(start_date, reporting_period.start_date),
+        min(end_date, reporting_period.end_date),
+    )
+
+
+def overlapping(queryset, reporting_period):
+    return queryset.filter(
+        start_date__lte=reporting_period.end_date,
+        end_date__gte=reporting_period.start_date,
+    )
+
+
+def planned_hours(reporting_period):
+    """ Return `{(unit, project_id, project_name): hours}` scheduled in
+    Float for `reporting_period`, where `project_id` is the ID of the Tock
+    project the Float project is matched to, or None. """
+    units = dict(
+        UserData.objects.filter(float_people_id__isnull=False)
+        .values_list('float_people_id', 'unit')
+    )
+    projects = {
+        float_project_id: (project_id, name)
+        for float_project_id, project_id, name in Project.objects.filter(
+            float_project_id__isnull=False
+        ).values_list('float_project_id', 'id', 'name')
+    }
+    holidays = FloatHoliday.objects.filter(
+        date__range=(reporting_period.start_date, reporting_period.end_date)
+    ).count()
+    work_days = BASE_DAYS_PER_WEEK - holidays
+
+    hours_off = collections.defaultdict(float)
+    timeoffs = overlapping(FloatTimeoff.objects, reporting_period) \
+        .values_list('people_id', 'hours', 'start_date', 'end_date')
+    for people_id, hours, start_date, end_date in timeoffs:
+        hours_off[people_id] += float(hours) * overlapping_weekdays(
+            start_date, end_date, reporting_period)
+
+    tasks_by_person = collections.defaultdict(list)
+    tasks = overlapping(FloatTask.objects, reporting_period).values_list(
+        'people_id', 'project_id', 'project_name', 'hours_pd', 'start_date',
+        'end_date')
+    for (people_id, float_project_id, project_name, hours_pd, start_date,
+         end_date) in tasks:
+        tasks_by_person[people_id].append((
+            projects.get(float_project_id, (None, project_name)),
+            float(hours_pd) * overlapping_weekdays(
+                start_date, end_date, reporting_period)
+        ))
+
+    planned = collections.defaultdict(float)
+    for people_id, tasks in tasks_by_person.items():
+        work_hours = work_days * BASE_HOURS_PER_DAY - hours_off[people_id]
+        task_hours = sum(hours for _, hours in tasks)
+        scale = 1.0
+        if task_hours > work_hours:
+            scale = max(work_hours, 0) / task_hours
+        unit = units.get(people_id)
+        for (project_id, project_name), hours in tasks:
+            planned[(unit, project_id, project_name)] += hours * scale
+    return planned
+
+
+def actual_hours(reporting_period):
+    """ Return `{(unit, project_id, project_name): hours}` submitted in
+    Tock for `reporting_period`. """
+    rows = TimecardObject.objects.filter(
+        timecard__reporting_period=reporting_period,
+        timecard__submitted=True,
+    ).values_list(
+        'timecard__user__user_data__unit',
+        'project_id',
+        'project__name',
+    ).annotate(hours=Sum('hours_spent')).order_by()
+    return {
+        (unit, project_id, project_name): float(hours)
+        for unit, project_id, project_name, hours in rows
+        if hours is not None
+    }
+
+
+def planned_vs_actual(reporting_period):
+    """ Return the rows of the planned-vs-actual report of
+    `reporting_period`, ordered by unit and project, Tock projects before
+    unmatched Float projects of the same name. """
+    planned = planned_hours(reporting_period)
+    actual = actual_hours(reporting_period)
+
+    rows = []
+    keys = sorted(
+        set(planned) | set(actual),
+        key=lambda key: (
+            UNIT_LABELS.get(key[0], ''), key[2], key[1] is None)
+    )
+    for key in keys:
+        unit, _, project_name = key
+        planned_total = round(planned.get(key, 0), 2)
+        actual_total = round(actual.get(key, 0), 2)
+        rows.append([
+            UNIT_LABELS.get(unit, ''),
+            project_name,
+            planned_total,
+            actual_total,
+            round(actual_total - planned_total, 2),
+        ])
+    return rows
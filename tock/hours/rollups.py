@@ -0,0 +1,587 @@
+"""
+Maintains the rollups of submitted hours: QuarterlyHours, by fiscal
+quarter, user and billability, which the hours_by_quarter API endpoints
+read; ReportingPeriodHours, by user and reporting period, which the
+utilization views read; and FiscalYearHours, the fiscal-year-to-date
+series of revenue hours by unit that the dashboard reads.
+
+Rather than applying deltas, a change to a timecard or one of its line
+items recomputes the rollup rows of that timecard's user and quarter and
+of the timecard itself, so re-opened and edited timecards are always
+counted as they currently stand. The series is shared by everyone in a
+unit, so the change in the timecard's revenue hours is added to it in
+place instead, which keeps concurrent submissions in the same unit from
+overwriting each other.
+"""
+import collections
+import contextlib
+import datetime
+import threading
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Max, Q, Sum, When
+
+from api.conditional import validators
+from api.models import ModelVersion
+from employees.models import UserData
+
+from .models import (
+    FiscalYearHours, QuarterlyHours, ReportingPeriod, ReportingPeriodHours,
+    Timecard, TimecardObject,
+)
+
+# Fiscal years start on October 1st; Oct-Dec is Q1 of the next year.
+FISCAL_YEAR_START_MONTH = 10
+
+# Billable hours on these profit/loss accounts do not count towards revenue.
+NON_REVENUE_PROFIT_LOSS_ACCOUNTS = ('FY17 Acquisition Svcs Billable',)
+
+HOURS_FIELD = DecimalField(max_digits=9, decimal_places=2)
+
+# The dashboard leaves out these units.
+DASHBOARD_EXCLUDED_UNITS = (4, 9, 14, 15)
+
+# Seconds the dashboard's unit figures are cached for, at most; see
+# dashboard_units().
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+
+# The timecards changed inside the current batch(), if any.
+_batch = threading.local()
+
+
+def fiscal_quarter(date):
+    """ Return the `(fiscal_year, quarter)` that `date` falls in. """
+    fiscal_year = date.year
+    if date.month >= FISCAL_YEAR_START_MONTH:
+        fiscal_year += 1
+    quarter = (date.month - FISCAL_YEAR_START_MONTH) % 12 // 3 + 1
+    return fiscal_year, quarter
+
+
+def quarter_dates(fiscal_year, quarter):
+    """ Return the first day of the quarter and of the next quarter. """
+    month = (FISCAL_YEAR_START_MONTH - 1 + (quarter - 1) * 3) % 12 + 1
+    year = fiscal_year - 1 if month >= FISCAL_YEAR_START_MONTH else fiscal_year
+    start = datetime.date(year, month, 1)
+    if quarter == 4:
+        return start, datetime.date(fiscal_year, FISCAL_YEAR_START_MONTH, 1)
+    return start, quarter_dates(fiscal_year, quarter + 1)[0]
+
+
+def submitted_hours(timecard_objects):
+    """
+    Sum the submitted hours of `timecard_objects` into a
+    `{(fiscal_year, quarter, user_id, billable): hours}` dict. Hours are
+    summed per reporting period in the database and folded into quarters
+    here, which works on any database backend.
+    """
+    rows = timecard_objects.filter(timecard__submitted=True).values_list(
+        'timecard__reporting_period__start_date',
+        'timecard__user_id',
+        'project__accounting_code__billable',
+    ).annotate(hours=Sum('hours_spent')).order_by()
+
+    totals = collections.defaultdict(int)
+    for start_date, user_id, billable, hours in rows:
+        if billable is None or hours is None:
+            # Projects without an accounting code, and line items without
+            # hours, are not counted.
+            continue
+        key = fiscal_quarter(start_date) + (user_id, billable)
+        totals[key] += hours
+    return totals
+
+
+def refresh_quarter(user_id, date):
+    """ Recompute the rollup rows of a user for the quarter of `date`. """
+    refresh_quarter_users(fiscal_quarter(date), [user_id])
+
+
+def refresh_quarter_users(fiscal_year_quarter, user_ids):
+    """ Recompute the rollup rows of users for a `(fiscal_year, quarter)`.
+    """
+    fiscal_year, quarter = fiscal_year_quarter
+    start, end = quarter_dates(fiscal_year, quarter)
+    totals = submitted_hours(TimecardObject.objects.filter(
+        timecard__user_id__in=user_ids,
+        timecard__reporting_period__start_date__gte=start,
+        timecard__reporting_period__start_date__lt=end,
+    ))
+
+    with transaction.atomic():
+        QuarterlyHours.objects.filter(
+            fiscal_year=fiscal_year, quarter=quarter, user_id__in=user_ids
+        ).delete()
+        QuarterlyHours.objects.bulk_create(
+            QuarterlyHours(
+                fiscal_year=fiscal_year,
+                quarter=quarter,
+                user_id=user_id,
+                billable=billable,
+                hours=hours,
+            )
+            for (_, _, user_id, billable), hours in totals.items()
+        )
+
+
+def period_hours(timecard_objects, rollup_model=ReportingPeriodHours):
+    """
+    Sum the submitted hours of `timecard_objects` by user and reporting
+    period into unsaved `rollup_model` rows, with the unit and grade of the
+    user as they currently stand.
+    """
+    billable = Q(project__accounting_code__billable=True)
+    revenue = billable & ~Q(
+        project__profit_loss_account__name__in=NON_REVENUE_PROFIT_LOSS_ACCOUNTS
+    )
+    rows = timecard_objects.filter(timecard__submitted=True).values_list(
+        'timecard__user_id',
+        'timecard__reporting_period_id',
+        'timecard__user__user_data__unit',
+    ).annotate(
+        grade=Max('grade__grade'),
+        total_hours=Sum('hours_spent', output_field=HOURS_FIELD),
+        billable_hours=Sum(
+            Case(When(billable, then=F('hours_spent'))),
+            output_field=HOURS_FIELD
+        ),
+        revenue_hours=Sum(
+            Case(When(revenue, then=F('hours_spent'))),
+            output_field=HOURS_FIELD
+        ),
+    ).order_by()
+    return [
+        rollup_model(
+            user_id=user_id,
+            reporting_period_id=reporting_period_id,
+            unit=unit,
+            grade=grade,
+            total_hours=total_hours,
+            billable_hours=billable_hours,
+            revenue_hours=revenue_hours,
+        )
+        for (user_id, reporting_period_id, unit, grade, total_hours,
+             billable_hours, revenue_hours) in rows
+    ]
+
+
+def keep_units(rows, existing):
+    """ Give the unsaved `rows` the units recorded on the rows of
+    `existing` for the same user and reporting period: the unit is a
+    snapshot of where the user stood when the timecard was submitted, and
+    recomputing hours does not move them. """
+    units = {
+        (user_id, reporting_period_id): unit
+        for user_id, reporting_period_id, unit in existing.values_list(
+            'user_id', 'reporting_period_id', 'unit')
+    }
+    for row in rows:
+        row.unit = units.get((row.user_id, row.reporting_period_id), row.unit)
+    return rows
+
+
+def refresh_period(user_id, reporting_period_id, submitted=True):
+    """ Recompute the rollup row of a user for a reporting period, and
+    return by how much its revenue hours changed. Only submitted timecards
+    are rolled up, so there is nothing to sum unless the timecard is
+    `submitted`. """
+    if not submitted:
+        existing = ReportingPeriodHours.objects.filter(
+            user_id=user_id, reporting_period_id=reporting_period_id
+        )
+        revenue_hours = existing.values_list(
+            'revenue_hours', flat=True).first() or 0
+        existing.delete()
+        return -revenue_hours
+    return refresh_period_users(reporting_period_id, [user_id])[user_id]
+
+
+def refresh_period_users(reporting_period_id, user_ids):
+    """ Recompute the rollup rows of users for a reporting period from
+    their submitted hours, and return a `{user_id: change}` dict of how
+    much each one's revenue hours changed. """
+    existing = ReportingPeriodHours.objects.filter(
+        user_id__in=user_ids, reporting_period_id=reporting_period_id
+    )
+    revenue_hours = dict(existing.values_list('user_id', 'revenue_hours'))
+    rows = keep_units(period_hours(TimecardObject.objects.filter(
+        timecard__user_id__in=user_ids,
+        timecard__reporting_period_id=reporting_period_id,
+    )), existing)
+    with transaction.atomic():
+        existing.delete()
+        ReportingPeriodHours.objects.bulk_create(rows)
+
+    changes = {
+        user_id: -(revenue_hours.get(user_id) or 0) for user_id in user_ids
+    }
+    for row in rows:
+        changes[row.user_id] += row.revenue_hours or 0
+    return changes
+
+
+@contextlib.contextmanager
+def batch():
+    """ Refresh the rollup rows of each timecard changed inside the block
+    once, when it ends, instead of on every change to the timecard and its
+    line items. Blocks nested in another one are part of it. """
+    if getattr(_batch, 'timecard_ids', None) is not None:
+        yield
+        return
+    _batch.timecard_ids = timecard_ids = collections.OrderedDict()
+    try:
+        yield
+    finally:
+        _batch.timecard_ids = None
+    for timecard_id in timecard_ids:
+        refresh_timecard(timecard_id)
+
+
+def refresh_timecard(timecard_id):
+    """ Recompute the rollup rows a timecard counts towards, or inside a
+    batch(), when it ends. """
+    timecard_ids = getattr(_batch, 'timecard_ids', None)
+    if timecard_ids is not None:
+        timecard_ids[timecard_id] = True
+        return
+    timecard = Timecard.objects.filter(id=timecard_id).values_list(
+        'user_id', 'reporting_period_id', 'reporting_period__start_date',
+        'submitted'
+    ).first()
+    if timecard is not None:
+        user_id, reporting_period_id, start_date, submitted = timecard
+        refresh_quarter(user_id, start_date)
+        add_fiscal_year_hours(
+            user_id, reporting_period_id, start_date,
+            refresh_period(user_id, reporting_period_id, submitted)
+        )
+
+
+def dashboard_employees(queryset, prefix=''):
+    """ Narrow `queryset` to the employees the dashboard counts: current
+    18F employees outside DASHBOARD_EXCLUDED_UNITS. `prefix` leads from the
+    queryset's model to UserData. """
+    return queryset.filter(**{
+        prefix + 'is_18f_employee': True,
+        prefix + 'current_employee': True,
+    }).exclude(**{prefix + 'unit__in': DASHBOARD_EXCLUDED_UNITS})
+
+
+def counts_on_dashboard(unit, is_18f_employee, current_employee):
+    """ Whether the dashboard counts an employee; see dashboard_employees.
+    """
+    return (is_18f_employee and current_employee
+            and unit not in DASHBOARD_EXCLUDED_UNITS)
+
+
+def dashboard_units(reporting_period):
+    """
+    Return what the dashboard needs to compare units for a reporting
+    period, read with one query of the employees it counts and one of the
+    fiscal year series for every unit at once:
+
+    - `units`: the `(unit, name)` of the units employees are in, by name
+    - `missing_units`: the UserData of employees without a unit
+    - `employees`: the number of employees by unit
+    - `hours`: the `(hours, fytd_hours)` by unit
+
+    The result is cached under the versions of the series and the
+    employees (see api.conditional.validators), which change once a change
+    to either commits, so moving between units and periods already looked
+    at only reads the versions.
+    """
+    key = 'hours:dashboard-units:{}:{}'.format(
+        validators((FiscalYearHours, UserData), 'dashboard_units')[0],
+        reporting_period.id
+    )
+    units = cache.get(key)
+    if units is not None:
+        return units
+
+    employees = collections.Counter()
+    names = {}
+    missing_units = []
+    for user_data in dashboard_employees(
+            UserData.objects.all()):
+        employees[user_data.unit] += 1
+        if user_data.unit is not None:
+            names[user_data.unit] = user_data.get_unit_display()
+        else:
+            missing_units.append(user_data)
+
+    units = {
+        'units': sorted(names.items(), key=lambda unit: unit[1]),
+        'missing_units': missing_units,
+        'employees': dict(employees),
+        'hours': {
+            unit: (hours, fytd_hours) for unit, hours, fytd_hours
+            in FiscalYearHours.objects.filter(
+                reporting_period=reporting_period
+            ).values_list('unit', 'hours', 'fytd_hours')
+        },
+    }
+    cache.set(key, units, DASHBOARD_CACHE_TIMEOUT)
+    return units
+
+
+def invalidate_dashboard_units():
+    """ Bump the version of the series once the current transaction
+    commits. Its rows are written with update() and bulk_create(), which
+    send no signals to bump it. """
+    ModelVersion.bump(FiscalYearHours._meta.label_lower)
+
+
+def fiscal_year_hours(fiscal_year, reporting_period_hours,
+                      rollup_model=FiscalYearHours):
+    """
+    Build the unsaved `rollup_model` rows of a fiscal year from the
+    revenue hours of `reporting_period_hours`, a ReportingPeriodHours
+    queryset: a row
+    for every reporting period of the year and every unit, as it currently
+    stands, of employees the dashboard counts with hours in the year.
+    """
+    start = quarter_dates(fiscal_year, 1)[0]
+    end = quarter_dates(fiscal_year, 4)[1]
+    reporting_period_model = rollup_model._meta.get_field(
+        'reporting_period').related_model
+
+    rows = dashboard_employees(
+        reporting_period_hours, 'user__user_data__'
+    ).filter(
+        reporting_period__start_date__gte=start,
+        reporting_period__start_date__lt=end,
+    ).values_list(
+        'reporting_period_id',
+        'user__user_data__unit',
+    ).annotate(hours=Sum('revenue_hours')).order_by()
+    hours = {
+        (reporting_period_id, unit): hours
+        for reporting_period_id, unit, hours in rows
+    }
+
+    reporting_periods = reporting_period_model.objects.filter(
+        start_date__gte=start,
+        start_date__lt=end,
+    ).order_by('start_date').values_list('id', flat=True)
+    series = []
+    for unit in set(unit for _, unit in hours):
+        fytd_hours = 0
+        for reporting_period_id in reporting_periods:
+            unit_hours = hours.get((reporting_period_id, unit)) or 0
+            fytd_hours += unit_hours
+            series.append(rollup_model(
+                reporting_period_id=reporting_period_id,
+                fiscal_year=fiscal_year,
+                unit=unit,
+                hours=unit_hours,
+                fytd_hours=fytd_hours,
+            ))
+    return series
+
+
+def create_fiscal_year_series(fiscal_year, unit, fytd_hours=0,
+                              **filters):
+    """ Create the rows of a unit's series for the reporting periods of a
+    fiscal year, narrowed by `filters`, that it does not have yet, with no
+    hours. Rows created in the meantime by a concurrent submission are left
+    as they are. """
+    start = quarter_dates(fiscal_year, 1)[0]
+    end = quarter_dates(fiscal_year, 4)[1]
+    series = FiscalYearHours.objects.filter(
+        fiscal_year=fiscal_year, unit=unit)
+    rows = [
+        FiscalYearHours(
+            reporting_period_id=reporting_period_id,
+            fiscal_year=fiscal_year,
+            unit=unit,
+            hours=0,
+            fytd_hours=fytd_hours,
+        )
+        for reporting_period_id in ReportingPeriod.objects.filter(
+            start_date__gte=start,
+            start_date__lt=end,
+            **filters
+        ).exclude(
+            id__in=series.values('reporting_period_id')
+        ).values_list('id', flat=True)
+    ]
+    try:
+        with transaction.atomic():
+            FiscalYearHours.objects.bulk_create(rows)
+    except IntegrityError:
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    row.save()
+            except IntegrityError:
+                pass
+
+
+def add_fiscal_year_hours(user_id, reporting_period_id, start_date, hours):
+    """ Add `hours` of a user for a reporting period to the series of the
+    user's unit, if the dashboard counts the user. The rows are updated in
+    place, so that concurrent submissions in the same unit add up. """
+    if not hours:
+        return
+    user_data = dashboard_employees(
+        UserData.objects.filter(user_id=user_id)
+    ).values_list('unit').first()
+    if user_data is not None:
+        add_unit_fiscal_year_hours(
+            user_data[0], reporting_period_id, start_date, hours)
+
+
+def add_unit_fiscal_year_hours(unit, reporting_period_id, start_date, hours):
+    """ Add `hours` for a reporting period to the series of a unit. """
+    if not hours:
+        return
+    fiscal_year = fiscal_quarter(start_date)[0]
+    series = FiscalYearHours.objects.filter(
+        fiscal_year=fiscal_year, unit=unit)
+    with transaction.atomic():
+        if not series.filter(reporting_period_id=reporting_period_id).exists():
+            create_fiscal_year_series(fiscal_year, unit)
+        series.filter(reporting_period_id=reporting_period_id).update(
+            hours=F('hours') + hours)
+        series.filter(reporting_period__start_date__gte=start_date).update(
+            fytd_hours=F('fytd_hours') + hours)
+    invalidate_dashboard_units()
+
+
+def add_fiscal_year_period(reporting_period):
+    """ Give a new reporting period its row, with no hours, in the series of
+    every unit for its fiscal year. """
+    fiscal_year = fiscal_quarter(reporting_period.start_date)[0]
+    units = FiscalYearHours.objects.filter(
+        fiscal_year=fiscal_year
+    ).values_list('unit', flat=True).distinct()
+    for unit in list(units):
+        fytd_hours = FiscalYearHours.objects.filter(
+            fiscal_year=fiscal_year,
+            unit=unit,
+            reporting_period__start_date__lt=reporting_period.start_date,
+        ).order_by('-reporting_period__start_date').values_list(
+            'fytd_hours', flat=True
+        ).first() or 0
+        create_fiscal_year_series(
+            fiscal_year, unit, fytd_hours, id=reporting_period.id)
+    invalidate_dashboard_units()
+
+
+def refresh_timecards(timecards):
+    """ Recompute the rollup rows of the submitted timecards of
+    `timecards`, a Timecard queryset, together: for when something that
+    decides how their hours are counted, such as the accounting code of a
+    project they have hours on, changes. """
+    timecards = list(timecards.filter(submitted=True).values_list(
+        'user_id', 'reporting_period_id', 'reporting_period__start_date'
+    ))
+    quarters = collections.defaultdict(set)
+    periods = collections.defaultdict(set)
+    start_dates = {}
+    for user_id, reporting_period_id, start_date in timecards:
+        quarters[fiscal_quarter(start_date)].add(user_id)
+        periods[reporting_period_id].add(user_id)
+        start_dates[reporting_period_id] = start_date
+
+    for fiscal_year_quarter, user_ids in quarters.items():
+        refresh_quarter_users(fiscal_year_quarter, user_ids)
+
+    units = dict(dashboard_employees(UserData.objects.filter(
+        user_id__in=set(user_id for user_id, _, _ in timecards)
+    )).values_list('user_id', 'unit'))
+    unit_hours = collections.defaultdict(int)
+    for reporting_period_id, user_ids in periods.items():
+        changes = refresh_period_users(reporting_period_id, user_ids)
+        for user_id, change in changes.items():
+            if user_id in units:
+                unit_hours[units[user_id], reporting_period_id] += change
+    for (unit, reporting_period_id), hours in unit_hours.items():
+        add_unit_fiscal_year_hours(
+            unit, reporting_period_id, start_dates[reporting_period_id],
+            hours)
+
+
+def rebuild(timecard_object_model=TimecardObject,
+            rollup_model=QuarterlyHours):
+    """ Recompute the whole rollup. The models can be swapped for their
+    historical versions in migrations. """
+    totals = submitted_hours(timecard_object_model.objects.all())
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        rollup_model.objects.bulk_create(
+            rollup_model(
+                fiscal_year=fiscal_year,
+                quarter=quarter,
+                user_id=user_id,
+                billable=billable,
+                hours=hours,
+            )
+            for (fiscal_year, quarter, user_id, billable), hours
+            in totals.items()
+        )
+
+
+def rebuild_periods(timecard_object_model=TimecardObject,
+                    rollup_model=ReportingPeriodHours):
+    """ Recompute the whole reporting period rollup. Rows keep the unit
+    they were recorded with; new rows take the unit the user currently
+    stands in. The models can be swapped for their historical versions in
+    migrations. """
+    rows = keep_units(
+        period_hours(timecard_object_model.objects.all(), rollup_model),
+        rollup_model.objects.all()
+    )
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        rollup_model.objects.bulk_create(rows)
+
+
+def refresh_unit_series(units):
+    """ Recompute the series of `units` for every fiscal year, as when an
+    employee moves between them. """
+    def in_units(prefix=''):
+        lookup = Q(**{prefix + 'unit__in': [
+            unit for unit in units if unit is not None
+        ]})
+        if None in units:
+            lookup |= Q(**{prefix + 'unit__isnull': True})
+        return lookup
+
+    fiscal_years = set(
+        fiscal_quarter(start_date)[0] for start_date
+        in ReportingPeriod.objects.values_list('start_date', flat=True)
+    )
+    rows = []
+    for fiscal_year in sorted(fiscal_years):
+        rows.extend(fiscal_year_hours(
+            fiscal_year,
+            ReportingPeriodHours.objects.filter(in_units('user__user_data__'))
+        ))
+    with transaction.atomic():
+        FiscalYearHours.objects.filter(in_units()).delete()
+        FiscalYearHours.objects.bulk_create(rows)
+    invalidate_dashboard_units()
+
+
+def rebuild_fiscal_years(period_hours_model=ReportingPeriodHours,
+                         rollup_model=FiscalYearHours):
+    """ Recompute the series of every fiscal year. The models can be
+    swapped for their historical versions in migrations. """
+    reporting_period_model = rollup_model._meta.get_field(
+        'reporting_period').related_model
+    fiscal_years = set(
+        fiscal_quarter(start_date)[0] for start_date
+        in reporting_period_model.objects.values_list('start_date', flat=True)
+    )
+    rows = []
+    for fiscal_year in sorted(fiscal_years):
+        rows.extend(fiscal_year_hours(
+            fiscal_year, period_hours_model.objects.all(), rollup_model
+        ))
+    with transaction.atomic():
+        rollup_model.objects.all().delete()
+        rollup_model.objects.bulk_create(rows)
+    if rollup_model is FiscalYearHours:
+        invalidate_dashboard_units()
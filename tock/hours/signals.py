@@ -0,0 +1,242 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from employees.models import EmployeeGrade, UserData
+from projects.models import AccountingCode, Agency, ProfitLossAccount, Project
+
+from . import rollups, snapshots
+from .models import (
+    ReportingPeriod, ReportingPeriodHours, Timecard, TimecardObject,
+    TimecardObjectTombstone, timecard_objects_saved,
+)
+
+
+# Fields whose previous values are recorded on save, for the handlers below
+# to tell what a save changed.
+TRACKED_FIELDS = {
+    AccountingCode: ('billable',),
+    ProfitLossAccount: ('name',),
+    Project: ('accounting_code_id', 'profit_loss_account_id'),
+    ReportingPeriod: ('start_date',),
+    Timecard: ('submitted',),
+    User: ('username',),
+    UserData: ('unit', 'is_18f_employee', 'current_employee'),
+}
+
+
+def record_tracked_fields(sender, instance, raw=False, update_fields=None,
+                          **kwargs):
+    fields = TRACKED_FIELDS[sender]
+    instance._tracked_fields = {}
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    if raw or instance.pk is None:
+        return
+    values = sender.objects.filter(
+        pk=instance.pk).values_list(*fields).first()
+    if values is not None:
+        instance._tracked_fields = dict(zip(fields, values))
+
+
+def changed_fields(instance):
+    """Return the TRACKED_FIELDS the last save of `instance` changed, with
+    their previous values."""
+    return {
+        field: value
+        for field, value in getattr(instance, '_tracked_fields', {}).items()
+        if getattr(instance, field) != value
+    }
+
+
+for model in TRACKED_FIELDS:
+    pre_save.connect(record_tracked_fields, sender=model)
+
+
+@receiver(post_save, sender=Timecard)
+def sync_timecard_objects(sender, instance, created, raw=False, **kwargs):
+    """Carry a change to the timecard's submitted status over to all of its
+    line items, and mark them as modified so incremental syncs pick them
+    up. Reopening a timecard takes its line items out of the submitted
+    rows of the API, so they are recorded as withdrawn."""
+    if created or raw or 'submitted' not in changed_fields(instance):
+        return
+    instance.timecardobjects.update(
+        submitted=instance.submitted,
+        modified=timezone.now()
+    )
+    if not instance.submitted:
+        TimecardObjectTombstone.objects.bulk_create(
+            TimecardObjectTombstone(
+                timecard_object_id=timecard_object_id,
+                timecard_id=instance.id,
+                withdrawn=True
+            )
+            for timecard_object_id
+            in instance.timecardobjects.values_list('id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=TimecardObject)
+def record_timecard_object_deletion(sender, instance, **kwargs):
+    TimecardObjectTombstone.objects.create(
+        timecard_object_id=instance.id,
+        timecard_id=instance.timecard_id
+    )
+
+
+@receiver(post_save, sender=TimecardObject)
+@receiver(post_delete, sender=TimecardObject)
+def invalidate_timecard_object_snapshots(sender, instance, **kwargs):
+    reporting_period_id = Timecard.objects.filter(
+        id=instance.timecard_id
+    ).values_list('reporting_period_id', flat=True).first()
+    if reporting_period_id is not None:
+        snapshots.invalidate_period(reporting_period_id)
+
+
+@receiver(post_save, sender=Timecard)
+@receiver(post_delete, sender=Timecard)
+def invalidate_timecard_snapshots(sender, instance, **kwargs):
+    snapshots.invalidate_period(instance.reporting_period_id)
+
+
+@receiver(timecard_objects_saved)
+def invalidate_timecard_objects_snapshots(sender, timecard, **kwargs):
+    snapshots.invalidate_period(timecard.reporting_period_id)
+
+
+@receiver(post_save, sender=ReportingPeriod)
+def invalidate_reporting_period_snapshots(sender, instance, **kwargs):
+    snapshots.invalidate_period(instance.id)
+
+
+def invalidate_all_snapshots(sender, instance, signal, created=False,
+                             **kwargs):
+    """Exports include project, account and user details, so changes to
+    those invalidate every snapshot. Of users, only their username and
+    unit are exported."""
+    if signal is post_save and not created and sender in (User, UserData):
+        if not {'username', 'unit'} & set(changed_fields(instance)):
+            return
+    snapshots.invalidate_all()
+
+
+for model in (AccountingCode, Agency, EmployeeGrade, ProfitLossAccount,
+              Project, User, UserData):
+    post_save.connect(invalidate_all_snapshots, sender=model)
+    post_delete.connect(invalidate_all_snapshots, sender=model)
+
+
+@receiver(post_save, sender=Timecard)
+def refresh_timecard_rollups(sender, instance, created, **kwargs):
+    # New timecards have no line items to count yet, and otherwise only
+    # their submitted status decides whether they are counted.
+    if not created and 'submitted' in changed_fields(instance):
+        rollups.refresh_timecard(instance.id)
+
+
+@receiver(post_delete, sender=Timecard)
+def refresh_deleted_timecard_rollups(sender, instance, **kwargs):
+    start_date = ReportingPeriod.objects.filter(
+        id=instance.reporting_period_id
+    ).values_list('start_date', flat=True).first()
+    if start_date is not None:
+        rollups.refresh_quarter(instance.user_id, start_date)
+    hours = rollups.refresh_period(
+        instance.user_id, instance.reporting_period_id, submitted=False)
+    if start_date is not None:
+        rollups.add_fiscal_year_hours(
+            instance.user_id, instance.reporting_period_id, start_date, hours)
+
+
+@receiver(post_save, sender=TimecardObject)
+def refresh_timecard_object_rollups(sender, instance, **kwargs):
+    # Line items of unsubmitted timecards are not counted.
+    if instance.submitted:
+        rollups.refresh_timecard(instance.timecard_id)
+
+
+@receiver(timecard_objects_saved)
+def refresh_timecard_objects_rollups(sender, timecard, **kwargs):
+    if timecard.submitted:
+        rollups.refresh_timecard(timecard.id)
+
+
+@receiver(post_delete, sender=TimecardObject)
+def refresh_deleted_timecard_object_rollups(sender, instance, **kwargs):
+    rollups.refresh_timecard(instance.timecard_id)
+
+
+def refresh_changed_rollups(sender, instance, created, raw=False, **kwargs):
+    """Recompute the rollup rows of the timecards a change to how hours are
+    counted moves hours for, and only those: billability comes from the
+    accounting code of the project, revenue from its profit/loss account,
+    and the quarter from the reporting period."""
+    changed = changed_fields(instance)
+    if created or raw or not changed:
+        return
+
+    if sender is ReportingPeriod:
+        # Hours move between quarters and fiscal years; this hardly ever
+        # happens.
+        rollups.rebuild()
+        rollups.rebuild_fiscal_years()
+        return
+    if sender is ProfitLossAccount:
+        names = {changed['name'], instance.name}
+        if not names & set(rollups.NON_REVENUE_PROFIT_LOSS_ACCOUNTS):
+            return
+        timecards = Timecard.objects.filter(
+            timecardobjects__project__profit_loss_account=instance)
+    elif sender is AccountingCode:
+        timecards = Timecard.objects.filter(
+            timecardobjects__project__accounting_code=instance)
+    else:
+        timecards = Timecard.objects.filter(timecardobjects__project=instance)
+    rollups.refresh_timecards(timecards.distinct())
+
+
+for model in (AccountingCode, ProfitLossAccount, Project, ReportingPeriod):
+    post_save.connect(refresh_changed_rollups, sender=model)
+
+
+@receiver(post_save, sender=ReportingPeriod)
+def extend_fiscal_year_rollup(sender, instance, created, raw=False,
+                              **kwargs):
+    """Give a new reporting period its place in the fiscal year series."""
+    if created and not raw:
+        rollups.add_fiscal_year_period(instance)
+
+
+@receiver(post_save, sender=UserData)
+@receiver(post_delete, sender=UserData)
+def refresh_unit_series(sender, instance, signal, created=False, raw=False,
+                        **kwargs):
+    """The fiscal year series and the dashboard's employee counts go by
+    employees' current unit and status, so a change to those moves the
+    employee's hours from the series of one unit to another."""
+    if raw:
+        return
+    current = {
+        field: getattr(instance, field) for field in TRACKED_FIELDS[UserData]
+    }
+    if signal is post_delete:
+        before, after = current, None
+    elif created:
+        before, after = None, current
+    else:
+        before, after = dict(current, **changed_fields(instance)), current
+
+    units = [
+        {values['unit']}
+        if values is not None and rollups.counts_on_dashboard(**values)
+        else set()
+        for values in (before, after)
+    ]
+    if units[0] == units[1]:
+        return
+    rollups.invalidate_dashboard_units()
+    if ReportingPeriodHours.objects.filter(user_id=instance.user_id).exists():
+        rollups.refresh_unit_series(units[0] | units[1])
@@ -0,0 +1,143 @@
+"""
+Gzipped CSV snapshots of timecard exports for closed reporting periods.
+
+Once a reporting period has ended its rows rarely change, so exports write
+each closed period's rows to a file on local disk once and serve them from
+there afterwards, querying the database only for periods that are still
+open. A snapshot is named by its period's ReportingPeriodSnapshot key;
+saving or deleting anything the rows are built from deletes that key (see
+hours.signals), and the next export writes a new snapshot.
+"""
+import datetime
+import glob
+import gzip
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import StreamingHttpResponse
+
+from api.compiled import compile_serializer
+from api.renderers import generate_csv
+
+from .models import ReportingPeriod, ReportingPeriodSnapshot
+
+CHUNK_SIZE = 64 * 1024
+
+
+def invalidate_period(reporting_period_id):
+    ReportingPeriodSnapshot.objects.filter(
+        reporting_period_id=reporting_period_id
+    ).delete()
+
+
+def invalidate_all():
+    ReportingPeriodSnapshot.objects.all().delete()
+
+
+def closed_periods(today=None):
+    """
+    Return `(reporting_period_id, key)` pairs for every period that ended
+    before `today`, ordered by start date, creating missing keys.
+    """
+    today = today or datetime.date.today()
+    periods = list(
+        ReportingPeriod.objects.filter(end_date__lt=today)
+        .order_by('start_date')
+        .values_list('id', 'snapshot__key')
+    )
+    closed = []
+    for period_id, key in periods:
+        if key is None:
+            key = snapshot_key(period_id)
+        closed.append((period_id, key))
+    return closed
+
+
+def snapshot_key(reporting_period_id):
+    try:
+        snapshot, _ = ReportingPeriodSnapshot.objects.get_or_create(
+            reporting_period_id=reporting_period_id
+        )
+    except IntegrityError:
+        snapshot = ReportingPeriodSnapshot.objects.get(
+            reporting_period_id=reporting_period_id
+        )
+    return snapshot.key
+
+
+def snapshot_path(name, reporting_period_id, key, build):
+    """
+    Return the path of the `name` snapshot of a period, first writing it
+    from the text chunks yielded by `build()` if it does not exist yet.
+    Snapshots of the period under older keys are removed.
+    """
+    directory = os.path.join(settings.EXPORT_SNAPSHOT_DIR, name)
+    path = os.path.join(
+        directory, '{}-{}.csv.gz'.format(reporting_period_id, key.hex)
+    )
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, \
+                gzip.GzipFile(fileobj=raw, mode='wb') as output:
+            for chunk in build():
+                output.write(chunk.encode('utf-8'))
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    pattern = os.path.join(directory, '{}-*.csv.gz'.format(reporting_period_id))
+    for stale in glob.glob(pattern):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def read_snapshot(path):
+    with gzip.open(path, 'rb') as snapshot:
+        for chunk in iter(lambda: snapshot.read(CHUNK_SIZE), b''):
+            yield chunk
+
+
+def stream_snapshot_csv(name, queryset, serializer_class, today=None):
+    """
+    Stream `queryset` (TimecardObjects ordered by reporting period) as CSV
+    through the compiled `serializer_class`, reading closed periods from
+    their `name` snapshots and querying only the open ones. `queryset` must
+    be the same whenever `name` is, apart from the serializer's fields.
+    """
+    compiled = compile_serializer(serializer_class, queryset.model)
+    name = '{}-{}'.format(name, hashlib.sha1(
+        ','.join(compiled.fields).encode('utf-8')
+    ).hexdigest()[:10])
+    today = today or datetime.date.today()
+    closed = closed_periods(today)
+
+    def rows(queryset):
+        return generate_csv(
+            map(compiled.to_row, compiled.values(queryset).iterator())
+        )
+
+    def content():
+        yield from generate_csv([compiled.fields])
+        for period_id, key in closed:
+            yield from read_snapshot(snapshot_path(
+                name, period_id, key, lambda: rows(queryset.filter(
+                    timecard__reporting_period_id=period_id
+                ))
+            ))
+        yield from rows(queryset.filter(
+            timecard__reporting_period__end_date__gte=today
+        ))
+
+    return StreamingHttpResponse(content(), content_type='text/csv')
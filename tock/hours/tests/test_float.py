@@ -1,12 +1,36 @@
 import datetime as dt
+import io
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
 
-from employees.models import UserData
+from employees.models import FloatPerson, UserData
+from hours.models import FloatHoliday, FloatTask, FloatTimeoff
+from tock.utils import get_float_data
 
 from ..float import *
 
+
+def float_json(endpoint):
+    return get_float_data(endpoint).json()
+
+
+def float_tasks(float_people_id):
+    return flatten([
+        i['tasks'] for i in float_json('tasks')['people']
+        if int(i['people_id']) == float_people_id
+    ])
+
+
+def float_timeoffs(float_people_id):
+    return [
+        i for i in float_json('timeoffs')['timeoffs']
+        if int(i['people_id']) == float_people_id
+    ]
+
+
 class FloatTests(TestCase):
 
     def test_find_common_weekdays(self):
@@ -18,15 +42,13 @@ class FloatTests(TestCase):
         range_two = (dt.date(2016, 8, 29), dt.date(2016, 9, 30))
         self.assertEqual(len(find_common_weekdays(range_one, range_two)), 0)
 
-    def test_get_float_tasks(self):
-        start_date = dt.date(2016, 10, 5)
-        float_people_id = 755802
-        self.assertEqual(len(get_float_tasks(start_date, float_people_id)), 2)
-
     def test_get_float_people_id(self):
         user = User.objects.create(username='6cfl4j.c4drwz')
         userdata = UserData.objects.create(user=user)
-        # Test get from Float by Tock username.
+        # Users are only found once the index is synced.
+        self.assertIsNone(get_float_people_id(userdata))
+        sync_float_people()
+        # Test get from the index by Tock username.
         self.assertEqual(get_float_people_id(userdata), 755802)
         self.assertEqual(userdata.float_people_id, 755802)
         # Test get directly from UserData object.
@@ -35,21 +57,49 @@ class FloatTests(TestCase):
         user = User.objects.create(username='tom.jones')
         userdata = UserData.objects.create(user=user)
         self.assertEqual(get_float_people_id(userdata), None)
+        # The ID found is stored.
+        self.assertEqual(
+            UserData.objects.get(user__username='6cfl4j.c4drwz')
+            .float_people_id,
+            755802
+        )
 
-
-    def test_get_float_holidays(self):
-        self.assertEqual(len(get_float_holidays(dt.date(2016, 10, 1))), 1)
-
-    def test_get_float_timeoffs(self):
+    def test_sync_float_people(self):
+        user = User.objects.create(username='6cfl4j.c4drwz')
+        userdata = UserData.objects.create(user=user)
+        other = UserData.objects.create(
+            user=User.objects.create(username='tom.jones'))
+        stdout = io.StringIO()
+        call_command('sync_float_people', stdout=stdout)
+        self.assertIn('Synced', stdout.getvalue())
         self.assertEqual(
-            len(get_float_timeoffs(dt.date(2016, 10, 15), 755802)), 1)
+            FloatPerson.objects.get(username='6cfl4j.c4drwz').people_id,
+            755802
+        )
+        userdata.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(userdata.float_people_id, 755802)
+        self.assertIsNone(other.float_people_id)
+
+    def test_people_index_avoids_float(self):
+        """Once the index is synced, looking up people makes no Float
+        calls, including for users who are not in Float."""
+        sync_float_people()
+        with mock.patch('hours.float.get_float_data',
+                        side_effect=AssertionError('Float was called')):
+            user = User.objects.create(username='6cfl4j.c4drwz')
+            userdata = UserData.objects.create(user=user)
+            self.assertEqual(get_float_people_id(userdata), 755802)
+            user = User.objects.create(username='tom.jones')
+            userdata = UserData.objects.create(user=user)
+            self.assertIsNone(get_float_people_id(userdata))
 
     def test_get_work_days(self):
         holidays = []
         start_date = dt.date(2016, 10, 2)
         end_date = dt.date(2016, 10, 8)
         self.assertEqual(get_work_days(holidays, start_date, end_date), 5)
-        holidays = get_float_holidays(dt.date(2016, 10, 1))
+        holidays = float_json('holidays')['holidays']
         self.assertEqual(get_work_days(holidays, start_date, end_date), 4)
 
     def test_get_work_hours(self):
@@ -62,7 +112,7 @@ class FloatTests(TestCase):
         self.assertEqual(
             get_work_hours(start_date, end_date, timeoffs, work_days), 32.5)
         # Test with timeoffs and no holidays.
-        timeoffs = get_float_timeoffs(dt.date(2016, 10, 15), 755802)
+        timeoffs = float_timeoffs(755802)
         self.assertEqual(
             get_work_hours(start_date, end_date, timeoffs, work_days), 13.0)
         # Test with timeoffs and holidays.
@@ -79,7 +129,7 @@ class FloatTests(TestCase):
         start_date = dt.date(2016, 10, 9)
         end_date = dt.date(2016, 10, 15)
         float_people_id = 755802
-        tasks = get_float_tasks(start_date, float_people_id)
+        tasks = float_tasks(float_people_id)
         holidays = []
         work_days = get_work_days(holidays, start_date, end_date)
         timeoffs = []
@@ -94,7 +144,7 @@ class FloatTests(TestCase):
         result = get_tasks(start_date, end_date, tasks, work_days, work_hours)
         self.assertEqual(sum([ i['hours_wk'] for i in result ]), 26.0)
         # Test with holiday and timeoffs.
-        timeoffs = get_float_timeoffs(dt.date(2016, 10, 15), 755802)
+        timeoffs = float_timeoffs(755802)
         work_hours = get_work_hours(start_date, end_date, timeoffs, work_days)
         result = get_tasks(start_date, end_date, tasks, work_days, work_hours)
         self.assertEqual(sum([ i['hours_wk'] for i in result ]), 6.5)
@@ -104,3 +154,78 @@ class FloatTests(TestCase):
         work_hours = get_work_hours(start_date, end_date, timeoffs, work_days)
         result = get_tasks(start_date, end_date, tasks, work_days, work_hours)
         self.assertEqual(sum([ i['hours_wk'] for i in result ]), 13.0)
+
+    def test_import_float_schedule(self):
+        """Importing is idempotent, and timecards read the imported
+        schedule without calling Float."""
+        stdout = io.StringIO()
+        call_command('import_float_schedule', stdout=stdout)
+        self.assertIn('Imported 2 tasks, 1 time offs and 1 holidays',
+                      stdout.getvalue())
+        counts = import_float_schedule(dt.date(2016, 10, 2), 1)
+        self.assertEqual(
+            counts, {'tasks': 2, 'timeoffs': 1, 'holidays': 1})
+        self.assertEqual(import_float_schedule(dt.date(2016, 10, 2), 1),
+                         counts)
+        self.assertEqual(FloatTask.objects.count(), 2)
+        self.assertEqual(FloatTimeoff.objects.count(), 1)
+        self.assertEqual(FloatHoliday.objects.count(), 1)
+
+        user = User.objects.create(username='6cfl4j.c4drwz')
+        userdata = UserData.objects.create(user=user, float_people_id=755802)
+        rp = ReportingPeriod(
+            start_date=dt.date(2016, 10, 2), end_date=dt.date(2016, 10, 8))
+        with mock.patch('hours.float.get_float_data',
+                        side_effect=AssertionError('Float was called')):
+            with self.assertNumQueries(3):
+                tasks = float_tasks_for_view(user, rp, userdata)
+        # The same hours as from Float's live data.
+        work_days = get_work_days(
+            float_json('holidays')['holidays'], rp.start_date, rp.end_date)
+        live_tasks = get_tasks(
+            rp.start_date, rp.end_date,
+            float_tasks(755802),
+            work_days,
+            get_work_hours(
+                rp.start_date, rp.end_date, float_timeoffs(755802),
+                work_days)
+        )
+        self.assertEqual(
+            sorted(task['hours_wk'] for task in tasks),
+            sorted(task['hours_wk'] for task in live_tasks)
+        )
+
+    def test_import_repeated_tasks(self):
+        """Each repetition of a repeating task is imported, and importing
+        again replaces them."""
+        tasks = float_json('tasks')
+        task = tasks['people'][0]['tasks'][0]
+        task.update(start_date='2016-10-03', end_date='2016-10-07')
+        tasks['people'][0]['tasks'].append(
+            dict(task, start_date='2016-10-17', end_date='2016-10-21'))
+
+        def get_tasks_data(endpoint, params=None):
+            if endpoint == 'tasks':
+                return mock.Mock(json=lambda: tasks)
+            return get_float_data(endpoint, params)
+
+        with mock.patch('hours.float.get_float_data',
+                        side_effect=get_tasks_data):
+            for _ in range(2):
+                counts = import_float_schedule(dt.date(2016, 10, 2), 3)
+                self.assertEqual(counts['tasks'], 3)
+                self.assertEqual(
+                    FloatTask.objects.filter(
+                        task_id=int(task['task_id'])).count(),
+                    2
+                )
+
+        user = User.objects.create(username='6cfl4j.c4drwz')
+        userdata = UserData.objects.create(user=user, float_people_id=755802)
+        rp = ReportingPeriod(
+            start_date=dt.date(2016, 10, 16), end_date=dt.date(2016, 10, 22))
+        hours = {
+            i['task_name']: i['hours_wk']
+            for i in float_tasks_for_view(user, rp, userdata)
+        }
+        self.assertEqual(hours[task['task_name']], 7.5)
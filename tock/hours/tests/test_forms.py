@@ -1,6 +1,8 @@
 import datetime
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
 import hours.models
@@ -8,8 +10,9 @@ import projects.models
 
 from hours.forms import (
     TimecardForm, TimecardObjectForm,
-    TimecardFormSet, projects_as_choices,
-    choice_label_for_project
+    TimecardFormSet, projects_as_choices, reporting_period_choices,
+    reporting_period_project_options, choice_label_for_project,
+    SelectWithData
 )
 
 
@@ -51,6 +54,68 @@ class TimecardFormTests(TestCase):
         data_after_inactive_change = projects_as_choices()
         self.assertNotEqual(data_before_inactive_change, data_after_inactive_change)
 
+    def test_shared_options_html(self):
+        """Widgets reusing the pre-rendered options render the same markup
+        as rendering every option themselves."""
+        choices, options_html = reporting_period_project_options(
+            self.reporting_period
+        )
+        shared = SelectWithData(choices=choices)
+        shared.options_html = options_html
+        for value in (None, self.project_1.id, self.project_3.id):
+            self.assertHTMLEqual(
+                shared.render('project', value),
+                SelectWithData(choices=choices).render('project', value)
+            )
+        self.assertEqual(
+            shared.render('project', self.project_1.id).count('selected='), 1
+        )
+
+
+
+class ReportingPeriodChoicesTests(TransactionTestCase):
+    """ The catalog version is bumped when a transaction commits, which
+    TestCase never does. """
+    fixtures = [
+        'projects/fixtures/projects.json', 'tock/fixtures/prod_user.json']
+
+    def setUp(self):
+        self.reporting_period = hours.models.ReportingPeriod.objects.create(
+            start_date=datetime.date(2015, 1, 1),
+            end_date=datetime.date(2015, 1, 7),
+            exact_working_hours=40,
+            min_working_hours=40,
+            max_working_hours=60)
+        self.project_1 = projects.models.Project.objects.get(name="openFEC")
+
+    def test_reporting_period_choices_cached(self):
+        """The choices of a reporting period are built once, and rebuilt
+        when a project or one of its alerts changes."""
+        choices = reporting_period_choices(self.reporting_period)
+        self.assertEqual(
+            choices, projects_as_choices(self.reporting_period.get_projects())
+        )
+        # Only the catalog version is looked up.
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                reporting_period_choices(self.reporting_period), choices
+            )
+
+        self.project_1.name = 'openFEC 2'
+        self.project_1.save()
+        choices = reporting_period_choices(self.reporting_period)
+        self.assertIn(
+            '32 - openFEC 2',
+            [data['label'] for _, group in choices for _, data in group]
+        )
+
+        alert = projects.models.ProjectAlert.objects.create(
+            title='Note', description='Ask first'
+        )
+        self.project_1.alerts.add(alert)
+        self.assertIn(
+            'Ask first', str(reporting_period_choices(self.reporting_period))
+        )
 
 class TimecardObjectFormTests(TestCase):
     fixtures = [
@@ -314,3 +379,40 @@ class TimecardInlineFormSetTests(TestCase):
         form_data['timecardobjects-0-notes'] = 'Did some work.'
         formset = TimecardFormSet(form_data)
         self.assertTrue(formset.is_valid())
+
+    def validation_queries(self, lines):
+        """ Return the number of queries validating a timecard of `lines`
+        line items takes, and whether it was valid. """
+        form_data = self.form_data(**{
+            'timecardobjects-TOTAL_FORMS': str(lines)
+        })
+        for i in range(lines):
+            form_data['timecardobjects-%s-project' % i] = str(i + 4)
+            form_data['timecardobjects-%s-hours_spent' % i] = str(40 / lines)
+        formset = TimecardFormSet(form_data, instance=self.timecard)
+        choices = projects_as_choices()
+        for form in formset.forms:
+            form.fields['project'].choices = choices
+        with CaptureQueriesContext(connection) as queries:
+            valid = formset.is_valid()
+        return len(queries), valid
+
+    def test_validation_queries_do_not_grow_with_lines(self):
+        """ Projects of all line items are fetched together """
+        self.assertEqual(
+            self.validation_queries(2), self.validation_queries(20)
+        )
+        self.assertEqual(self.validation_queries(20), (1, True))
+
+    def test_deleted_project_is_invalid(self):
+        """ A project that is offered but no longer exists is rejected """
+        form_data = self.form_data()
+        formset = TimecardFormSet(form_data)
+        choices = projects_as_choices()
+        for form in formset.forms:
+            form.fields['project'].choices = choices
+        projects.models.Project.objects.filter(id=4).delete()
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            formset.forms[0].errors['project'], ['Invalid Project Selected']
+        )
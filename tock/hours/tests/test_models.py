@@ -1,13 +1,25 @@
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.utils import IntegrityError
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.core.management import call_command
 
 import datetime
-
-from hours.models import ReportingPeriod, TimecardObject, Timecard, Targets, HolidayPrefills
+import io
+
+from hours import rollups
+from hours.factories import (
+    ReportingPeriodFactory, TimecardFactory, TimecardObjectFactory, UserFactory,
+)
+from hours.models import (
+    ReportingPeriod, TimecardObject, Timecard, Targets, HolidayPrefills,
+    ReportingPeriodHours, FiscalYearHours, QuarterlyHours,
+)
+from projects.factories import AccountingCodeFactory, ProjectFactory
 from projects.models import Project, ProfitLossAccount
 from employees.models import EmployeeGrade, UserData
 
@@ -300,3 +312,434 @@ class TimecardObjectTests(TestCase):
         )
 
         self.assertFalse(tco.grade)
+
+    def test_bulk_save(self):
+        """Checks that bulk_save() appends the same grade, submitted status
+        and profit / loss codes as save(), in a fixed number of queries."""
+        self.userdata.profit_loss_account = self.pl_acct_3
+        self.userdata.save()
+        self.timecard.submitted = True
+        self.timecard.save()
+        projects = [self.project[0], Project.objects.get(pk=2)]
+
+        saved = [
+            TimecardObject.objects.create(
+                timecard=self.timecard, project=project, hours_spent=5
+            )
+            for project in projects
+        ]
+
+        def bulk_save(count):
+            timecard = Timecard.objects.get(pk=self.timecard.pk)
+            objects = [
+                TimecardObject(project=projects[i % 2], hours_spent=1)
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                TimecardObject.bulk_save(timecard, objects)
+            return len(queries)
+
+        self.assertEqual(bulk_save(2), bulk_save(10))
+
+        for obj in saved:
+            obj.hours_spent = 8
+        # Existing rows are written with a single update.
+        TimecardObject.bulk_save(self.timecard, saved)
+
+        fields = (
+            'project', 'grade', 'submitted', 'revenue_profit_loss_account',
+            'expense_profit_loss_account'
+        )
+        rows = set(TimecardObject.objects.values_list(*fields))
+        self.assertEqual(rows, set(
+            TimecardObject.objects.filter(pk__in=[o.pk for o in saved])
+            .values_list(*fields)
+        ))
+        self.assertEqual(rows, {
+            (1, self.grade.pk, True, self.pl_acct.pk, self.pl_acct_3.pk),
+            (2, self.grade.pk, True, None, self.pl_acct_3.pk),
+        })
+        self.assertEqual(
+            set(TimecardObject.objects.filter(pk__in=[o.pk for o in saved])
+                .values_list('hours_spent', flat=True)),
+            {8}
+        )
+        self.assertEqual(TimecardObject.objects.count(), 14)
+
+
+class ReportingPeriodHoursTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        UserData.objects.create(user=self.user, unit=5)
+        self.grade = EmployeeGrade.objects.create(
+            employee=self.user,
+            grade=15,
+            g_start_date=datetime.date(2015, 1, 1)
+        )
+        billable_code = AccountingCodeFactory(billable=True)
+        self.billable_project = ProjectFactory(accounting_code=billable_code)
+        self.acquisition_project = ProjectFactory(
+            accounting_code=billable_code,
+            profit_loss_account=ProfitLossAccount.objects.create(
+                name='FY17 Acquisition Svcs Billable',
+                accounting_string='foo',
+                as_start_date=datetime.date(2016, 10, 1),
+                as_end_date=datetime.date(2017, 9, 30),
+                account_type='Revenue'
+            )
+        )
+        self.nonbillable_project = ProjectFactory(
+            accounting_code=AccountingCodeFactory(billable=False)
+        )
+        self.timecard = TimecardFactory(
+            user=self.user,
+            reporting_period=ReportingPeriodFactory(
+                start_date=datetime.date(2016, 11, 6),
+                end_date=datetime.date(2016, 11, 12)
+            )
+        )
+        for project, hours in ((self.billable_project, 20),
+                               (self.acquisition_project, 5),
+                               (self.nonbillable_project, 15)):
+            TimecardObjectFactory(
+                timecard=self.timecard,
+                project=project,
+                hours_spent=hours
+            )
+
+    def test_submitted_timecard(self):
+        rollup = ReportingPeriodHours.objects.get()
+        self.assertEqual(rollup.user, self.user)
+        self.assertEqual(rollup.reporting_period, self.timecard.reporting_period)
+        self.assertEqual(rollup.unit, 5)
+        self.assertEqual(rollup.grade, 15)
+        self.assertEqual(rollup.total_hours, 40)
+        self.assertEqual(rollup.billable_hours, 25)
+        self.assertEqual(rollup.revenue_hours, 20)
+
+    def test_unit_snapshot(self):
+        """ The unit is recorded as it stood when the timecard was
+        submitted. """
+        user_data = UserData.objects.get(user=self.user)
+        user_data.unit = 6
+        user_data.save()
+        self.assertEqual(ReportingPeriodHours.objects.get().unit, 5)
+
+        # Nor when hours are recomputed.
+        self.billable_project.accounting_code = AccountingCodeFactory(
+            billable=False)
+        self.billable_project.save()
+        rollup = ReportingPeriodHours.objects.get()
+        self.assertEqual(rollup.unit, 5)
+        self.assertEqual(rollup.billable_hours, 5)
+
+        call_command('rebuild_hours_rollups', stdout=io.StringIO())
+        self.assertEqual(ReportingPeriodHours.objects.get().unit, 5)
+
+    def test_unrelated_project_change(self):
+        """ Saving a project without changing how its hours are counted
+        leaves the rollups alone. """
+        self.billable_project.description = 'Updated'
+        with CaptureQueriesContext(connection) as queries:
+            self.billable_project.save()
+        self.assertFalse([
+            query for query in queries
+            if 'hours_reportingperiodhours' in query['sql']
+            or 'hours_quarterlyhours' in query['sql']
+            or 'hours_fiscalyearhours' in query['sql']
+        ])
+
+    def test_accounting_code_change(self):
+        """ Changing whether an accounting code is billable recomputes the
+        hours on its projects. """
+        other = UserFactory(username='other')
+        UserData.objects.create(user=other, unit=5)
+        TimecardObjectFactory(
+            timecard=TimecardFactory(
+                user=other,
+                reporting_period=self.timecard.reporting_period
+            ),
+            project=self.nonbillable_project,
+            hours_spent=8
+        )
+        code = self.billable_project.accounting_code
+        code.billable = False
+        code.save()
+
+        rollup = ReportingPeriodHours.objects.get(user=self.user)
+        self.assertEqual(rollup.total_hours, 40)
+        self.assertIsNone(rollup.billable_hours)
+        self.assertIsNone(rollup.revenue_hours)
+        self.assertEqual(
+            list(QuarterlyHours.objects.order_by('user_id').values_list(
+                'user_id', 'billable', 'hours')),
+            [(self.user.id, False, 40), (other.id, False, 8)]
+        )
+
+    def rollup_refreshes(self, queries):
+        return len([
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "hours_quarterlyhours"')
+        ])
+
+    def test_submit_refreshes_once(self):
+        """ Submitting a timecard and saving its line items, as the
+        timecard view does, refreshes the rollups once. """
+        self.timecard.submitted = False
+        self.timecard.save()
+        objects = list(self.timecard.timecardobjects.all())
+        for obj in objects:
+            obj.hours_spent += 1
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic(), rollups.batch():
+                self.timecard.submitted = True
+                self.timecard.save()
+                objects[0].delete()
+                TimecardObject.bulk_save(self.timecard, objects[1:])
+        self.assertEqual(self.rollup_refreshes(queries), 1)
+        self.assertEqual(ReportingPeriodHours.objects.get().total_hours, 22)
+
+    def test_batch_refreshes_once(self):
+        """ Line items created one by one in a batch, as the bulk import
+        does, refresh the rollups once. """
+        with CaptureQueriesContext(connection) as queries:
+            with rollups.batch():
+                for hours in (1, 2, 3):
+                    TimecardObjectFactory(
+                        timecard=self.timecard,
+                        project=self.billable_project,
+                        hours_spent=hours
+                    )
+        self.assertEqual(self.rollup_refreshes(queries), 1)
+        self.assertEqual(ReportingPeriodHours.objects.get().total_hours, 46)
+
+    def test_resaved_draft(self):
+        """ Saving a timecard without changing its submitted status leaves
+        its line items alone. """
+        self.timecard.submitted = False
+        self.timecard.save()
+        modified = list(self.timecard.timecardobjects.order_by(
+            'id').values_list('modified', flat=True))
+        self.timecard.save()
+        self.assertEqual(
+            list(self.timecard.timecardobjects.order_by(
+                'id').values_list('modified', flat=True)),
+            modified
+        )
+
+    def test_reopened_timecard(self):
+        self.timecard.submitted = False
+        self.timecard.save()
+        self.assertFalse(ReportingPeriodHours.objects.exists())
+
+        TimecardObject.objects.filter(
+            project=self.nonbillable_project
+        ).delete()
+        self.timecard.submitted = True
+        self.timecard.save()
+        rollup = ReportingPeriodHours.objects.get()
+        self.assertEqual(rollup.total_hours, 25)
+        self.assertEqual(rollup.billable_hours, 25)
+
+    def test_deleted_timecard(self):
+        self.timecard.delete()
+        self.assertFalse(ReportingPeriodHours.objects.exists())
+
+    def test_no_billable_hours(self):
+        TimecardObject.objects.exclude(
+            project=self.nonbillable_project
+        ).delete()
+        rollup = ReportingPeriodHours.objects.get()
+        self.assertEqual(rollup.total_hours, 15)
+        self.assertIsNone(rollup.billable_hours)
+
+    def test_rebuild(self):
+        ReportingPeriodHours.objects.all().delete()
+        call_command('rebuild_hours_rollups', stdout=io.StringIO())
+        rollup = ReportingPeriodHours.objects.get()
+        self.assertEqual(rollup.total_hours, 40)
+        self.assertEqual(rollup.revenue_hours, 20)
+
+
+class FiscalYearHoursTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.user_data = UserData.objects.create(user=self.user, unit=5)
+        self.project = ProjectFactory(
+            accounting_code=AccountingCodeFactory(billable=True)
+        )
+        self.periods = [
+            ReportingPeriodFactory(
+                start_date=datetime.date(2016, 10, 2) + datetime.timedelta(
+                    weeks=week),
+                end_date=datetime.date(2016, 10, 8) + datetime.timedelta(
+                    weeks=week),
+            )
+            for week in range(3)
+        ]
+        for period, hours in ((self.periods[0], 10), (self.periods[2], 30)):
+            TimecardObjectFactory(
+                timecard=TimecardFactory(
+                    user=self.user,
+                    reporting_period=period
+                ),
+                project=self.project,
+                hours_spent=hours
+            )
+
+    def series(self):
+        return list(FiscalYearHours.objects.order_by(
+            'unit', 'reporting_period__start_date'
+        ).values_list('fiscal_year', 'unit', 'hours', 'fytd_hours'))
+
+    def test_series(self):
+        self.assertEqual(self.series(), [
+            (2017, 5, 10, 10),
+            (2017, 5, 0, 10),
+            (2017, 5, 30, 40),
+        ])
+
+    def test_same_unit(self):
+        """Timecards of users in the same unit add up in its series."""
+        other = UserFactory(username='other')
+        UserData.objects.create(user=other, unit=5)
+        for period, hours in ((self.periods[0], 5), (self.periods[1], 7)):
+            timecard = TimecardFactory(
+                user=other, reporting_period=period, submitted=False)
+            TimecardObjectFactory(
+                timecard=timecard, project=self.project, hours_spent=hours)
+            timecard.submitted = True
+            timecard.save()
+        self.assertEqual(self.series(), [
+            (2017, 5, 15, 15),
+            (2017, 5, 7, 22),
+            (2017, 5, 30, 52),
+        ])
+
+        timecard.submitted = False
+        timecard.save()
+        self.assertEqual(self.series(), [
+            (2017, 5, 15, 15),
+            (2017, 5, 0, 15),
+            (2017, 5, 30, 45),
+        ])
+
+    def test_new_reporting_period(self):
+        ReportingPeriodFactory(
+            start_date=datetime.date(2016, 10, 23),
+            end_date=datetime.date(2016, 10, 29),
+        )
+        self.assertEqual(self.series()[-1], (2017, 5, 0, 40))
+
+    def test_reopened_timecard(self):
+        timecard = Timecard.objects.get(reporting_period=self.periods[0])
+        timecard.submitted = False
+        timecard.save()
+        self.assertEqual(self.series(), [
+            (2017, 5, 0, 0),
+            (2017, 5, 0, 0),
+            (2017, 5, 30, 30),
+        ])
+
+    def test_unit_change(self):
+        self.user_data.unit = 6
+        self.user_data.save()
+        self.assertEqual(self.series()[-1], (2017, 6, 30, 40))
+
+    def test_unrelated_employee_change(self):
+        """Editing an employee's details other than their unit or status
+        leaves the series alone."""
+        self.user_data.is_aws_eligible = True
+        with CaptureQueriesContext(connection) as queries:
+            self.user_data.save()
+        self.assertFalse([
+            query for query in queries
+            if 'hours_fiscalyearhours' in query['sql']
+            or 'hours_reportingperiodsnapshot' in query['sql']
+        ])
+
+    def test_unit_change_other_units(self):
+        """Only the series of the employee's old and new units are
+        recomputed."""
+        other = UserFactory(username='other')
+        UserData.objects.create(user=other, unit=7)
+        TimecardObjectFactory(
+            timecard=TimecardFactory(
+                user=other,
+                reporting_period=self.periods[0]
+            ),
+            project=self.project,
+            hours_spent=8
+        )
+        other_series = list(FiscalYearHours.objects.filter(
+            unit=7).values_list('id', flat=True))
+
+        self.user_data.unit = 6
+        self.user_data.save()
+        self.assertEqual(
+            list(FiscalYearHours.objects.filter(
+                unit=7).values_list('id', flat=True)),
+            other_series
+        )
+        self.assertFalse(FiscalYearHours.objects.filter(unit=5).exists())
+
+    def test_excluded_employees(self):
+        self.user_data.unit = 4
+        self.user_data.save()
+        self.assertEqual(self.series(), [])
+
+        self.user_data.unit = 5
+        self.user_data.current_employee = False
+        self.user_data.save()
+        self.assertEqual(self.series(), [])
+
+    def test_rebuild(self):
+        expected = self.series()
+        FiscalYearHours.objects.all().delete()
+        call_command('rebuild_hours_rollups', stdout=io.StringIO())
+        self.assertEqual(self.series(), expected)
+
+
+class DashboardUnitsTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory()
+        self.user_data = UserData.objects.create(user=self.user, unit=5)
+        self.project = ProjectFactory(
+            accounting_code=AccountingCodeFactory(billable=True)
+        )
+        self.period = ReportingPeriodFactory(
+            start_date=datetime.date(2016, 10, 2),
+            end_date=datetime.date(2016, 10, 8),
+        )
+        self.timecard = TimecardFactory(
+            user=self.user, reporting_period=self.period)
+        TimecardObjectFactory(
+            timecard=self.timecard, project=self.project, hours_spent=10)
+
+    def hours(self):
+        with CaptureQueriesContext(connection) as queries:
+            hours = rollups.dashboard_units(self.period)['hours']
+        return hours, len([
+            query for query in queries
+            if 'hours_fiscalyearhours' in query['sql']
+        ])
+
+    def test_cached_until_commit(self):
+        """The figures are cached until a change to the series commits, so
+        a dashboard read while a submit is in progress cannot cache the
+        old figures for good."""
+        self.assertEqual(self.hours(), ({5: (10, 10)}, 1))
+        self.assertEqual(self.hours(), ({5: (10, 10)}, 0))
+
+        with transaction.atomic():
+            TimecardObjectFactory(
+                timecard=self.timecard, project=self.project, hours_spent=5)
+            self.assertEqual(self.hours(), ({5: (10, 10)}, 0))
+        self.assertEqual(self.hours(), ({5: (15, 15)}, 1))
+
+    def test_employee_change(self):
+        self.hours()
+        self.user_data.unit = 6
+        self.user_data.save()
+        self.assertEqual(self.hours(), ({6: (10, 10)}, 1))
@@ -0,0 +1,87 @@
+import datetime as dt
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django_webtest import WebTest
+
+from employees.models import UserData
+from projects.models import Project
+
+from ..float import find_common_weekdays, import_float_schedule
+from ..models import ReportingPeriod, Timecard, TimecardObject
+from ..planning import planned_vs_actual, weekdays_between
+
+
+class PlanningTests(WebTest):
+    fixtures = [
+        'projects/fixtures/projects.json',
+        'tock/fixtures/prod_user.json',
+    ]
+
+    def setUp(self):
+        self.reporting_period = ReportingPeriod.objects.create(
+            start_date=dt.date(2016, 10, 9),
+            end_date=dt.date(2016, 10, 15),
+        )
+        import_float_schedule(dt.date(2016, 10, 2), 2)
+        self.user = User.objects.create(username='6cfl4j.c4drwz')
+        UserData.objects.create(user=self.user, float_people_id=755802, unit=5)
+        self.project = Project.objects.get(name='openFEC')
+        timecard = Timecard.objects.create(
+            user=self.user,
+            reporting_period=self.reporting_period,
+            submitted=True
+        )
+        self.timecard = timecard
+        TimecardObject.objects.create(
+            timecard=timecard, project=self.project, hours_spent=12)
+
+    def test_weekdays_between(self):
+        start = dt.date(2016, 10, 1)
+        for offset in range(20):
+            for length in range(-1, 30):
+                first = start + dt.timedelta(days=offset)
+                last = first + dt.timedelta(days=length)
+                self.assertEqual(
+                    weekdays_between(first, last),
+                    len(find_common_weekdays((first, last), (first, last)))
+                )
+
+    def test_planned_vs_actual(self):
+        with self.assertNumQueries(6):
+            rows = planned_vs_actual(self.reporting_period)
+        # Planned hours agree with the user's Float sidebar.
+        self.assertEqual(rows, [
+            ['Chapters-Engineering', 'LywWGnSmYo', 10.0, 0, -10.0],
+            ['Chapters-Engineering', 'openFEC', 0, 12.0, 12.0],
+            ['Chapters-Engineering', 'pSOvkvbGYL', 3.0, 0, -3.0],
+        ])
+
+    def test_matched_projects(self):
+        """Float projects are matched to Tock projects by the Float project
+        ID stored on them, whatever their names, and only by it."""
+        self.project.float_project_id = 746897  # pSOvkvbGYL
+        self.project.save()
+        other = Project.objects.exclude(pk=self.project.pk).first()
+        other.name = 'LywWGnSmYo'
+        other.save()
+        TimecardObject.objects.create(
+            timecard=self.timecard, project=other, hours_spent=4)
+        self.assertEqual(planned_vs_actual(self.reporting_period), [
+            ['Chapters-Engineering', 'LywWGnSmYo', 0, 4.0, 4.0],
+            ['Chapters-Engineering', 'LywWGnSmYo', 10.0, 0, -10.0],
+            ['Chapters-Engineering', 'openFEC', 3.0, 12.0, 9.0],
+        ])
+
+    def test_planned_vs_actual_csv(self):
+        response = self.app.get(
+            reverse(
+                'reports:PlannedVsActualCSVView',
+                kwargs={'reporting_period': '2016-10-09'}
+            ),
+            headers={'X_AUTH_USER': self.user.username + '@gsa.gov'},
+        )
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertEqual(
+            lines[0], 'Unit,Project,Planned Hours,Actual Hours,Difference')
+        self.assertIn('Chapters-Engineering,openFEC,0,12.0,12.0', lines)
@@ -1,27 +1,37 @@
 import datetime
 import csv
+import io
 import requests
 import json
+import tempfile
+import unittest
+from unittest import mock
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
-from django_webtest import WebTest
+from django.db import connection
+from django_webtest import TransactionWebTest, WebTest
 
-from api.renderers import stream_csv
+from api.pgcopy import generate_copy, stream_copy_csv
+from api.renderers import stream_csv, stream_compiled_csv
 
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 
 from api.tests import client
-from api.views import UserDataSerializer, ProjectSerializer
+from api.views import UserDataSerializer, ProjectSerializer, get_timecards
 from employees.models import UserData
 from hours.utils import number_of_hours
+from hours.float import import_float_schedule, sync_float_people
 from hours.forms import choice_label_for_project
 from tock.settings import base, dev
 from hours.views import GeneralSnippetsTimecardSerializer
 import hours.models
+import hours.snapshots
 import hours.views
 import projects.models
 
@@ -68,7 +78,7 @@ class DashboardReportsListTests(WebTest):
             len(response.context['reportingperiod_list'])
         )
 
-class DashboardViewTests(WebTest):
+class DashboardViewTests(TransactionWebTest):
     fixtures = [
         'tock/fixtures/prod_user.json',
         'projects/fixtures/projects.json',
@@ -76,6 +86,9 @@ class DashboardViewTests(WebTest):
     ]
 
     def setUp(self):
+        # Cached figures are keyed on model versions, which start over with
+        # every test.
+        cache.clear()
         self.user = User.objects.first()
         self.ud = UserData.objects.first()
         self.ud.user = self.user
@@ -198,6 +211,59 @@ class DashboardViewTests(WebTest):
         )
         self.assertContains(response, '<td data-title="Variance">$-2 (-100.00%)</td>')
 
+    def test_series(self):
+        """The dashboard reads billed hours of every unit from the fiscal
+        year series in one query, which is not repeated when moving between
+        units, and the dashboard list charts the series."""
+        date = self.rp_2.end_date.strftime('%Y-%m-%d')
+        url = reverse(
+            'reports:DashboardView',
+            kwargs={'reporting_period': date}
+        )
+
+        def hours_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                self.app.get(
+                    url, params, headers={'X_AUTH_USER': self.user.email})
+            return len([
+                query for query in queries
+                if 'hours_timecardobject' in query['sql']
+                or 'hours_fiscalyearhours' in query['sql']
+            ])
+
+        self.assertEqual(hours_queries({}), 1)
+        self.assertEqual(hours_queries({}), 0)
+        self.assertEqual(hours_queries({'unit': '0'}), 0)
+        self.assertEqual(hours_queries({'unit': '13'}), 0)
+
+        # Until the series changes.
+        hours.models.TimecardObject.objects.create(
+            timecard=self.timecard_2,
+            project=self.project_1,
+            hours_spent=5,
+            submitted=True
+        )
+        self.assertEqual(hours_queries({'unit': '0'}), 1)
+
+        response = self.app.get(
+            reverse('reports:DashboardReportsList'),
+            headers={'X_AUTH_USER': self.user.email},
+        )
+        self.assertEqual(json.loads(response.context['series']), [
+            {
+                'fiscal_year': 'FY2017',
+                'end_date': '2016-10-07',
+                'hours': 30.0,
+                'fytd_hours': 30.0,
+            },
+            {
+                'fiscal_year': 'FY2017',
+                'end_date': '2016-10-14',
+                'hours': 20.0,
+                'fytd_hours': 50.0,
+            },
+        ])
+
     def test_no_reporting_period(self):
         """Tests errors are handled when there is no matching reporting
         period."""
@@ -229,7 +295,9 @@ class DashboardViewTests(WebTest):
         self.assertContains(response, 'Whoops')
         self.assertContains(response, date)
 
-        """def test_unit_param(self):
+    def test_unit_param(self):
+        """Targets are narrowed to the selected unit's share of employees,
+        and every unit is compared."""
         date = self.rp_2.end_date.strftime('%Y-%m-%d')
         self.ud.unit = 13
         self.ud.save()
@@ -245,10 +313,18 @@ class DashboardViewTests(WebTest):
             response.context['units'],
             [(self.ud.unit, self.ud.get_unit_display())]
         )
+        self.assertEqual(response.context['unit_selected'], 13)
         self.assertEqual(
             response.context['variance_rev_cr_weekly'],
             '$1,498'
         )
+        self.assertEqual(
+            [
+                (unit['unit'], unit['variance_rev_cr_weekly'])
+                for unit in response.context['unit_performance']
+            ],
+            [(13, '$1,498')]
+        )
         response = self.app.get(
             reverse(
                 'reports:DashboardView',
@@ -260,7 +336,21 @@ class DashboardViewTests(WebTest):
         self.assertEqual(
             response.context['variance_rev_cr_weekly'],
             '$0'
-        )"""
+        )
+
+    def test_invalid_unit_param(self):
+        date = self.rp_2.end_date.strftime('%Y-%m-%d')
+        response = self.app.get(
+            reverse(
+                'reports:DashboardView',
+                kwargs={'reporting_period': date}
+            ),
+            {'unit':'foo'},
+            headers={'X_AUTH_USER': self.user.email},
+        )
+        self.assertContains(response, 'Whoops!')
+        self.assertContains(response, 'No unit available for foo.')
+
     def test_template_render(self):
         date = self.rp_2.end_date.strftime('%Y-%m-%d')
         response = self.app.get(
@@ -442,6 +532,21 @@ class BulkTimecardsTests(TestCase):
             rows_read += 1
         self.assertNotEqual(rows_read, 0, 'no rows read, expecting 1 or more')
 
+    def test_bulk_timecards_fields(self):
+        response = client(self).get(
+            reverse('reports:BulkTimecardList'),
+            {'fields': 'hours_spent,employee,start_date'}
+        )
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(
+            content.splitlines()[0], 'employee,start_date,hours_spent'
+        )
+
+        response = client(self).get(
+            reverse('reports:BulkTimecardList'), {'fields': 'salary'}
+        )
+        self.assertEqual(response.status_code, 400)
+
 class TestAdminBulkTimecards(TestCase):
     fixtures = FIXTURES
 
@@ -474,6 +579,184 @@ class TestAdminBulkTimecards(TestCase):
         for row in rows:
             self.assertEqual(set(row.keys()), expected_fields)
 
+class CompiledCSVTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        self.user = User.objects.get(username='aaron.snow')
+        self.userdata = UserData.objects.get_or_create(user=self.user)[0]
+        self.userdata.unit = 5
+        self.userdata.save()
+        tco = hours.models.TimecardObject.objects.first()
+        tco.project = projects.models.Project.objects.get(name='General')
+        tco.hours_spent = 12.5
+        tco.notes = 'Notes with "quotes", commas\nand a newline'
+        tco.save()
+
+    def assertCompiledParity(self, queryset, serializer_class):
+        expected = b''.join(
+            stream_csv(queryset, serializer_class()).streaming_content
+        )
+        actual = b''.join(
+            stream_compiled_csv(queryset, serializer_class).streaming_content
+        )
+        self.assertNotEqual(expected.count(b'\n'), 1)
+        self.assertEqual(actual, expected)
+
+    def test_compiled_csv_parity(self):
+        """Compiled exports must match the serializer output byte for
+        byte."""
+        queryset = get_timecards(hours.views.TimecardList.queryset)
+        for serializer_class in (
+            hours.views.BulkTimecardSerializer,
+            hours.views.SlimBulkTimecardSerializer,
+            hours.views.AdminBulkTimecardSerializer,
+            GeneralSnippetsTimecardSerializer,
+        ):
+            self.assertCompiledParity(queryset, serializer_class)
+
+    def test_compiled_csv_parity_without_user_data(self):
+        """A missing UserData row exports as an empty unit."""
+        self.userdata.delete()
+        queryset = get_timecards(hours.views.TimecardList.queryset)
+        self.assertCompiledParity(queryset, GeneralSnippetsTimecardSerializer)
+
+class CopyCSVTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        tco = hours.models.TimecardObject.objects.first()
+        tco.notes = 'Notes with "quotes", commas\nand a newline'
+        tco.save()
+        self.queryset = get_timecards(
+            hours.views.TimecardList.queryset, {'user': 'aaron.snow'}
+        )
+
+    def export(self, stream, serializer_class):
+        response = stream(self.queryset, serializer_class)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    @unittest.skipIf(connection.vendor == 'postgresql', 'uses COPY')
+    def test_copy_csv_fallback(self):
+        """Without PostgreSQL the compiled Python export is used."""
+        for serializer_class in (
+            hours.views.BulkTimecardSerializer,
+            hours.views.AdminBulkTimecardSerializer,
+        ):
+            self.assertEqual(
+                self.export(stream_copy_csv, serializer_class),
+                self.export(stream_compiled_csv, serializer_class),
+            )
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'requires COPY')
+    def test_copy_csv_matches_compiled_csv(self):
+        """COPY output matches the Python export byte for byte, line
+        endings included."""
+        for serializer_class in (
+            hours.views.BulkTimecardSerializer,
+            hours.views.AdminBulkTimecardSerializer,
+        ):
+            self.assertEqual(
+                self.export(stream_copy_csv, serializer_class),
+                self.export(stream_compiled_csv, serializer_class),
+            )
+
+    def copy_connection(self, copy_expert):
+        connection = mock.Mock()
+        connection.cursor.return_value.cursor.copy_expert.side_effect = \
+            copy_expert
+        return connection
+
+    def test_generate_copy(self):
+        """COPY output is passed on as it is written, with rows ending in
+        "\\r\\n" like the csv module's."""
+        def copy_expert(sql, output):
+            output.write(b'id,notes\n')
+            output.write(b'1,"two\nlines"\n')
+
+        connection = self.copy_connection(copy_expert)
+        self.assertEqual(
+            b''.join(generate_copy(connection, 'COPY')),
+            b'id,notes\r\n1,"two\nlines"\r\n'
+        )
+        connection.cursor.return_value.close.assert_called_once_with()
+
+    @mock.patch('api.pgcopy.CHUNK_SIZE', 1)
+    def test_generate_copy_closed(self):
+        """Closing the response aborts the COPY."""
+        def copy_expert(sql, output):
+            while True:
+                output.write(b'1\n')
+
+        connection = self.copy_connection(copy_expert)
+        chunks = generate_copy(connection, 'COPY')
+        self.assertEqual(next(chunks), b'1\r\n')
+        chunks.close()
+        connection.cursor.return_value.close.assert_called_once_with()
+
+    def test_generate_copy_error(self):
+        def copy_expert(sql, output):
+            output.write(b'id\n')
+            raise ValueError('COPY failed')
+
+        connection = self.copy_connection(copy_expert)
+        with self.assertRaisesRegex(ValueError, 'COPY failed'):
+            b''.join(generate_copy(connection, 'COPY'))
+
+class SnapshotTests(TestCase):
+    fixtures = FIXTURES
+
+    def setUp(self):
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        settings = override_settings(EXPORT_SNAPSHOT_DIR=snapshot_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.queryset = get_timecards(hours.views.TimecardList.queryset)
+
+    def export(self, stream):
+        response = stream(self.queryset, hours.views.BulkTimecardSerializer)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def snapshot_export(self, queryset, serializer_class):
+        return hours.snapshots.stream_snapshot_csv(
+            'bulk', queryset, serializer_class
+        )
+
+    def test_snapshot_matches_live_export(self):
+        """Closed periods come from snapshots with the same content."""
+        expected = self.export(stream_compiled_csv)
+        self.assertEqual(self.export(self.snapshot_export), expected)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.export(self.snapshot_export), expected)
+        # Only the open periods are read from the table.
+        self.assertEqual(
+            len([q for q in queries if 'hours_timecardobject' in q['sql']]), 1
+        )
+
+    def test_snapshot_invalidated_on_save(self):
+        """Saving a row of a closed period rebuilds its snapshot."""
+        self.export(self.snapshot_export)
+        timecard_object = hours.models.TimecardObject.objects.filter(
+            timecard__submitted=True
+        ).first()
+        hours.models.TimecardObject.objects.filter(
+            pk=timecard_object.pk
+        ).update(notes='not in the snapshot')
+        self.assertNotIn('not in the snapshot', self.export(self.snapshot_export))
+
+        timecard_object.notes = 'saved'
+        timecard_object.save()
+        self.assertIn('saved', self.export(self.snapshot_export))
+
+    def test_snapshot_invalidated_on_project_save(self):
+        """Renaming a project rebuilds every snapshot."""
+        self.export(self.snapshot_export)
+        project = projects.models.Project.objects.get(name='Out Of Office')
+        project.name = 'Renamed project'
+        project.save()
+        self.assertIn('Renamed project', self.export(self.snapshot_export))
+
 class ProjectTimelineTests(WebTest):
     fixtures = FIXTURES
 
@@ -739,6 +1022,8 @@ class ReportTests(WebTest):
         new_reporting_period.start_date = datetime.date(2016, 5, 1)
         new_reporting_period.end_date = datetime.date(2016, 5, 8)
         new_reporting_period.save()
+        sync_float_people()
+        import_float_schedule(new_reporting_period.start_date, 1)
         date = self.reporting_period.start_date.strftime('%Y-%m-%d')
         response = self.app.get(
             reverse(
@@ -756,6 +1041,8 @@ class ReportTests(WebTest):
         new_reporting_period.start_date = datetime.date(2016, 10, 2)
         new_reporting_period.end_date = datetime.date(2016, 10, 8)
         new_reporting_period.save()
+        sync_float_people()
+        import_float_schedule(new_reporting_period.start_date, 1)
         date = new_reporting_period.start_date.strftime('%Y-%m-%d')
         response = self.app.get(
             reverse(
@@ -797,6 +1084,8 @@ class ReportTests(WebTest):
         new_reporting_period.start_date = datetime.date(2016, 10, 9)
         new_reporting_period.end_date = datetime.date(2016, 10, 15)
         new_reporting_period.save()
+        sync_float_people()
+        import_float_schedule(new_reporting_period.start_date, 1)
         date = new_reporting_period.start_date.strftime('%Y-%m-%d')
         response = self.app.get(
             reverse(
@@ -815,6 +1104,10 @@ class ReportTests(WebTest):
             infile.seek(0)
             infile.truncate()
             infile.write(json.dumps(data, indent=4))
+        # Float responses are cached.
+        cache.clear()
+        sync_float_people()
+        import_float_schedule(new_reporting_period.start_date, 1)
         response = self.app.get(
             reverse(
                 'reportingperiod:UpdateTimesheet',
@@ -1052,6 +1345,45 @@ class ReportTests(WebTest):
         formset = response.context['formset']
         self.assertTrue(formset.save_only)
 
+    def timecard_view_queries(self, method, lines=0):
+        """ Return the queries a GET or POST of the timecard takes, POSTing
+        `lines` line items. """
+        url = reverse(
+            'reportingperiod:UpdateTimesheet',
+            kwargs={'reporting_period': '2015-01-01'}
+        )
+        headers = {'X_AUTH_USER': self.regular_user.email}
+        if method == 'get':
+            with CaptureQueriesContext(connection) as queries:
+                response = self.app.get(url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        data = {
+            'save_only': '1',
+            'timecardobjects-TOTAL_FORMS': str(lines),
+            'timecardobjects-INITIAL_FORMS': '0',
+            'timecardobjects-MIN_NUM_FORMS': '0',
+            'timecardobjects-MAX_NUM_FORMS': '1000',
+        }
+        for i in range(lines):
+            data['timecardobjects-%s-project' % i] = str(i + 4)
+            data['timecardobjects-%s-hours_spent' % i] = '1'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.app.post(url, data, headers=headers)
+        self.assertEqual(response.status_code, 302)
+        return len(queries)
+
+    def test_timecard_view_queries(self):
+        """ A timecard loads each of its reporting period, user data and
+        formset once, whatever the number of line items. """
+        # Creating the timecard and building the project choices.
+        self.assertLessEqual(self.timecard_view_queries('get'), 35)
+        self.assertLessEqual(self.timecard_view_queries('get'), 12)
+        post_queries = self.timecard_view_queries('post', 2)
+        self.assertLessEqual(post_queries, 30)
+        self.assertEqual(self.timecard_view_queries('post', 12), post_queries)
+
     def test_report_list_not_authenticated(self):
         response = self.app.get(
             reverse('ListReportingPeriods'), expect_errors=True)
@@ -11,6 +11,8 @@ urlpatterns = [
         view=views.ReportingPeriodDetailView.as_view(), name='ReportingPeriodDetailView'),
     url(regex=r'^(?P<reporting_period>[0-9]{4}-[0-9]{2}-[0-9]{2}).csv/$',
         view=views.ReportingPeriodCSVView, name='ReportingPeriodCSVView'),
+    url(regex=r'^(?P<reporting_period>[0-9]{4}-[0-9]{2}-[0-9]{2})/planned_vs_actual.csv$',
+        view=views.planned_vs_actual_csv, name='PlannedVsActualCSVView'),
     url(regex=r'^(?P<reporting_period>[0-9]{4}-[0-9]{2}-[0-9]{2})/(?P<username>[A-Za-z0-9._%+-]*)/$',
         view=views.ReportingPeriodUserDetailView.as_view(), name='ReportingPeriodUserDetailView'),
     url(r'^project_timeline.csv$', views.project_timeline_view, name='ProjectTimelineView'),
@@ -1,5 +1,6 @@
 import csv, json
 import datetime as dt
+import functools
 import io
 from itertools import chain
 from operator import attrgetter
@@ -11,35 +12,44 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
 from django.views.generic import ListView, DetailView, TemplateView
 from django.views.generic.edit import CreateView, UpdateView, FormView
-from django.db.models import Prefetch, Q, Sum
+from django.db import transaction
+from django.db.models import Prefetch, Q, Sum, prefetch_related_objects
 from django.contrib.auth.decorators import user_passes_test
 
+from rest_framework.exceptions import ParseError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import serializers
 
 from api.views import get_timecards, TimecardList, ProjectSerializer, UserDataSerializer
-from api.renderers import stream_csv
+from api.pgcopy import stream_copy_csv
+from api.renderers import generate_csv, stream_csv, stream_compiled_csv
+from api.sparse import get_serializer_class
 from employees.models import UserData
 from projects.models import AccountingCode
 from tock.remote_user_auth import email_to_username
 from tock.utils import PermissionMixin, IsSuperUserOrSelf, get_float_data, flatten
 from tock.settings import base
 
+from . import planning, rollups, snapshots
 from .float import *
-from .models import ReportingPeriod, Timecard, TimecardObject, Project, Targets
+from .models import (
+    FiscalYearHours, ReportingPeriod, ReportingPeriodHours, Timecard,
+    TimecardObject, Project, Targets,
+)
 from .forms import (
     ReportingPeriodForm,
     ReportingPeriodImportForm,
-    projects_as_choices,
+    reporting_period_project_options,
     TimecardForm,
     TimecardFormSet,
     timecard_formset_factory
 )
-from utilization.utils import calculate_utilization, get_fy_first_day
+from utilization.utils import add_hours, calculate_utilization, get_fy_first_day
 from employees.models import UserData
 
 class DashboardReportsList(ListView):
@@ -52,27 +62,196 @@ class DashboardReportsList(ListView):
         )
         return available_reports
 
+    def get_context_data(self, **kwargs):
+        context = super(DashboardReportsList, self).get_context_data(**kwargs)
+        # Trend of hours billed, by fiscal year, from the fiscal year series.
+        series = FiscalYearHours.objects.filter(
+            reporting_period__in=context['object_list']
+        ).values(
+            'fiscal_year',
+            'reporting_period__end_date',
+        ).annotate(
+            hours=Sum('hours'),
+            fytd_hours=Sum('fytd_hours'),
+        ).order_by('reporting_period__end_date')
+        context['series'] = json.dumps([
+            {
+                'fiscal_year': 'FY{}'.format(row['fiscal_year']),
+                'end_date': row['reporting_period__end_date'].isoformat(),
+                'hours': float(row['hours']),
+                'fytd_hours': float(row['fytd_hours']),
+            }
+            for row in series
+        ])
+        return context
+
 class DashboardView(TemplateView):
     template_name = 'hours/dashboard.html'
 
-    def get_context_data(self, **kwargs):
+    @staticmethod
+    def clean_result(result):
+        if result:
+            pass
+        else:
+            result = 0
+        return result
 
-        # Helper functions.
-        def clean_result(result):
-            if result:
-                pass
-            else:
-                result = 0
-            return result
+    @staticmethod
+    def calc_result(performance, target):
+        try:
+            variance = float(performance) - float(target)
+            p_variance = variance / target
+            return variance, p_variance
+        except ZeroDivisionError:
+            return 0, 0
+
+    def get_performance(self, target, percent_of_year, org_proportion,
+                        hours_billed_fytd, hours_billed_weekly):
+        """Works out the targets and the performance against them of a
+        proportion of the organization, without touching the database."""
+        clean_result = self.clean_result
+        calc_result = self.calc_result
 
-        def calc_result(performance, target):
-            try:
-                variance = float(performance) - float(target)
-                p_variance = variance / target
-                return variance, p_variance
-            except ZeroDivisionError:
-                return 0, 0
+        # Calculated targets.
+        hours_required_cr_fytd = \
+            target.hours_target_cr * percent_of_year * org_proportion
+        hours_required_plan_fytd = \
+            target.hours_target_plan * percent_of_year * org_proportion
+        revenue_required_cr_fytd = \
+            target.revenue_target_cr * percent_of_year * org_proportion
+        revenue_required_plan_fytd = \
+            target.revenue_target_plan * percent_of_year * org_proportion
+        hours_required_cr_weekly = \
+            (target.hours_target_cr / target.periods) * org_proportion
+        hours_required_plan_weekly = \
+            (target.hours_target_plan / target.periods) * org_proportion
+        revenue_required_cr_weekly = \
+            (target.revenue_target_cr / target.periods) * org_proportion
+        revenue_required_plan_weekly = \
+            (target.revenue_target_plan / target.periods) * org_proportion
+
+        hours_billed_fytd = clean_result(hours_billed_fytd)
+        rev_fytd = hours_billed_fytd * target.labor_rate
+        hours_billed_weekly = clean_result(hours_billed_weekly)
+        rev_weekly = hours_billed_weekly * target.labor_rate
+
+        variance_cr_ytd, p_variance_cr_fytd = calc_result(
+            hours_billed_fytd, hours_required_cr_fytd
+        )
+        variance_plan_fytd, p_variance_plan_fytd = calc_result(
+            hours_billed_fytd, hours_required_plan_fytd
+        )
+        variance_cr_weekly, p_variance_cr_weekly = calc_result(
+            hours_billed_weekly, hours_required_cr_weekly
+        )
+        variance_plan_weekly, p_variance_plan_weekly = calc_result(
+            hours_billed_weekly, hours_required_plan_weekly
+        )
+        variance_rev_cr_ytd, p_variance_rev_cr_ytd = calc_result(
+            rev_fytd, revenue_required_cr_fytd
+        )
+        variance_rev_plan_ytd, p_variance_rev_plan_ytd = calc_result(
+            rev_fytd, revenue_required_plan_fytd
+        )
+        variance_rev_cr_weekly, p_variance_rev_cr_weekly = calc_result(
+            rev_weekly, revenue_required_cr_weekly
+        )
+        variance_rev_plan_weekly, p_variance_rev_plan_weekly = calc_result(
+            rev_weekly, revenue_required_plan_weekly
+        )
+
+        return {
+            # Annual performance
+            'hours_required_cr_fytd':'{:,}'.format(
+                round(hours_required_cr_fytd,2)
+            ),
+            'hours_required_plan_fytd':'{:,}'.format(
+                round(hours_required_plan_fytd,2)
+            ),
+            'hours_billed_fytd':'{:,}'.format(
+                round(hours_billed_fytd,2)
+            ),
+            'variance_cr_ytd':'{:,}'.format(
+                round(variance_cr_ytd,2)
+            ),
+            'variance_plan_fytd':'{:,}'.format(
+                round(variance_plan_fytd,2)
+            ),
+            'p_variance_cr_fytd':'{0:.2%}'.format(
+                p_variance_cr_fytd
+            ),
+            'p_variance_plan_fytd':'{0:.2%}'.format(
+                p_variance_plan_fytd
+            ),
+            'revenue_required_cr_fytd':'${:,}'.format(
+                round(revenue_required_cr_fytd)
+            ),
+            'revenue_required_plan_fytd':'${:,}'.format(
+                round(revenue_required_plan_fytd)
+            ),
+            'rev_fytd':'${:,}'.format(
+                round(rev_fytd)
+            ),
+            'variance_rev_cr_ytd':'${:,}'.format(
+                round(variance_rev_cr_ytd)
+            ),
+            'variance_rev_plan_ytd':'${:,}'.format(
+                round(variance_rev_plan_ytd)
+            ),
+            'p_variance_rev_cr_ytd':'{0:.2%}'.format(
+                p_variance_rev_cr_ytd
+            ),
+            'p_variance_rev_plan_ytd':'{0:.2%}'.format(
+                p_variance_rev_plan_ytd
+            ),
+            # Weekly performance.
+            'hours_required_cr_weekly':'{:,}'.format(
+                round(hours_required_cr_weekly,2)
+            ),
+            'hours_required_plan_weekly':'{:,}'.format(
+                round(hours_required_plan_weekly,2)
+            ),
+            'hours_billed_weekly':'{:,}'.format(
+                round(hours_billed_weekly,2)
+            ),
+            'variance_cr_weekly':'{:,}'.format(
+                round(variance_cr_weekly,2)
+            ),
+            'variance_plan_weekly':'{:,}'.format(
+                round(variance_plan_weekly,2)
+            ),
+            'p_variance_cr_weekly':'{0:.2%}'.format(
+                p_variance_cr_weekly
+            ),
+            'p_variance_plan_weekly':'{0:.2%}'.format(
+                p_variance_plan_weekly
+            ),
+            'revenue_required_cr_weekly':'${:,}'.format(
+                round(revenue_required_cr_weekly)
+            ),
+            'revenue_required_plan_weekly':'${:,}'.format(
+                round(revenue_required_plan_weekly)
+            ),
+            'rev_weekly':'${:,}'.format(
+                round(rev_weekly)
+            ),
+            'variance_rev_cr_weekly':'${:,}'.format(
+                round(variance_rev_cr_weekly)
+            ),
+            'variance_rev_plan_weekly':'${:,}'.format(
+                round(variance_rev_plan_weekly)
+            ),
+            'p_variance_rev_cr_weekly':'{0:.2%}'.format(
+                p_variance_rev_cr_weekly
+            ),
+            'p_variance_rev_plan_weekly':'{0:.2%}'.format(
+                p_variance_rev_plan_weekly
+            ),
+        }
+
+    def get_context_data(self, **kwargs):
 
+        # Helper functions.
         def get_params(key):
             try:
                 param = self.request.GET[key]
@@ -84,7 +263,7 @@ class DashboardView(TemplateView):
         context = super(DashboardView, self).get_context_data(**kwargs)
 
         # Get unit param.
-        unit_param = None #get_params('unit')
+        unit_param = get_params('unit')
 
         # Get requested date and corresponding reporting period.
         requested_date = dt.datetime.strptime(
@@ -107,30 +286,29 @@ class DashboardView(TemplateView):
             )
             return context
 
-        # Get all current employees.
-        employees = UserData.objects.filter(
-            is_18f_employee=True,
-            current_employee=True
-        ).exclude(unit__in=[4, 9, 14, 15])
-        units = []
-        missing_units = []
-        for e in employees:
-            if e.unit:
-                units.append(
-                    (e.unit, e.get_unit_display())
-                )
-            else:
-                missing_units.append(e)
-
-        units = sorted(set(units), key=lambda x: x[1])
+        # Get employees and hours billed of every unit at once; see
+        # hours.rollups.dashboard_units.
+        unit_data = rollups.dashboard_units(rp_selected)
+        units = unit_data['units']
+        employees = unit_data['employees']
+        all_count = sum(employees.values())
 
         # Narrow to unit employees, if applicable.
         if unit_param:
-            all_count = employees.count()
-            employees = employees.filter(unit=unit_param)
-            org_proportion = employees.count() / all_count
+            try:
+                unit_param = int(unit_param)
+            except ValueError:
+                pass
+            if unit_param not in dict(UserData.UNIT_CHOICES):
+                context.update(
+                    {
+                        'error':'No unit available for {}.'\
+                        .format(get_params('unit'))
+                    }
+                )
+                return context
         else:
-            org_proportion = 1
+            unit_param = None
 
         # Get calendar info.
         fytd_start_date = get_fy_first_day(requested_date)
@@ -151,76 +329,46 @@ class DashboardView(TemplateView):
             )
             return context
 
-        # Calculated targets.
-        hours_required_cr_fytd = \
-            target.hours_target_cr * percent_of_year * org_proportion
-        hours_required_plan_fytd = \
-            target.hours_target_plan * percent_of_year * org_proportion
-        revenue_required_cr_fytd = \
-            target.revenue_target_cr * percent_of_year * org_proportion
-        revenue_required_plan_fytd = \
-            target.revenue_target_plan * percent_of_year * org_proportion
-        hours_required_cr_weekly = \
-            (target.hours_target_cr / target.periods) * org_proportion
-        hours_required_plan_weekly = \
-            (target.hours_target_plan / target.periods) * org_proportion
-        revenue_required_cr_weekly = \
-            (target.revenue_target_cr / target.periods) * org_proportion
-        revenue_required_plan_weekly = \
-            (target.revenue_target_plan / target.periods) * org_proportion
-
-        # Get hours billed for fiscal year to date and clean result.
-        hours_billed_fytd = clean_result(TimecardObject.objects.filter(
-            timecard__reporting_period__start_date__gte=fytd_start_date,
-            timecard__reporting_period__end_date__lte=requested_date,
-            project__accounting_code__billable=True,
-            timecard__user__user_data__in=employees
-        ).exclude(
-            project__profit_loss_account__name='FY17 Acquisition Svcs Billable'
-        ).aggregate(Sum('hours_spent'))['hours_spent__sum'])
-        rev_fytd = hours_billed_fytd * target.labor_rate
-
-        # Get data for reporting period and clean result.
-        hours_billed_weekly = clean_result(TimecardObject.objects.filter(
-            timecard__reporting_period__start_date=\
-                rp_selected.start_date.strftime('%Y-%m-%d'),
-            project__accounting_code__billable=True,
-            timecard__user__user_data__in=employees
-        ).exclude(
-            project__profit_loss_account__name='FY17 Acquisition Svcs Billable'
-        ).aggregate(Sum('hours_spent'))['hours_spent__sum'])
-        rev_weekly = hours_billed_weekly * target.labor_rate
+        def unit_performance(unit):
+            """Performance of a unit's share of the organization."""
+            hours_billed_weekly, hours_billed_fytd = \
+                unit_data['hours'].get(unit, (0, 0))
+            return self.get_performance(
+                target,
+                percent_of_year,
+                employees.get(unit, 0) / all_count if all_count else 0,
+                hours_billed_fytd,
+                hours_billed_weekly
+            )
 
-        variance_cr_ytd, p_variance_cr_fytd = calc_result(
-            hours_billed_fytd, hours_required_cr_fytd
-        )
-        variance_plan_fytd, p_variance_plan_fytd = calc_result(
-            hours_billed_fytd, hours_required_plan_fytd
-        )
-        variance_cr_weekly, p_variance_cr_weekly = calc_result(
-            hours_billed_weekly, hours_required_cr_weekly
-        )
-        variance_plan_weekly, p_variance_plan_weekly = calc_result(
-            hours_billed_weekly, hours_required_plan_weekly
-        )
-        variance_rev_cr_ytd, p_variance_rev_cr_ytd = calc_result(
-            rev_fytd, revenue_required_cr_fytd
-        )
-        variance_rev_plan_ytd, p_variance_rev_plan_ytd = calc_result(
-            rev_fytd, revenue_required_plan_fytd
-        )
-        variance_rev_cr_weekly, p_variance_rev_cr_weekly = calc_result(
-            rev_weekly, revenue_required_cr_weekly
-        )
-        variance_rev_plan_weekly, p_variance_rev_plan_weekly = calc_result(
-            rev_weekly, revenue_required_plan_weekly
-        )
+        # Get hours billed for the reporting period and fiscal year to date
+        # of the organization, or of the selected unit.
+        if unit_param is None:
+            performance = self.get_performance(
+                target,
+                percent_of_year,
+                1,
+                sum(fytd_hours for _, fytd_hours
+                    in unit_data['hours'].values()),
+                sum(hours for hours, _ in unit_data['hours'].values())
+            )
+        else:
+            performance = unit_performance(unit_param)
 
         # Update context.
+        context.update(performance)
         context.update(
             {   # Unit data.
                 'units':units,
-                'missing_units':missing_units,
+                'missing_units':unit_data['missing_units'],
+                'unit_selected':unit_param,
+                'unit_selected_name':dict(UserData.UNIT_CHOICES).get(
+                    unit_param
+                ),
+                'unit_performance':[
+                    dict(unit_performance(unit), unit=unit, unit_name=name)
+                    for unit, name in units
+                ],
                 # Target info.
                 'revenue_target_cr':'${:,}'.format(
                     target.revenue_target_cr
@@ -235,97 +383,11 @@ class DashboardView(TemplateView):
                 # Temporal info.
                 'rp_selected':rp_selected,
                 'fytd_start_date':fytd_start_date,
-                # Annual performance
-                'hours_required_cr_fytd':'{:,}'.format(
-                    round(hours_required_cr_fytd,2)
-                ),
-                'hours_required_plan_fytd':'{:,}'.format(
-                    round(hours_required_plan_fytd,2)
-                ),
-                'hours_billed_fytd':'{:,}'.format(
-                    round(hours_billed_fytd,2)
-                ),
-                'variance_cr_ytd':'{:,}'.format(
-                    round(variance_cr_ytd,2)
-                ),
-                'variance_plan_fytd':'{:,}'.format(
-                    round(variance_plan_fytd,2)
-                ),
-                'p_variance_cr_fytd':'{0:.2%}'.format(
-                    p_variance_cr_fytd
-                ),
-                'p_variance_plan_fytd':'{0:.2%}'.format(
-                    p_variance_plan_fytd
-                ),
-                'revenue_required_cr_fytd':'${:,}'.format(
-                    round(revenue_required_cr_fytd)
-                ),
-                'revenue_required_plan_fytd':'${:,}'.format(
-                    round(revenue_required_plan_fytd)
-                ),
-                'rev_fytd':'${:,}'.format(
-                    round(rev_fytd)
-                ),
-                'variance_rev_cr_ytd':'${:,}'.format(
-                    round(variance_rev_cr_ytd)
-                ),
-                'variance_rev_plan_ytd':'${:,}'.format(
-                    round(variance_rev_plan_ytd)
-                ),
-                'p_variance_rev_cr_ytd':'{0:.2%}'.format(
-                    p_variance_rev_cr_ytd
-                ),
-                'p_variance_rev_plan_ytd':'{0:.2%}'.format(
-                    p_variance_rev_plan_ytd
-                ),
-                # Weekly performance.
-                'hours_required_cr_weekly':'{:,}'.format(
-                    round(hours_required_cr_weekly,2)
-                ),
-                'hours_required_plan_weekly':'{:,}'.format(
-                    round(hours_required_plan_weekly,2)
-                ),
-                'hours_billed_weekly':'{:,}'.format(
-                    round(hours_billed_weekly,2)
-                ),
-                'variance_cr_weekly':'{:,}'.format(
-                    round(variance_cr_weekly,2)
-                ),
-                'variance_plan_weekly':'{:,}'.format(
-                    round(variance_plan_weekly,2)
-                ),
-                'p_variance_cr_weekly':'{0:.2%}'.format(
-                    p_variance_cr_weekly
-                ),
-                'p_variance_plan_weekly':'{0:.2%}'.format(
-                    p_variance_plan_weekly
-                ),
-                'revenue_required_cr_weekly':'${:,}'.format(
-                    round(revenue_required_cr_weekly)
-                ),
-                'revenue_required_plan_weekly':'${:,}'.format(
-                    round(revenue_required_plan_weekly)
-                ),
-                'rev_weekly':'${:,}'.format(
-                    round(rev_weekly)
-                ),
-                'variance_rev_cr_weekly':'${:,}'.format(
-                    round(variance_rev_cr_weekly)
-                ),
-                'variance_rev_plan_weekly':'${:,}'.format(
-                    round(variance_rev_plan_weekly)
-                ),
-                'p_variance_rev_cr_weekly':'{0:.2%}'.format(
-                    p_variance_rev_cr_weekly
-                ),
-                'p_variance_rev_plan_weekly':'{0:.2%}'.format(
-                    p_variance_rev_plan_weekly
-                ),
-
             }
         )
         return context
 
+
 class BulkTimecardSerializer(serializers.Serializer):
     project_name = serializers.CharField(source='project.name')
     project_id = serializers.CharField(source='project.id')
@@ -361,6 +423,15 @@ class GeneralSnippetsTimecardSerializer(serializers.Serializer):
     notes = serializers.CharField()
     unit = serializers.SerializerMethodField()
 
+    # Lets api.compiled export `unit` without calling get_unit().
+    unit_choices = dict(UserData.UNIT_CHOICES)
+    compiled_fields = {
+        'unit': (
+            'timecard__user__user_data__unit',
+            lambda unit, choices=unit_choices: choices.get(unit, unit)
+        ),
+    }
+
     def get_unit(self,obj):
         try:
             unit = obj.timecard.user.user_data.get_unit_display()
@@ -422,22 +493,55 @@ def projects_csv(request):
     serializer = ProjectSerializer()
     return stream_csv(queryset, serializer)
 
+def timecard_params(view):
+    """
+    Answer invalid timecard query parameters (such as an unknown name in
+    `fields`) with 400 Bad Request, as the API does.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ParseError as e:
+            return HttpResponseBadRequest(e.detail, content_type='text/plain')
+    return wrapper
+
+def stream_bulk_csv(request, name, queryset, serializer_class, stream):
+    """
+    Stream a bulk timecard export. Exports of all timecards (optionally
+    limited to some `fields`) read closed reporting periods from their
+    snapshots, see hours.snapshots; filtered exports use `stream`.
+    """
+    if set(request.GET).issubset({'fields'}):
+        return snapshots.stream_snapshot_csv(name, queryset, serializer_class)
+    return stream(queryset, serializer_class)
+
+@timecard_params
 def bulk_timecard_list(request):
     """
-    Stream all the timecards as CSV.
+    Stream all the timecards as CSV. Accepts the timecards API filters and
+    a comma-separated `fields` parameter to limit the columns.
     """
     queryset = get_timecards(TimecardList.queryset, request.GET)
-    serializer = BulkTimecardSerializer()
-    return stream_csv(queryset, serializer)
+    serializer_class = get_serializer_class(request.GET, BulkTimecardSerializer)
+    return stream_bulk_csv(
+        request, 'bulk', queryset, serializer_class, stream_copy_csv
+    )
 
+@timecard_params
 def slim_bulk_timecard_list(request):
     """
     Stream a slimmed down version of all the timecards as CSV.
     """
     queryset = get_timecards(TimecardList.queryset, request.GET)
-    serializer = SlimBulkTimecardSerializer()
-    return stream_csv(queryset, serializer)
+    serializer_class = get_serializer_class(
+        request.GET, SlimBulkTimecardSerializer
+    )
+    return stream_bulk_csv(
+        request, 'slim', queryset, serializer_class, stream_compiled_csv
+    )
 
+@timecard_params
 def general_snippets_only_timecard_list(request):
     """
     Stream all timecard data that is for General and has a snippet.
@@ -447,9 +551,15 @@ def general_snippets_only_timecard_list(request):
         notes__isnull=False
     )
     queryset = get_timecards(objects, request.GET)
-    serializer = GeneralSnippetsTimecardSerializer()
-    return stream_csv(queryset, serializer)
+    serializer_class = get_serializer_class(
+        request.GET, GeneralSnippetsTimecardSerializer
+    )
+    return stream_bulk_csv(
+        request, 'general_snippets', queryset, serializer_class,
+        stream_compiled_csv
+    )
 
+@timecard_params
 def timeline_view(request, value_fields=(), **field_alias):
     """ CSV endpoint for the project timeline viz. """
     queryset = get_timecards(TimecardList.queryset, request.GET)
@@ -504,10 +614,15 @@ def user_timeline_view(request):
     )
 
 @user_passes_test(lambda u: u.is_superuser)
+@timecard_params
 def admin_bulk_timecard_list(request):
     queryset = get_timecards(TimecardList.queryset, request.GET)
-    serializer = AdminBulkTimecardSerializer()
-    return stream_csv(queryset, serializer)
+    serializer_class = get_serializer_class(
+        request.GET, AdminBulkTimecardSerializer
+    )
+    return stream_bulk_csv(
+        request, 'admin', queryset, serializer_class, stream_copy_csv
+    )
 
 class ReportingPeriodListView(PermissionMixin, ListView):
     """ Currently the home view that lists the completed and missing time
@@ -606,32 +721,38 @@ class ReportingPeriodBulkImportView(PermissionMixin, FormView):
 
             c = csv.DictReader(line_items)
 
-            for line_item in c:
-                user, created = get_user_model().objects.get_or_create(
-                    username=email_to_username(line_item['Tock Name'].lower()))
-
-                timecard, created = Timecard.objects.get_or_create(
-                    user=user, reporting_period=reporting_period)
-
-                timecard.save()
-
-                try:
-                    project = Project.objects.get(id=line_item['Tock Code'])
-                except Project.DoesNotExist:
-                    raise ValidationError(
-                        'Project %s (Code %s) Does Not Exist' %
-                        (line_item['Tock Proj. Name'], line_item['Tock Code']))
-
-                try:
-                    TimecardObject.objects.get(
-                        timecard=timecard,
-                        project=project,
-                        hours_spent=line_item['Hours Logged'])
-                except TimecardObject.DoesNotExist:
-                    TimecardObject.objects.create(
-                        timecard=timecard,
-                        project=project,
-                        hours_spent=line_item['Hours Logged'])
+            # Refresh the rollups of each timecard once, after all of its
+            # lines are imported.
+            with transaction.atomic(), rollups.batch():
+                for line_item in c:
+                    user, created = get_user_model().objects.get_or_create(
+                        username=email_to_username(
+                            line_item['Tock Name'].lower()))
+
+                    timecard, created = Timecard.objects.get_or_create(
+                        user=user, reporting_period=reporting_period)
+
+                    timecard.save()
+
+                    try:
+                        project = Project.objects.get(
+                            id=line_item['Tock Code'])
+                    except Project.DoesNotExist:
+                        raise ValidationError(
+                            'Project %s (Code %s) Does Not Exist' %
+                            (line_item['Tock Proj. Name'],
+                             line_item['Tock Code']))
+
+                    try:
+                        TimecardObject.objects.get(
+                            timecard=timecard,
+                            project=project,
+                            hours_spent=line_item['Hours Logged'])
+                    except TimecardObject.DoesNotExist:
+                        TimecardObject.objects.create(
+                            timecard=timecard,
+                            project=project,
+                            hours_spent=line_item['Hours Logged'])
 
         return super(ReportingPeriodBulkImportView, self).form_valid(form)
 
@@ -639,63 +760,99 @@ class ReportingPeriodBulkImportView(PermissionMixin, FormView):
         return reverse("ListReportingPeriods")
 
 
+class TimecardRequest(object):
+    """
+    What a single TimecardView request needs to look up, each loaded at
+    most once however many times the view, its formset and the Float
+    data ask for it.
+    """
+
+    def __init__(self, request, start_date):
+        self.request = request
+        self.start_date = start_date
+
+    @cached_property
+    def reporting_period(self):
+        return ReportingPeriod.objects.get(start_date=self.start_date)
+
+    @cached_property
+    def user_data(self):
+        return self.request.user.user_data
+
+    @cached_property
+    def float_data(self):
+        return float_tasks_for_view(
+            self.request.user, self.reporting_period, self.user_data)
+
+
 class TimecardView(UpdateView):
     form_class = TimecardForm
     template_name = 'hours/timecard_form.html'
 
+    def dispatch(self, request, *args, **kwargs):
+        self.timecard_request = TimecardRequest(
+            request, kwargs['reporting_period'])
+        return super(TimecardView, self).dispatch(request, *args, **kwargs)
+
     def get_object(self, queryset=None):
         self.report_date = dt.datetime.strptime(
             self.kwargs['reporting_period'], "%Y-%m-%d"
         ).date()
-        r = ReportingPeriod.objects.get(start_date=self.report_date)
+        r = self.timecard_request.reporting_period
         obj, created = Timecard.objects.get_or_create(
             reporting_period_id=r.id,
             user_id=self.request.user.id)
+        obj.reporting_period = r
         return obj
 
     def get_context_data(self, **kwargs):
         context = super(TimecardView, self).get_context_data(**kwargs)
 
-        base_reporting_period = ReportingPeriod.objects.get(
-            start_date=self.kwargs['reporting_period'])
-        aws_eligible = UserData.objects.get(
-            user=self.request.user).is_aws_eligible
+        base_reporting_period = self.timecard_request.reporting_period
 
-        formset = self.get_formset()
-        formset.set_is_aws_eligible(aws_eligible)
-        formset.set_exact_working_hours(base_reporting_period.exact_working_hours)
-        formset.set_max_working_hours(base_reporting_period.max_working_hours)
-        formset.set_min_working_hours(base_reporting_period.min_working_hours)
+        context.update({
+            'exact_working_hours': base_reporting_period.exact_working_hours,
+            'min_working_hours': base_reporting_period.min_working_hours,
+            'max_working_hours': base_reporting_period.max_working_hours,
+            'formset': self.get_formset(),
+            'messages': messages.get_messages(self.request),
+            'unsubmitted': not self.object.submitted,
+            'float_data': self.timecard_request.float_data
+        })
+        return context
 
-        reporting_period = ReportingPeriod.objects.get(pk=self.object.reporting_period_id)
+    def get_formset(self):
+        """ Return the formset of this request, built and configured once. """
+        if getattr(self, 'formset', None) is not None:
+            return self.formset
 
+        formset = self.build_formset()
 
-        accounting_codes = []
+        reporting_period = self.timecard_request.reporting_period
+        formset.set_is_aws_eligible(
+            self.timecard_request.user_data.is_aws_eligible)
+        formset.set_exact_working_hours(reporting_period.exact_working_hours)
+        formset.set_max_working_hours(reporting_period.max_working_hours)
+        formset.set_min_working_hours(reporting_period.min_working_hours)
 
         # TODO: This is inefficient because we're writing over the
         # already-generated choices. Ideally we should be passing these
         # into the formset constructor.
-        choices = projects_as_choices(reporting_period.get_projects())
+        choices, options_html = reporting_period_project_options(
+            reporting_period
+        )
 
         for form in formset.forms:
             form.fields['project'].choices = choices
+            form.fields['project'].widget.options_html = options_html
 
         if self.request.POST.get('save_only') is not None:
             formset.save_only = True
 
-        context.update({
-            'exact_working_hours': base_reporting_period.exact_working_hours,
-            'min_working_hours': base_reporting_period.min_working_hours,
-            'max_working_hours': base_reporting_period.max_working_hours,
-            'formset': formset,
-            'messages': messages.get_messages(self.request),
-            'unsubmitted': not self.object.submitted,
-            'float_data': float_tasks_for_view(
-                self.request.user, base_reporting_period)
-        })
-        return context
+        self.formset = formset
+        return formset
 
-    def get_formset(self):
+    def build_formset(self):
         post = self.request.POST
 
         if post:
@@ -724,9 +881,8 @@ class TimecardView(UpdateView):
             )
             extra = len(project_ids) + 1
 
-        rp = ReportingPeriod.objects \
-            .prefetch_related('holiday_prefills__project') \
-            .get(start_date=self.kwargs['reporting_period'])
+        rp = self.timecard_request.reporting_period
+        prefetch_related_objects([rp], 'holiday_prefills__project')
 
         init = []
         if rp.holiday_prefills:
@@ -741,18 +897,22 @@ class TimecardView(UpdateView):
 
 
     def form_valid(self, form):
-        context = self.get_context_data()
-        formset = context['formset']
+        formset = self.get_formset()
         if formset.is_valid():
             self.object = form.save(commit=False)
             self.object.user = self.request.user
             self.object.submitted = not formset.save_only
-            self.object.reporting_period = ReportingPeriod.objects.get(
-                start_date=self.kwargs['reporting_period'])
-            self.object.save()
-            formset.instance = self.object
-            formset.save()
-            return super(UpdateView, self).form_valid(form)
+            self.object.reporting_period = \
+                self.timecard_request.reporting_period
+            # Save the timecard, its line items and the rollups they feed
+            # (see hours.rollups) together.
+            with transaction.atomic(), rollups.batch():
+                self.object.save()
+                formset.instance = self.object
+                formset.save()
+            # The timecard is saved above; skip ModelFormMixin saving it
+            # a second time.
+            return HttpResponseRedirect(self.get_success_url())
         else:
             return self.render_to_response(self.get_context_data(form=form))
 
@@ -830,12 +990,48 @@ class ReportingPeriodDetailView(ListView):
 
 
 def ReportingPeriodCSVView(request, reporting_period):
-    """Export a CSV of a specific reporting period"""
+    """Export a CSV of a specific reporting period. Periods that have ended
+    are served from a snapshot, see hours.snapshots."""
     response = HttpResponse(content_type='text/csv')
     disposition = 'attachment; filename="{0}.csv"'.format(reporting_period)
     response['Content-Disposition'] = disposition
 
-    writer = csv.writer(response)
+    response.write(next(generate_csv([[
+        "Reporting Period", "Last Modified", "User", "Project",
+        "Number of Hours"
+    ]])))
+
+    period = ReportingPeriod.objects.filter(start_date=reporting_period) \
+        .values_list('id', 'end_date').first()
+    if period and period[1] < dt.date.today():
+        path = snapshots.snapshot_path(
+            'reporting_period', period[0], snapshots.snapshot_key(period[0]),
+            lambda: generate_csv(reporting_period_rows(reporting_period))
+        )
+        for chunk in snapshots.read_snapshot(path):
+            response.write(chunk)
+    else:
+        for chunk in generate_csv(reporting_period_rows(reporting_period)):
+            response.write(chunk)
+
+    return response
+
+
+def planned_vs_actual_csv(request, reporting_period):
+    """Export the hours scheduled in Float against the hours submitted for a
+    reporting period, by unit and project. See hours.planning."""
+    period = get_object_or_404(ReportingPeriod, start_date=reporting_period)
+    response = HttpResponse(content_type='text/csv')
+    disposition = 'attachment; filename="{0}-planned-vs-actual.csv"'.format(
+        reporting_period)
+    response['Content-Disposition'] = disposition
+    for chunk in generate_csv(
+            [planning.HEADER] + planning.planned_vs_actual(period)):
+        response.write(chunk)
+    return response
+
+
+def reporting_period_rows(reporting_period):
     timecard_objects = TimecardObject.objects.filter(
         timecard__reporting_period__start_date=reporting_period
     ).order_by(
@@ -846,22 +1042,17 @@ def ReportingPeriodCSVView(request, reporting_period):
         'project',
     )
 
-    writer.writerow(["Reporting Period", "Last Modified", "User", "Project",
-                     "Number of Hours"])
     for timecard_object in timecard_objects:
         # skip entries if timecard not submitted yet
         if not timecard_object.timecard.submitted:
             continue
 
-        writer.writerow(
-            ["{0} - {1}".format(
-                timecard_object.timecard.reporting_period.start_date,
-                timecard_object.timecard.reporting_period.end_date),
-             timecard_object.timecard.modified.strftime("%Y-%m-%d %H:%M:%S"),
-             timecard_object.timecard.user.username, timecard_object.project,
-             timecard_object.hours_spent])
-
-    return response
+        yield ["{0} - {1}".format(
+                   timecard_object.timecard.reporting_period.start_date,
+                   timecard_object.timecard.reporting_period.end_date),
+               timecard_object.timecard.modified.strftime("%Y-%m-%d %H:%M:%S"),
+               timecard_object.timecard.user.username, timecard_object.project,
+               timecard_object.hours_spent]
 
 
 class ReportingPeriodUserDetailView(DetailView):
@@ -879,26 +1070,24 @@ class ReportingPeriodUserDetailView(DetailView):
         return obj
 
     def get_context_data(self, **kwargs):
-        user_billable_hours = TimecardObject.objects.filter(
-            timecard__reporting_period__start_date=\
-                self.kwargs['reporting_period'],
-            timecard__user__username=self.kwargs['username'],
-            project__accounting_code__billable=True
-        ).aggregate(
-            (
-                Sum('hours_spent')
-            )
-        )['hours_spent__sum']
-
-        user_all_hours = TimecardObject.objects.filter(
-            timecard__reporting_period__start_date=\
-                self.kwargs['reporting_period'],
-            timecard__user__username=self.kwargs['username'],
-        ).aggregate(
-            (
-                Sum('hours_spent')
-            )
-        )['hours_spent__sum']
+        rollup = ReportingPeriodHours.objects.filter(
+            user_id=self.object.user_id,
+            reporting_period_id=self.object.reporting_period_id
+        ).first()
+        if rollup is not None:
+            user_billable_hours = rollup.billable_hours
+            user_all_hours = rollup.total_hours
+        else:
+            # Unsubmitted timecards are not rolled up; sum their prefetched
+            # line items instead.
+            line_items = self.object.timecardobjects.all()
+            user_billable_hours = functools.reduce(add_hours, (
+                line_item.hours_spent for line_item in line_items
+                if line_item.project.accounting_code.billable
+            ), None)
+            user_all_hours = functools.reduce(add_hours, (
+                line_item.hours_spent for line_item in line_items
+            ), None)
 
         context = super(
             ReportingPeriodUserDetailView, self).get_context_data(**kwargs)
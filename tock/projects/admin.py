@@ -77,6 +77,7 @@ class ProjectAdmin(admin.ModelAdmin):
     fields = [
         'name',
         'mbnumber',
+        'float_project_id',
         'accounting_code',
         'profit_loss_account',
         'project_lead',
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2026-10-18 03:15
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0021_auto_20161116_1452'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='float_project_id',
+            field=models.IntegerField(blank=True, help_text='The project scheduled in Float for this project, which the planned-vs-actual report matches its hours by.', null=True, unique=True, verbose_name='Float "project_id" attribute'),
+        ),
+    ]
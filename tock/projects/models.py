@@ -161,6 +161,13 @@ class Project(models.Model):
     """ Stores information about a specific project"""
     name = models.CharField(max_length=200)
     mbnumber = models.CharField(max_length=200, blank=True, verbose_name="MB Number")
+    float_project_id = models.IntegerField(
+        null=True,
+        blank=True,
+        unique=True,
+        verbose_name='Float "project_id" attribute',
+        help_text='The project scheduled in Float for this project, which the planned-vs-actual report matches its hours by.'
+    )
     accounting_code = models.ForeignKey(AccountingCode,
                                         verbose_name="Accounting Code")
     description = models.TextField(blank=True, null=True)
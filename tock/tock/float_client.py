@@ -0,0 +1,61 @@
+"""
+HTTP client for the Float API.
+
+All calls share one requests.Session, so connections to Float are pooled
+and kept alive instead of opening a new TLS connection per call. Every
+call has a timeout and failed calls are retried a few times with
+exponential backoff. fetch_concurrently() runs independent calls on a
+small shared thread pool.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from tock.settings import base
+
+# Float calls made at once, and kept-alive connections to Float.
+MAX_WORKERS = 4
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=base.FLOAT_API_RETRIES,
+                backoff_factor=base.FLOAT_API_BACKOFF,
+                status_forcelist=(500, 502, 503, 504),
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=MAX_WORKERS,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+    return _session
+
+
+def get(url, params=None, headers=None):
+    return get_session().get(
+        url,
+        params=params,
+        headers=headers,
+        timeout=base.FLOAT_API_TIMEOUT,
+    )
+
+
+def fetch_concurrently(*calls):
+    """Call each of `calls` on the thread pool and return their results
+    in the same order. The first exception raised is re-raised."""
+    futures = [_executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
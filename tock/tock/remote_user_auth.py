@@ -48,7 +48,9 @@ class UserDataMiddleware(object):
         """
         if request.user.is_authenticated():
             try:
-                user = UserData.objects.get(user=request.user)
+                # Through the accessor, so that views reading
+                # request.user.user_data do not query it again.
+                request.user.user_data
             except UserData.DoesNotExist:
                 UserData.objects.create(
                     user=request.user,
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
 import json
+import tempfile
 
 from django.utils.crypto import get_random_string
 
@@ -32,6 +33,17 @@ def get_cups_key(keyname):
 FLOAT_API_KEY = get_cups_key('float-key')
 FLOAT_API_URL_BASE = 'https://api.float.com/api/v1'
 FLOAT_API_HEADER = {'Authorization': 'Bearer ' + FLOAT_API_KEY}
+# Seconds to wait on the Float API, and to serve its responses from the
+# cache: fresh for FLOAT_CACHE_TTL, then while being refreshed in the
+# background, or if refreshing fails, until FLOAT_CACHE_STALE_TTL.
+FLOAT_API_TIMEOUT = int(os.environ.get('FLOAT_API_TIMEOUT', 5))
+FLOAT_CACHE_TTL = int(os.environ.get('FLOAT_CACHE_TTL', 60 * 15))
+FLOAT_CACHE_STALE_TTL = int(
+    os.environ.get('FLOAT_CACHE_STALE_TTL', 60 * 60 * 24 * 7))
+# Retries of failed Float calls, waiting FLOAT_API_BACKOFF seconds, then
+# twice that, and so on in between.
+FLOAT_API_RETRIES = int(os.environ.get('FLOAT_API_RETRIES', 2))
+FLOAT_API_BACKOFF = float(os.environ.get('FLOAT_API_BACKOFF', 0.5))
 
 INSTALLED_APPS = (
     'django.contrib.contenttypes',  # may be okay to remove
@@ -94,6 +106,13 @@ USE_L10N = True
 USE_TZ = True
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+
+# Where snapshots of timecard exports for closed reporting periods are kept
+# (see hours.snapshots). Local disk is fine; a missing snapshot is rebuilt.
+EXPORT_SNAPSHOT_DIR = os.environ.get(
+    'EXPORT_SNAPSHOT_DIR',
+    os.path.join(tempfile.gettempdir(), 'tock-snapshots')
+)
 STATIC_URL = '/static/'
 
 ALLOWED_EMAIL_DOMAINS = {
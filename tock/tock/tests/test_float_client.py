@@ -0,0 +1,36 @@
+import threading
+
+from django.test import SimpleTestCase
+
+from .. import float_client
+from ..settings import base
+from ..utils import get_float_data
+
+
+class FloatClientTests(SimpleTestCase):
+
+    def test_shared_session(self):
+        session = float_client.get_session()
+        self.assertIs(float_client.get_session(), session)
+        adapter = session.get_adapter(base.FLOAT_API_URL_BASE)
+        self.assertEqual(adapter.max_retries.total, base.FLOAT_API_RETRIES)
+
+    def test_fetch_concurrently(self):
+        # Each call waits for the others, so this only finishes if they
+        # all run at once.
+        barrier = threading.Barrier(3, timeout=5)
+
+        def call(value):
+            barrier.wait()
+            return value
+
+        self.assertEqual(
+            float_client.fetch_concurrently(
+                lambda: call(1), lambda: call(2), lambda: call(3)),
+            [1, 2, 3]
+        )
+
+    def test_mocked_float_data(self):
+        calls = [lambda: get_float_data('holidays')] * 3
+        for response in float_client.fetch_concurrently(*calls):
+            self.assertEqual(len(response.json()['holidays']), 1)
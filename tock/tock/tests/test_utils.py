@@ -0,0 +1,60 @@
+import time
+from unittest import mock
+
+import requests
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..settings import base
+from ..utils import (
+    float_cache_key, float_cache_stats, get_float_data, refresh_float_data,
+)
+
+
+class FloatCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hit_and_miss(self):
+        r = get_float_data('holidays', {'start_day': '2016-10-01'})
+        self.assertEqual(len(r.json()['holidays']), 1)
+        self.assertEqual(
+            get_float_data('holidays', {'start_day': '2016-10-01'}).json(),
+            r.json()
+        )
+        stats = float_cache_stats()
+        self.assertEqual((stats['miss'], stats['hit']), (1, 1))
+
+    def test_stale_is_served_while_refreshing(self):
+        key = float_cache_key('holidays')
+        stale = requests.Response()
+        stale._content = b'{"holidays": []}'
+        fetched = time.time() - base.FLOAT_CACHE_TTL - 1
+        cache.set(key, (fetched, stale))
+        # As if another request were refreshing it already.
+        cache.add(key + ':refresh', True)
+        self.assertEqual(get_float_data('holidays').json(), {'holidays': []})
+        self.assertEqual(float_cache_stats()['stale'], 1)
+        self.assertIsNone(refresh_float_data('holidays'))
+
+        cache.delete(key + ':refresh')
+        refresh_float_data('holidays').join()
+        self.assertEqual(
+            len(get_float_data('holidays').json()['holidays']), 1)
+        self.assertEqual(float_cache_stats()['hit'], 1)
+
+    def test_failed_fetch_keeps_last_good_value(self):
+        key = float_cache_key('holidays')
+        stale = requests.Response()
+        stale._content = b'{"holidays": []}'
+        with mock.patch('tock.utils.request_float_data',
+                        side_effect=requests.ConnectionError):
+            self.assertIsNone(get_float_data('holidays'))
+            cache.set(key, (0, stale))
+            refresh_float_data('holidays').join()
+            cache.add(key + ':refresh', True)
+            self.assertEqual(
+                get_float_data('holidays').json(), {'holidays': []})
+        self.assertEqual(float_cache_stats()['error'], 2)
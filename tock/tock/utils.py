@@ -1,5 +1,9 @@
 import functools
+import hashlib
+import json
 import requests
+import threading
+import time
 
 import sys, os
 
@@ -7,9 +11,11 @@ from httmock import urlmatch, HTTMock, all_requests, response
 
 from httmock import urlmatch, HTTMock, all_requests, response
 
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from rest_framework.permissions import BasePermission
 
+from tock import float_client
 from tock.settings import base
 
 class PermissionMixin(object):
@@ -46,7 +52,10 @@ def is_running_test_suite():
     return (os.path.basename(sys.argv[0]) == 'manage.py' and
             len(sys.argv) > 1 and sys.argv[1] == 'test')
 
-def get_float_data(endpoint, params=None):
+FLOAT_MOCK_LOCK = threading.Lock()
+
+
+def request_float_data(endpoint, params=None):
     """Fetch Float data from given endpoint with given params. Different request
       variables used for testing / shell work with the mock Float API."""
 
@@ -85,16 +94,18 @@ def get_float_data(endpoint, params=None):
                     'hours/fixtures/float_timeoffs_fixture.json')
                 return response(200, content, headers, None, 5, request)
 
-        with HTTMock(float_mock):
-            r = requests.get(url=url)
+        # HTTMock patches requests globally, so mocked calls made from
+        # several threads must not overlap.
+        with FLOAT_MOCK_LOCK, HTTMock(float_mock):
+            r = float_client.get(url)
 
     # Otherwise get real data from Float API.
     else:
         print('Fetching data from real Float API server via {}...'.format(url))
-        r = requests.get(
-            url=url,
-            headers=base.FLOAT_API_HEADER,
-            params=params
+        r = float_client.get(
+            url,
+            params=params,
+            headers=base.FLOAT_API_HEADER
         )
 
     # Return response or log error.
@@ -105,6 +116,92 @@ def get_float_data(endpoint, params=None):
             r.url, r.content))
         return None
 
+FLOAT_CACHE_COUNTERS = ('hit', 'miss', 'stale', 'error')
+
+
+def count_float_cache(counter):
+    key = 'float:stats:{}'.format(counter)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted in between.
+        cache.set(key, 1, timeout=None)
+
+
+def float_cache_stats():
+    """Return how many Float lookups were served fresh from the cache
+    ('hit'), fetched ('miss'), served stale ('stale') and failed to fetch
+    ('error')."""
+    keys = ['float:stats:{}'.format(c) for c in FLOAT_CACHE_COUNTERS]
+    counts = cache.get_many(keys)
+    return {c: counts.get(k, 0) for c, k in zip(FLOAT_CACHE_COUNTERS, keys)}
+
+
+def float_cache_key(endpoint, params=None):
+    params = json.dumps(params, sort_keys=True, default=str)
+    return 'float:{}:{}'.format(
+        endpoint, hashlib.sha1(params.encode('utf-8')).hexdigest())
+
+
+def fetch_float_data(endpoint, params=None):
+    """Fetch the Float response of `endpoint` with `params` and cache it,
+    or return None if Float cannot be reached."""
+    try:
+        r = request_float_data(endpoint, params)
+    except requests.RequestException as e:
+        print('Failed call to Float {}: {}'.format(endpoint, e))
+        r = None
+
+    if r is None:
+        count_float_cache('error')
+        return None
+
+    cache.set(
+        float_cache_key(endpoint, params),
+        (time.time(), r),
+        base.FLOAT_CACHE_STALE_TTL
+    )
+    return r
+
+
+def refresh_float_data(endpoint, params=None):
+    """Fetch Float data in a background thread, unless it is already being
+    fetched. Returns the thread, if one was started."""
+    lock = float_cache_key(endpoint, params) + ':refresh'
+    if not cache.add(lock, True, base.FLOAT_API_TIMEOUT * 2):
+        return None
+
+    def refresh():
+        try:
+            fetch_float_data(endpoint, params)
+        finally:
+            cache.delete(lock)
+
+    thread = threading.Thread(target=refresh, daemon=True)
+    thread.start()
+    return thread
+
+
+def get_float_data(endpoint, params=None):
+    """Return the Float response of `endpoint` with `params` through the
+    cache. Responses older than FLOAT_CACHE_TTL are still returned while
+    they are refreshed in the background, and if refreshing fails, so only
+    lookups that were never cached wait on Float. Returns None if there is
+    no cached response and Float cannot be reached."""
+    cached = cache.get(float_cache_key(endpoint, params))
+    if cached is None:
+        count_float_cache('miss')
+        return fetch_float_data(endpoint, params)
+
+    fetched, r = cached
+    if time.time() - fetched < base.FLOAT_CACHE_TTL:
+        count_float_cache('hit')
+    else:
+        count_float_cache('stale')
+        refresh_float_data(endpoint, params)
+    return r
+
 def flatten(nested_list):
     flat_list = []
     for sublist in nested_list:
@@ -1,6 +1,8 @@
 import datetime
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.test.client import Client
@@ -8,8 +10,8 @@ from django.test.client import Client
 from django_webtest import WebTest
 
 
-from ..views import get_fy_first_day, get_dates
-from ..utils import get_fy_first_day, get_dates, calculate_utilization
+from ..views import get_fy_first_day
+from ..utils import get_fy_first_day, calculate_utilization
 from hours.models import ReportingPeriod, Timecard, TimecardObject
 from projects.models import Project, AccountingCode, Agency
 from employees.models import UserData
@@ -30,13 +32,6 @@ class TestUtils(TestCase):
         date = datetime.date(2014, 7, 4)
         self.assertEqual(get_fy_first_day(date), datetime.date(2013, 10, 1))
 
-    def test_get_dates(self):
-        periods = ReportingPeriod.objects.count() -1
-        result = get_dates(periods)
-        self.assertEqual(len(result), 5)
-        self.assertTrue(result[1] <= result[2])
-        self.assertFalse(result[2] == result[3])
-
 class TestGroupUtilizationView(WebTest):
     fixtures = [
         'projects/fixtures/projects.json',
@@ -113,11 +108,13 @@ class TestGroupUtilizationView(WebTest):
         self.assertContains(response, 'regular.user')
         self.assertContains(response, 'aaron.snow')
         self.assertTrue(response.context['through_date'])
-        self.assertTrue(response.context['recent_start_date'])
+        self.assertEqual(
+            [window.key for window in response.context['windows']],
+            ['1', '4', 'fytd']
+        )
         self.assertEqual(len(response.context['user_list']), 2)
-        self.assertTrue(response.context['user_list'][0].__dict__['last'])
-        self.assertTrue(response.context['user_list'][0].__dict__['fytd'])
-        self.assertTrue(response.context['user_list'][0].__dict__['recent'])
+        for figures in response.context['user_list'][0].utilization:
+            self.assertTrue(figures['utilization'])
         self.assertTrue(
             response.context['user_list'][0].__dict__['_user_data_cache']
         )
@@ -131,7 +128,7 @@ class TestGroupUtilizationView(WebTest):
             headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
         )
         self.assertEqual(
-            response.context['unit_totals'][0]['recent']['total_hours'],
+            response.context['unit_totals'][0]['utilization'][1]['all_hours'],
             (self.b_timecard_object.hours_spent + \
             self.nb_timecard_object.hours_spent)
         )
@@ -146,3 +143,153 @@ class TestGroupUtilizationView(WebTest):
             self.b_timecard_object.hours_spent + \
             self.nb_timecard_object.hours_spent)
         )
+
+    def test_unit_totals_follow_current_unit(self):
+        # Move the staffer after their hours were rolled up.
+        self.user_data.unit = 1
+        self.user_data.save()
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationView'),
+            headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+        )
+        unit_totals = {
+            unit['unit']: unit['utilization'][0]['all_hours']
+            for unit in response.context['unit_totals']
+        }
+        self.assertIsNone(unit_totals[0])
+        self.assertEqual(unit_totals[1], 40)
+
+    def test_staffer_hours(self):
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationView'),
+            headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+        )
+        staffer = [
+            user for user in response.context['user_list']
+            if user.username == 'regular.user'
+        ][0]
+        last, recent, fytd = staffer.utilization
+        self.assertEqual(last['all_hours'], 40)
+        self.assertEqual(last['billable_hours'], 40)
+        self.assertEqual(last['utilization'], '100%')
+        self.assertEqual(recent['all_hours'], 40)
+        self.assertIsNone(fytd['all_hours'])
+        self.assertIsNone(fytd['billable_hours'])
+
+    def test_period_in_progress(self):
+        """Hours of a reporting period still in progress count towards the
+        longer windows, but not towards the last week."""
+        today = datetime.date.today()
+        timecard = Timecard.objects.create(
+            reporting_period=ReportingPeriod.objects.create(
+                start_date=today - datetime.timedelta(days=1),
+                end_date=today + datetime.timedelta(days=5)
+            ),
+            user=self.user,
+            submitted=True
+        )
+        TimecardObject.objects.create(
+            timecard=timecard,
+            project=Project.objects.first(),
+            hours_spent=8,
+            submitted=True
+        )
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationView'),
+            headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+        )
+        staffer = [
+            user for user in response.context['user_list']
+            if user.username == 'regular.user'
+        ][0]
+        last, recent, fytd = staffer.utilization
+        self.assertEqual(last['all_hours'], 40)
+        self.assertEqual(recent['all_hours'], 48)
+        self.assertEqual(fytd['all_hours'], 8)
+
+    def test_windows(self):
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationView'),
+            params={'windows': '13, fytd,1'},
+            headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+        )
+        windows = response.context['windows']
+        self.assertEqual([window.key for window in windows], ['13', 'fytd', '1'])
+        self.assertEqual(windows[0].label, 'Last 13 Weeks')
+        # Only one reporting period is available.
+        self.assertEqual(windows[0].start_date, self.reporting_period.start_date)
+        self.assertContains(response, 'Last 13 Weeks')
+
+    def test_invalid_windows(self):
+        for windows in ('', '0', '4,week', '-1'):
+            response = self.app.get(
+                url=reverse('utilization:GroupUtilizationView'),
+                params={'windows': windows},
+                headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'},
+                expect_errors=True
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_json(self):
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationJSONView'),
+            params={'windows': '1,fytd'},
+            headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+        )
+        self.assertEqual(
+            [window['key'] for window in response.json['windows']],
+            ['1', 'fytd']
+        )
+        staffer = [
+            user for user in response.json['staff']
+            if user['username'] == 'regular.user'
+        ][0]
+        self.assertEqual(staffer['unit'], 0)
+        self.assertEqual(staffer['utilization']['1'], {
+            'billable_hours': 40.0,
+            'all_hours': 40.0,
+            'utilization': '100%',
+        })
+        self.assertEqual(
+            response.json['units'][0]['utilization']['1']['all_hours'],
+            40.0
+        )
+
+    def test_json_requires_staff(self):
+        response = self.app.get(
+            url=reverse('utilization:GroupUtilizationJSONView'),
+            headers={'X_AUTH_USER': 'regular.user@gsa.gov'},
+            expect_errors=True
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_utilization_queries(self):
+        """The page's query count grows with neither the number of staff
+        nor the number of windows."""
+        def count_queries(windows='1,4,fytd'):
+            with CaptureQueriesContext(connection) as queries:
+                self.app.get(
+                    url=reverse('utilization:GroupUtilizationView'),
+                    params={'windows': windows},
+                    headers={'X_AUTH_USER': 'aaron.snow@gsa.gov'}
+                )
+            return len(queries)
+
+        count_queries()
+        baseline = count_queries()
+        self.assertEqual(count_queries('1,2,4,8,13,26,fytd'), baseline)
+        for i in range(5):
+            user = User.objects.create(username='staffer.{}'.format(i))
+            UserData.objects.create(user=user, unit=i)
+            timecard = Timecard.objects.create(
+                reporting_period=self.reporting_period,
+                user=user,
+                submitted=True
+            )
+            TimecardObject.objects.create(
+                timecard=timecard,
+                project=Project.objects.first(),
+                hours_spent=40,
+                submitted=True
+            )
+        self.assertEqual(count_queries(), baseline)
@@ -7,4 +7,9 @@ urlpatterns = [
         regex=r'^$',
         view=views.GroupUtilizationView.as_view(),
         name='GroupUtilizationView'
+    ),
+    url(
+        regex=r'^json/$',
+        view=views.GroupUtilizationJSONView.as_view(),
+        name='GroupUtilizationJSONView'
     )]
\ No newline at end of file
@@ -1,6 +1,7 @@
+import collections
 import datetime
 
-from hours.models import ReportingPeriod
+from hours.models import ReportingPeriod, ReportingPeriodHours
 
 """Functions to get date and reporting period info. Currently used for the
 GroupUtilizationView. Could be used for other views, including individual
@@ -14,31 +15,6 @@ def get_fy_first_day(date):
     fy_first_day = datetime.date(year, 10, 1)
     return fy_first_day
 
-def get_dates(periods):
-    today = datetime.date.today()
-    fy_first_day = get_fy_first_day(today)
-
-    # Grab last n reporting periods with an end date that is less than today.
-    reportingperiods = ReportingPeriod.objects.filter(
-        end_date__lt=today).order_by('-start_date')[:periods]
-
-    # Grab end date of last reporting period.
-    reportingperiods_end_date = reportingperiods[0].end_date
-
-    # Grab start date of first reporting period.
-    reportingperiods_start_date = reportingperiods[periods - 1].start_date
-
-    # Set the earliest date from which TimecardObjects need to be queried.
-    if reportingperiods_start_date <= fy_first_day:
-        earliest_date = reportingperiods_start_date
-    else:
-        earliest_date = fy_first_day
-
-    latest_start_date = reportingperiods[0].start_date
-
-    return reportingperiods_end_date, reportingperiods_start_date, \
-        fy_first_day, earliest_date, latest_start_date
-
 """Calculates utilization as hours billed divided by hours worked."""
 def calculate_utilization(billable_hours, all_hours):
     if all_hours is (None or 0):
@@ -48,3 +24,104 @@ def calculate_utilization(billable_hours, all_hours):
             return '0.00%'
         else:
             return '{:.3}%'.format((billable_hours / all_hours * 100))
+
+
+"""Functions to sum the hours behind utilization figures. Every figure of
+the GroupUtilizationView comes from one query of the reporting period
+rollup (see hours.rollups), which is summed into all of the requested
+windows in a single pass here."""
+
+DEFAULT_WINDOWS = '1,4,fytd'
+
+"""A window of reporting periods utilization is reported for: `key` is how
+it is requested ('fytd', or a number of reporting periods) and it covers
+the reporting periods that start from `start_date` through `end_date`, or
+with no upper bound when `end_date` is None.
+'Last Week' covers only the last reporting period that has ended; longer
+windows also count a reporting period still in progress."""
+Window = collections.namedtuple(
+    'Window', ['key', 'label', 'start_date', 'end_date'])
+
+def parse_windows(value):
+    """Parses a comma-separated list of windows, such as '1,4,13,fytd',
+    into a list of keys. Raises ValueError on anything else."""
+    keys = []
+    for key in value.split(','):
+        key = key.strip().lower()
+        if key != 'fytd' and not (key.isdigit() and int(key) > 0):
+            raise ValueError('Invalid utilization window: "{}".'.format(key))
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+def get_windows(keys):
+    """Returns the last reporting period that has ended and the windows
+    named by keys, looking up the reporting periods in one query."""
+    today = datetime.date.today()
+    periods = max([int(key) for key in keys if key != 'fytd'] or [1])
+    reportingperiods = ReportingPeriod.objects.filter(
+        end_date__lt=today).order_by('-start_date')[:periods]
+    # When fewer reporting periods are available, windows start at the
+    # earliest one.
+    start_dates = [reportingperiod.start_date
+                   for reportingperiod in reportingperiods]
+
+    windows = []
+    for key in keys:
+        if key == 'fytd':
+            windows.append(Window(
+                key, 'Fiscal Year to Date', get_fy_first_day(today), None))
+        elif key == '1':
+            windows.append(Window(key, 'Last Week', start_dates[0],
+                                  start_dates[0]))
+        else:
+            periods = int(key)
+            windows.append(Window(
+                key, 'Last {} Weeks'.format(periods),
+                start_dates[min(periods, len(start_dates)) - 1], None))
+    return reportingperiods[0], windows
+
+def get_submitted_hours(windows):
+    """Reads submitted hours by user, unit and reporting period, over all of
+    the windows, from the reporting period rollup in one query. Returns a
+    list of (user_id, unit, start_date, billable_hours, all_hours)
+    tuples, where unit is the user's current unit, as in the staff rows,
+    rather than the one the rollup recorded."""
+    return list(ReportingPeriodHours.objects.filter(
+        reporting_period__start_date__gte=min(
+            window.start_date for window in windows)
+    ).values_list(
+        'user_id',
+        'user__user_data__unit',
+        'reporting_period__start_date',
+        'billable_hours',
+        'total_hours',
+    ))
+
+def add_hours(total, hours):
+    """Adds hours the way SQL's SUM() does, ignoring None."""
+    if hours is None:
+        return total
+    if total is None:
+        return hours
+    return total + hours
+
+def sum_windows(rows, windows, index):
+    """Sums the rows returned by get_submitted_hours() by the given column
+    and window, in a single pass. Returns a {value: {key: (billable_hours,
+    all_hours)}} dict, where either is None when there is nothing to sum,
+    as with an aggregate over an empty queryset."""
+    totals = collections.defaultdict(
+        lambda: {window.key: (None, None) for window in windows})
+    for row in rows:
+        _, _, start_date, billable, total = row
+        group = totals[row[index]]
+        for window in windows:
+            if start_date >= window.start_date and (
+                    window.end_date is None or start_date <= window.end_date):
+                billable_hours, all_hours = group[window.key]
+                group[window.key] = (
+                    add_hours(billable_hours, billable),
+                    add_hours(all_hours, total)
+                )
+    return totals
@@ -1,33 +1,65 @@
 import datetime
 
-from django.db.models import Sum, Prefetch
-from django.views.generic import ListView
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.generic import ListView, View
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 
+from rest_framework.permissions import IsAdminUser
+
 from hours.models import Timecard, TimecardObject, ReportingPeriod
 from employees.models import UserData
+from tock.utils import PermissionMixin
+
+from .utils import get_fy_first_day, calculate_utilization, \
+    DEFAULT_WINDOWS, parse_windows, get_windows, get_submitted_hours, \
+    sum_windows
+
+class GroupUtilizationMixin(object):
+    """Computes utilization by staffer and by unit for the windows named in
+    the `windows` parameter (see utilization.utils.parse_windows), from one
+    query however many windows are requested."""
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.window_keys = parse_windows(
+                request.GET.get('windows', DEFAULT_WINDOWS))
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e), content_type='text/plain')
+        return super(GroupUtilizationMixin, self).dispatch(
+            request, *args, **kwargs)
+
+    def get_windows(self):
+        if not hasattr(self, 'windows'):
+            self.last_period, self.windows = get_windows(self.window_keys)
+        return self.windows
+
+    def get_hours(self):
+        if not hasattr(self, 'hours'):
+            windows = self.get_windows()
+            self.hours = get_submitted_hours(windows)
+        return self.hours
+
+    def get_utilization(self, totals):
+        """Lists the figures of each window, given the totals of one staffer
+        or unit from sum_windows()."""
+        utilization = []
+        for window in self.get_windows():
+            billable_hours, all_hours = totals[window.key]
+            utilization.append({
+                'window': window,
+                'billable_hours': billable_hours,
+                'all_hours': all_hours,
+                'utilization': calculate_utilization(
+                    billable_hours,
+                    all_hours
+                )
+            })
+        return utilization
 
-from .utils import get_fy_first_day, get_dates, calculate_utilization
-
-class GroupUtilizationView(ListView):
-    template_name = 'utilization/group_utilization.html'
-
-    def get_queryset(self):
-        """Gets submitted timecards limited to the reporting periods in
-        question."""
-
-        """Although recent_rps is set to last four reporting periods, could
-        accept a form response that allows the user or app to dynamically
-        customize number of periods to include in the queryset."""
-
-        available_periods = ReportingPeriod.objects.count()
-        requested_periods = 4
-
-        if available_periods >= requested_periods:
-            recent_rps = get_dates(requested_periods)
-        else:
-            recent_rps = get_dates(available_periods)
+    def get_staff(self):
+        """Gets billable staff and their utilization over each window."""
+        totals = sum_windows(self.get_hours(), self.get_windows(), 0)
 
         billable_staff = User.objects.filter(
             user_data__is_billable=True,
@@ -36,237 +68,95 @@ class GroupUtilizationView(ListView):
 
         for staffer in billable_staff:
             staffer.unit = staffer.user_data.unit
-
-            """Create smallest possible TimecardObject queryset based on the
-            earliest_date value returned by get_dates(). Also prefetches the
-            related user and accounting code for later use."""
-            max_tos = TimecardObject.objects.filter(
-                timecard__user=staffer,
-                submitted=True,
-                timecard__reporting_period__start_date__gte=recent_rps[3]
-            ).prefetch_related(
-                'timecard__user',
-                'project__accounting_code'
-            )
-
-            """Filters the max_tos queryset to only look for TimecardObjects
-            that are related to reporting periods within the current fiscal
-            year. This operation is unnecessary except at the beginning of the
-            fiscal year."""
-            fytd_tos = max_tos.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[2])
-
-            """Calcuates the billable hours decimal value in the queryset."""
-            fytd_billable_hours = fytd_tos.filter(
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-            """Calcuates the all hours decimal value in the queryset."""
-            fytd_all_hours = fytd_tos.aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-            """Filters the fytd_tos queryset to only look for TimecardObjects
-            that are related to reporting periods within the last n reporting
-            periods, where n is the argument passed to the get_dates()
-            function."""
-
-            recent_tos = max_tos.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[1]
-            )
-
-            """Calcuates the billable hours decimal value in the queryset."""
-            recent_billable_hours = recent_tos.filter(
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-            """Calcuates the all hours decimal value in the queryset."""
-            recent_all_hours = recent_tos.aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-            """Filters the recent_tos queryset to only look for TimecardObjects
-            that are related to reporting periods within the last 1 reporting
-            period.
-            """
-            last_tos = recent_tos.filter(
-                timecard__reporting_period__end_date=recent_rps[0]
-            )
-
-            """Calcuates the billable hours decimal value in the queryset."""
-            last_billable_hours = last_tos.filter(
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-            """Calcuates the all hours decimal value in the queryset."""
-            last_all_hours = last_tos.aggregate(
-                Sum('hours_spent'
-                )
-            )
-
-
-            staffer.fytd = calculate_utilization(
-                fytd_billable_hours['hours_spent__sum'],
-                fytd_all_hours['hours_spent__sum']
-            )
-            staffer.fytd_all_hours_total = fytd_all_hours['hours_spent__sum']
-            if fytd_billable_hours['hours_spent__sum']:
-                staffer.fytd_billable_hours_total = fytd_billable_hours['hours_spent__sum']
-            else:
-                staffer.fytd_billable_hours_total = 0.0
-
-            staffer.recent = calculate_utilization(
-                recent_billable_hours['hours_spent__sum'],
-                recent_all_hours['hours_spent__sum']
-            )
-            staffer.recent_all_hours_total = recent_all_hours['hours_spent__sum']
-            if recent_billable_hours['hours_spent__sum']:
-                staffer.recent_billable_hours_total = recent_billable_hours['hours_spent__sum']
-            else:
-                staffer.recent_billable_hours_total = 0.0
-
-
-            staffer.last = calculate_utilization(
-                last_billable_hours['hours_spent__sum'],
-                last_all_hours['hours_spent__sum']
-            )
-            staffer.last_all_hours_total = last_all_hours['hours_spent__sum']
-            if last_billable_hours['hours_spent__sum']:
-                staffer.last_billable_hours_total = last_billable_hours['hours_spent__sum']
-            else:
-                staffer.last_billable_hours_total = 0.0
+            staffer.utilization = self.get_utilization(totals[staffer.id])
 
             staffer.last_url = reverse(
                 'reports:ReportingPeriodUserDetailView',
                 kwargs={
                         'username':staffer,
-                        'reporting_period': recent_rps[4]
+                        'reporting_period': self.last_period.start_date
                 }
             )
 
         return billable_staff
 
-    def get_context_data(self, **kwargs):
-        context = super(GroupUtilizationView, self).get_context_data(**kwargs)
+    def get_unit_totals(self):
+        """Gets the utilization of each unit over each window."""
+        totals = sum_windows(self.get_hours(), self.get_windows(), 1)
+        return [
+            {
+                'unit': unit,
+                'unit_name': unit_name,
+                'utilization': self.get_utilization(totals[unit])
+            }
+            for unit, unit_name in UserData.UNIT_CHOICES
+        ]
 
-        available_periods = ReportingPeriod.objects.count()
-        requested_periods = 4
 
-        if available_periods >= requested_periods:
-            recent_rps = get_dates(requested_periods)
-        else:
-            recent_rps = get_dates(available_periods)
+class GroupUtilizationView(GroupUtilizationMixin, ListView):
+    template_name = 'utilization/group_utilization.html'
 
-        units = UserData.UNIT_CHOICES
-        unit_totals = []
-        for unit in units:
-            # Query and calculate most recent RP hours.
-            last_total_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date=recent_rps[4],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
-            last_billable_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date=recent_rps[4],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
-            # Query and calculate last n RP hours.
-            recent_total_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[1],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
-            recent_billable_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[1],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
-            # Query and calculate all RP hours for FY to date.
-            fytd_total_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[2],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
-            fytd_billable_hours = TimecardObject.objects.filter(
-                timecard__reporting_period__start_date__gte=recent_rps[2],
-                submitted=True,
-                timecard__user__user_data__unit=unit[0],
-                project__accounting_code__billable=True
-            ).aggregate(
-                Sum('hours_spent'
-                )
-            )['hours_spent__sum']
+    def get_queryset(self):
+        return self.get_staff()
+
+    def get_context_data(self, **kwargs):
+        context = super(GroupUtilizationView, self).get_context_data(**kwargs)
+
+        unit_totals = self.get_unit_totals()
+        for unit in unit_totals:
+            unit['staff'] = [
+                staffer for staffer in context['object_list']
+                if staffer.unit == unit['unit']
+            ]
 
-            unit_totals.append(
-                {'last':
-                    {
-                        'unit_name': unit[1],
-                        'billable_hours': last_billable_hours,
-                        'total_hours': last_total_hours,
-                        'utilization': calculate_utilization(
-                            last_billable_hours,
-                            last_total_hours
-                        )
-                    }
-                ,
-                'recent':
-                    {
-                        'unit_name': unit[1],
-                        'billable_hours': recent_billable_hours,
-                        'total_hours': recent_total_hours,
-                        'utilization': calculate_utilization(
-                            recent_billable_hours,
-                            recent_total_hours
-                        )
-                    },
-                'fytd':
-                    {
-                        'unit_name': unit[1],
-                        'billable_hours': fytd_billable_hours,
-                        'total_hours': fytd_total_hours,
-                        'utilization': calculate_utilization(
-                            fytd_billable_hours,
-                            fytd_total_hours
-                        )
-                    }
-                }
-            )
         context.update(
             {
                 'unit_choices': UserData.UNIT_CHOICES,
-                'through_date': recent_rps[0],
-                'recent_start_date': recent_rps[1],
+                'through_date': self.last_period.end_date,
+                'windows': self.get_windows(),
                 'unit_totals':unit_totals
             }
         )
 
         return context
+
+
+class GroupUtilizationJSONView(PermissionMixin, GroupUtilizationMixin, View):
+    """The figures of the GroupUtilizationView, as JSON."""
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request, *args, **kwargs):
+        def hours(value):
+            return None if value is None else float(value)
+
+        def serialize(utilization):
+            return {
+                figures['window'].key: {
+                    'billable_hours': hours(figures['billable_hours']),
+                    'all_hours': hours(figures['all_hours']),
+                    'utilization': figures['utilization'],
+                }
+                for figures in utilization
+            }
+
+        windows = self.get_windows()
+        return JsonResponse({
+            'through_date': self.last_period.end_date,
+            'windows': [window._asdict() for window in windows],
+            'staff': [
+                {
+                    'username': staffer.username,
+                    'unit': staffer.unit,
+                    'utilization': serialize(staffer.utilization),
+                }
+                for staffer in self.get_staff()
+            ],
+            'units': [
+                {
+                    'unit': unit['unit'],
+                    'unit_name': unit['unit_name'],
+                    'utilization': serialize(unit['utilization']),
+                }
+                for unit in self.get_unit_totals()
+            ],
+        })